@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RepositoryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "repository"
+
+    def ready(self):
+        # connect the receivers invalidating the cached filter choices
+        from repository import filters  # noqa: F401
@@ -0,0 +1,170 @@
+"""
+Set-based lookup and insert helpers.
+
+The importers and API endpoints resolve whole columns of natural keys at once
+instead of issuing one query per value. All helpers split large key sets into
+chunks to stay below the bind-parameter limits of SQLite and PostgreSQL.
+"""
+
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Type
+
+from django.db import models
+from django.dispatch import Signal
+
+# SQLite limits the number of bind parameters per statement (999 on older
+# versions), keep IN lists comfortably below that.
+IN_QUERY_CHUNK_SIZE = 900
+
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Sent with the model as sender after rows were inserted with `bulk_create`,
+# which sends no `post_save`, e.g. to invalidate cached vocabularies.
+bulk_created = Signal()
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Split an iterable into lists of at most `size` elements.
+
+    Args:
+        iterable: The iterable to split.
+        size: Maximum number of elements per chunk.
+
+    Yields:
+        list: The next chunk of elements.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def unique_values(values: Iterable) -> List:
+    """Return the distinct, non-empty values in order of first appearance."""
+    return list(dict.fromkeys(value for value in values if value not in (None, "")))
+
+
+def filter_in_chunks(
+    queryset: models.QuerySet,
+    field: str,
+    values: Iterable,
+    chunk_size: int = IN_QUERY_CHUNK_SIZE,
+) -> Iterator[Any]:
+    """
+    Yield the results of `queryset.filter(<field>__in=values)` chunk by chunk.
+
+    Args:
+        queryset: The queryset to filter, may already be restricted by
+            `values()`, `only()` or `select_related()`.
+        field: The field name used in the IN lookup.
+        values: The values to look up.
+        chunk_size: Maximum number of values per query.
+
+    Yields:
+        The matching rows or model instances.
+    """
+    for chunk in chunked(unique_values(values), chunk_size):
+        yield from queryset.filter(**{f"{field}__in": chunk})
+
+
+def lookup_map(
+    model: Type[models.Model],
+    field: str,
+    values: Iterable,
+    queryset: Optional[models.QuerySet] = None,
+) -> Dict[Any, models.Model]:
+    """
+    Map each value to the model instance whose `field` equals it.
+
+    Args:
+        model: The model to query.
+        field: The (unique) lookup field.
+        values: The values to resolve.
+        queryset: Optional base queryset, defaults to all objects of `model`.
+
+    Returns:
+        dict: Value to instance mapping, values without a match are missing.
+    """
+    if queryset is None:
+        queryset = model.objects.all()
+    return {
+        getattr(obj, field): obj for obj in filter_in_chunks(queryset, field, values)
+    }
+
+
+def get_or_create_map(
+    model: Type[models.Model],
+    field: str,
+    values: Iterable,
+    defaults: Optional[Dict[str, Any]] = None,
+) -> Dict[Any, models.Model]:
+    """
+    Set-based counterpart of `get_or_create` for a single lookup field.
+
+    Existing objects are fetched in chunked IN queries, all missing ones are
+    inserted with a single `bulk_create` and fetched again so that their
+    primary keys are available on every database backend.
+
+    Args:
+        model: The model to query.
+        field: The (unique) lookup field.
+        values: The values to resolve or create.
+        defaults: Additional field values for newly created objects.
+
+    Returns:
+        dict: Value to instance mapping covering all non-empty values.
+    """
+    values = unique_values(values)
+    objects = lookup_map(model, field, values)
+    missing = [value for value in values if value not in objects]
+    if missing:
+        model.objects.bulk_create(
+            [model(**{field: value}, **(defaults or {})) for value in missing],
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+        bulk_created.send(sender=model)
+        objects.update(lookup_map(model, field, missing))
+    return objects
+
+
+def bulk_link(
+    relation,
+    pairs: Iterable,
+    replace: bool = False,
+    batch_size: int = BULK_CREATE_BATCH_SIZE,
+    sources: Optional[Iterable] = None,
+) -> int:
+    """
+    Insert the through-rows of a many-to-many relation in bulk.
+
+    Args:
+        relation: The many-to-many descriptor, e.g. `SamplingEvent.ringer_name`.
+        pairs: Iterable of (source pk, target pk) tuples.
+        replace: Delete the existing links of all source objects in `pairs`
+            first, i.e. the set-based counterpart of `RelatedManager.set()`.
+        batch_size: Number of rows per INSERT statement.
+        sources: Source pks whose links are replaced, defaults to the sources
+            in `pairs`. Pass it to also clear the links of sources without
+            any new targets.
+
+    Returns:
+        int: Number of distinct links passed for insertion.
+    """
+    through = relation.through
+    source = f"{relation.field.m2m_field_name()}_id"
+    target = f"{relation.field.m2m_reverse_field_name()}_id"
+    pairs = list(dict.fromkeys(pairs))
+    if replace:
+        if sources is None:
+            sources = (s for s, _ in pairs)
+        for chunk in chunked(unique_values(sources), IN_QUERY_CHUNK_SIZE):
+            through.objects.filter(**{f"{source}__in": chunk}).delete()
+    through.objects.bulk_create(
+        [through(**{source: s, target: t}) for s, t in pairs],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    return len(pairs)
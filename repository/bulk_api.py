@@ -0,0 +1,334 @@
+"""
+Bulk create and upsert endpoints of the REST API.
+
+POSTing a JSON list instead of an object to the list endpoint of a ViewSet
+with `BulkCreateMixin` registers the whole batch in one request:
+
+1. Every item is validated by a `BulkWriteSerializer`, which checks the field
+   values without querying the database.
+2. The foreign keys of all items are looked up with one chunked IN query per
+   relation, the natural keys (e.g. `File.checksum` and `File.filepath`)
+   with one per key.
+3. New objects are inserted with `bulk_create`, changed ones written with
+   `bulk_update`, all in one transaction.
+
+With `?upsert=true`, items whose natural keys match an existing object update
+it instead of failing, so a delivery can be registered again safely. The
+response holds one status per item, in request order: "created", "updated",
+"unchanged" or "error" with the errors of the item.
+
+`ResolveView` answers the reverse question for a batch of keys of one kind,
+e.g. which of 50k checksums are already registered, with chunked IN queries
+on the indexed key column.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Type
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import models, transaction
+from rest_framework import status
+from rest_framework.exceptions import ParseError, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from repository.bulk import BULK_CREATE_BATCH_SIZE, filter_in_chunks, unique_values
+from repository.models import Experiment, File, SamplingEvent
+
+BULK_STATUSES = ["created", "updated", "unchanged", "error"]
+
+
+class BulkWriter:
+    """
+    Validate and write a batch of objects of one model.
+
+    Args:
+        serializer_class: A `BulkWriteSerializer` for one item.
+        natural_keys: Unique fields identifying an existing object on upsert.
+        upsert: Update the objects matching a natural key instead of failing.
+        batch_size: Number of rows per INSERT and UPDATE statement.
+    """
+
+    def __init__(
+        self,
+        serializer_class,
+        natural_keys: Sequence[str] = (),
+        upsert: bool = False,
+        batch_size: int = BULK_CREATE_BATCH_SIZE,
+    ):
+        self.serializer_class = serializer_class
+        self.model: Type[models.Model] = serializer_class.Meta.model
+        self.natural_keys = list(natural_keys)
+        self.upsert = upsert
+        self.batch_size = batch_size
+
+    def run(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Write a batch.
+
+        Args:
+            items: The items of the request body.
+
+        Returns:
+            list: The status of each item, with the pk of written objects.
+        """
+        results: List[Dict[str, Any]] = [{} for _ in items]
+        values: Dict[int, Dict[str, Any]] = {}
+        for i, item in enumerate(items):
+            serializer = self.serializer_class(data=item)
+            if serializer.is_valid():
+                values[i] = serializer.validated_data
+            else:
+                results[i] = {"status": "error", "errors": serializer.errors}
+
+        self.check_relations(values, results)
+        existing = self.match_natural_keys(values, results)
+
+        created, updated = [], []
+        for i, data in values.items():
+            if i in existing:
+                obj = existing[i]
+                changed = [
+                    name for name, value in data.items() if getattr(obj, name) != value
+                ]
+                for name in changed:
+                    setattr(obj, name, data[name])
+                if changed:
+                    updated.append(obj)
+                results[i] = {
+                    "status": "updated" if changed else "unchanged",
+                    "id": obj.pk,
+                }
+            else:
+                # the ShortUUID primary keys are assigned on instantiation
+                obj = self.model(**data)
+                created.append(obj)
+                results[i] = {"status": "created", "id": obj.pk}
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(created, batch_size=self.batch_size)
+            if updated:
+                self.model.objects.bulk_update(
+                    updated,
+                    list(self.serializer_class.Meta.fields),
+                    batch_size=self.batch_size,
+                )
+        return results
+
+    @staticmethod
+    def fail(results: List[Dict], i: int, field: str, message: str):
+        results[i] = {"status": "error", "errors": {field: [message]}}
+
+    def check_relations(self, values: Dict[int, Dict], results: List[Dict]):
+        """Look up the foreign keys of all items, one query per relation"""
+        for field in self.model._meta.concrete_fields:
+            if (
+                not field.is_relation
+                or field.name not in self.serializer_class.Meta.fields
+            ):
+                continue
+            keys = unique_values(data.get(field.name) for data in values.values())
+            found = set(
+                filter_in_chunks(
+                    field.related_model.objects.values_list("pk", flat=True), "pk", keys
+                )
+            )
+            for i, data in list(values.items()):
+                if field.name not in data:
+                    continue
+                # compared and written as column values, not objects
+                key = data[field.attname] = data.pop(field.name)
+                if key is not None and key not in found:
+                    del values[i]
+                    self.fail(
+                        results,
+                        i,
+                        field.name,
+                        f'Invalid pk "{key}" - object does not exist.',
+                    )
+
+    def match_natural_keys(
+        self, values: Dict[int, Dict], results: List[Dict]
+    ) -> Dict[int, models.Model]:
+        """
+        Find the existing objects of the items by their natural keys.
+
+        Items repeating a key of an earlier item fail. Without upsert, items
+        matching an existing object fail as well. With upsert, all keys of an
+        item that match have to match the same object.
+
+        Returns:
+            dict: Item index to the existing object it updates.
+        """
+        existing = {}
+        for key in self.natural_keys:
+            seen = set()
+            for i, data in list(values.items()):
+                if data[key] in seen:
+                    del values[i]
+                    self.fail(results, i, key, f"Duplicate {key} in this batch.")
+                seen.add(data[key])
+            existing[key] = {
+                getattr(obj, key): obj
+                for obj in filter_in_chunks(self.model.objects.all(), key, seen)
+            }
+
+        name = self.model._meta.verbose_name
+        matches = {}
+        for i, data in list(values.items()):
+            found = {
+                key: existing[key][data[key]]
+                for key in self.natural_keys
+                if data[key] in existing[key]
+            }
+            if not found:
+                continue
+            key, obj = next(iter(found.items()))
+            if not self.upsert:
+                self.fail(results, i, key, f"{name} with this {key} already exists.")
+            elif len({match.pk for match in found.values()}) > 1:
+                self.fail(
+                    results, i, key, f"The {', '.join(found)} match different {name}s."
+                )
+            else:
+                matches[i] = obj
+                continue
+            del values[i]
+        return matches
+
+
+class BulkCreateMixin:
+    """
+    Accept a list of objects on POST to the list endpoint of a ViewSet.
+
+    Set `bulk_serializer_class` to the `BulkWriteSerializer` of the model and
+    `natural_keys` to the unique fields that `?upsert=true` matches on.
+    """
+
+    bulk_serializer_class = None
+    natural_keys: Sequence[str] = ()
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        upsert = request.query_params.get("upsert", "").lower() in ("1", "true")
+        if upsert:
+            if not self.natural_keys:
+                raise ParseError("This endpoint does not support upserts.")
+            opts = self.bulk_serializer_class.Meta.model._meta
+            if not request.user.has_perm(f"{opts.app_label}.change_{opts.model_name}"):
+                raise PermissionDenied()
+
+        results = BulkWriter(
+            self.bulk_serializer_class, self.natural_keys, upsert=upsert
+        ).run(request.data)
+        counts = dict.fromkeys(BULK_STATUSES, 0)
+        for result in results:
+            counts[result["status"]] += 1
+        if not counts["error"]:
+            response_status = status.HTTP_201_CREATED
+        elif counts["error"] < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({**counts, "results": results}, status=response_status)
+
+
+class Resolver(NamedTuple):
+    """
+    How to resolve the keys of one kind.
+
+    Args:
+        rows: Returns the (key, owner id) rows to filter.
+        field: The key column of `rows`, used in the IN lookup.
+        many: Whether a key can belong to several owners.
+    """
+
+    rows: Callable[[], models.QuerySet]
+    field: str
+    many: bool = False
+
+
+RESOLVERS = {
+    "checksum": Resolver(
+        lambda: File.objects.values_list("checksum", "id"), "checksum"
+    ),
+    "filepath": Resolver(
+        lambda: File.objects.values_list("filepath", "id"), "filepath"
+    ),
+    # an accession can be shared by the experiments submitted together
+    "accession_no": Resolver(
+        lambda: Experiment.external_accession.through.objects.values_list(
+            "externalaccession__accession_no", "experiment_id"
+        ),
+        "externalaccession__accession_no",
+        many=True,
+    ),
+    # ring numbers are recorded per sampling event, i.e. once per capture
+    "ring_number": Resolver(
+        lambda: SamplingEvent.objects.values_list(
+            "ring_number", "individual_id"
+        ).distinct(),
+        "ring_number",
+        many=True,
+    ),
+}
+
+
+def resolve(kind: str, keys: Sequence[str]) -> Dict[str, Any]:
+    """
+    Map keys of one kind to the IDs of the objects owning them.
+
+    Args:
+        kind: One of `RESOLVERS`.
+        keys: The keys to look up.
+
+    Returns:
+        dict: Key to File, Experiment or Individual ID, or to the sorted list
+            of IDs for kinds with `many` owners. Unknown keys are missing.
+    """
+    resolver = RESOLVERS[kind]
+    found: Dict[str, Any] = {}
+    for key, owner in filter_in_chunks(resolver.rows(), resolver.field, keys):
+        if resolver.many:
+            found.setdefault(key, []).append(owner)
+        else:
+            found[key] = owner
+    if resolver.many:
+        for owners in found.values():
+            owners.sort()
+    return found
+
+
+class ResolveView(LoginRequiredMixin, APIView):
+    """
+    Resolve a batch of keys in one request.
+
+    POST `{"kind": "checksum", "keys": [...]}` with up to
+    `API_MAX_RESOLVE_KEYS` keys. The response maps each known key in `found`
+    and lists the unknown ones in `missing`, in request order.
+    """
+
+    # a lookup only reads, like GET on the list endpoints
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+            raise ParseError("Expected an object with kind and keys.")
+        kind = request.data.get("kind")
+        keys = request.data.get("keys")
+        if kind not in RESOLVERS:
+            raise ValidationError(
+                {"kind": [f"Expected one of {', '.join(RESOLVERS)}."]}
+            )
+        if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+            raise ValidationError({"keys": ["Expected a list of strings."]})
+        if len(keys) > settings.API_MAX_RESOLVE_KEYS:
+            raise ValidationError(
+                {"keys": [f"At most {settings.API_MAX_RESOLVE_KEYS} keys per request."]}
+            )
+
+        found = resolve(kind, keys)
+        missing = [key for key in unique_values(keys) if key not in found]
+        return Response({"kind": kind, "found": found, "missing": missing})
@@ -0,0 +1,361 @@
+"""
+Columnar Parquet export of the `repository` app for analytics.
+
+Every model, including the auto-created many-to-many through models, and the
+pre-joined sample sheet are written as partitioned Parquet datasets, one
+directory per table, that pandas, pyarrow and DuckDB read directly. Columns
+keep their types: decimals as `decimal128` with the precision and scale of the
+model field, dates as `date32`. Choice fields, the vocabulary labels of the
+sample sheet (organism, sex, country, colors, tissue, instrument) and its
+many-to-many label columns are dictionary-encoded.
+
+Tables are split into partitions of primary key (sample sheet: individual
+name) ranges. The ranges of the previous export are kept, so a repeated
+export only rewrites the partitions whose rows changed. Partition files are
+named after the digest of their rows, unchanged files are left alone and
+files of changed partitions are replaced. `manifest.json` records the ranges,
+row counts and files of all tables.
+
+pyarrow is an optional dependency, it is only needed to write and read the
+Parquet files: `pip install pyarrow`.
+"""
+
+import hashlib
+import json
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from django.db import models
+
+from repository.import_metrics import VOCABULARY_MODELS
+from repository.models import Individual
+from repository.sample_sheet import (
+    ITERATOR_CHUNK_SIZE,
+    SAMPLE_SHEET_COLUMNS,
+    SAMPLE_SHEET_M2M,
+    SAMPLE_SHEET_PATHS,
+    sample_sheet_rows,
+)
+from repository.snapshots import MANIFEST, SNAPSHOT_APP, snapshot_models
+from repository.sync import DIGEST_SIZE, row_digest
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARTITION_ROWS = 50000
+SAMPLE_SHEET_TABLE = "sample_sheet"
+PARQUET_COMPRESSION = "zstd"
+
+INTEGER_FIELDS = {
+    "AutoField",
+    "BigAutoField",
+    "SmallAutoField",
+    "IntegerField",
+    "BigIntegerField",
+    "SmallIntegerField",
+    "PositiveIntegerField",
+    "PositiveBigIntegerField",
+    "PositiveSmallIntegerField",
+}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "The columnar export requires pyarrow, install it with "
+            "`pip install pyarrow`."
+        )
+
+
+def resolve_path(model: Type[models.Model], path: str) -> models.Field:
+    """
+    Follow a `__` separated lookup path to the field it selects.
+
+    Args:
+        model: The model the path starts at.
+        path: The path, e.g. "sampling_event__sampling_country__name".
+
+    Returns:
+        Field: The field at the end of the path.
+    """
+    *relations, name = path.split("__")
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def is_vocabulary_path(model: Type[models.Model], path: str) -> bool:
+    """Whether a lookup path ends in a field of a vocabulary model"""
+    return resolve_path(model, path).model in VOCABULARY_MODELS
+
+
+def arrow_type(field: models.Field, dictionary: bool = False):
+    """
+    The Arrow type of the values of a model field.
+
+    Args:
+        field: The model field.
+        dictionary: Dictionary-encode string values, implied for choices.
+
+    Returns:
+        pa.DataType: The column type.
+    """
+    internal_type = field.get_internal_type()
+    if internal_type == "ForeignKey":
+        return arrow_type(field.target_field, dictionary)
+    if internal_type == "DecimalField":
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if internal_type == "DateField":
+        return pa.date32()
+    if internal_type == "DateTimeField":
+        return pa.timestamp("us", tz="UTC")
+    if internal_type == "BooleanField":
+        return pa.bool_()
+    if internal_type in INTEGER_FIELDS:
+        return pa.int64()
+    if dictionary or field.choices:
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def partition_rows(
+    rows: Iterable,
+    key: Callable[[Any], Any],
+    bounds: List[Any],
+    size: int = PARTITION_ROWS,
+) -> Iterator[Tuple[Any, List]]:
+    """
+    Split rows in key order into partitions of key ranges.
+
+    A partition holds the keys up to and including its bound, the last bound
+    is None and open-ended. Rows with equal keys always share a partition. The
+    open-ended partition is cut every `size` rows, partitions that grew to
+    twice that size are split.
+
+    Args:
+        rows: The rows, ordered by `key`.
+        key: Function returning the partition key of a row.
+        bounds: The bounds of the previous export, empty on the first one.
+        size: The target number of rows per partition.
+
+    Yields:
+        tuple: The bound and the rows of the next non-empty partition.
+    """
+    bounds = list(bounds)
+    if not bounds or bounds[-1] is not None:
+        bounds.append(None)
+    i, current = 0, []
+    for row in rows:
+        row_key = key(row)
+        while bounds[i] is not None and row_key > bounds[i]:
+            if current:
+                yield bounds[i], current
+            i, current = i + 1, []
+        limit = size if bounds[i] is None else 2 * size
+        if len(current) >= limit and row_key != key(current[-1]):
+            yield key(current[-1]), current
+            current = []
+        current.append(row)
+    if current:
+        yield bounds[i], current
+
+
+def partition_digest(columns: List[str], rows: List[Tuple]) -> str:
+    """Digest of the columns and row values of a partition"""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    digest.update(json.dumps(columns).encode())
+    for row in rows:
+        digest.update(row_digest(row))
+    return digest.hexdigest()
+
+
+class ColumnarExport:
+    """
+    Write the repository tables and the sample sheet as Parquet datasets.
+
+    Args:
+        directory: The export directory, kept between exports.
+        partition_size: Target number of rows per partition.
+        chunk_size: Rows fetched from the database cursor at once.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        partition_size: int = PARTITION_ROWS,
+        chunk_size: int = ITERATOR_CHUNK_SIZE,
+    ):
+        require_pyarrow()
+        self.directory = directory
+        self.partition_size = partition_size
+        self.chunk_size = chunk_size
+        self.manifest: Dict[str, Dict] = {}
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as fh:
+                self.manifest = json.load(fh)
+
+    def run(
+        self, app_label: str = SNAPSHOT_APP, sample_sheet: bool = True
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Export all models of an app and the sample sheet.
+
+        Returns:
+            dict: Per table, the number of rows and of written, unchanged
+            and removed partitions.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stats = {}
+        for model in snapshot_models(app_label):
+            stats[model._meta.label_lower] = self.export_model(model)
+        if sample_sheet:
+            stats[SAMPLE_SHEET_TABLE] = self.export_sample_sheet()
+        with open(os.path.join(self.directory, MANIFEST), "w") as fh:
+            json.dump(self.manifest, fh, indent=2)
+        return stats
+
+    def export_model(self, model: Type[models.Model]) -> Dict[str, int]:
+        """Export the rows of a model in pk order"""
+        fields = model._meta.concrete_fields
+        columns = [field.attname for field in fields]
+        rows = (
+            model._base_manager.order_by("pk")
+            .values_list(*columns)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        key = columns.index(model._meta.pk.attname)
+        return self.export_table(
+            model._meta.label_lower,
+            {column: arrow_type(field) for column, field in zip(columns, fields)},
+            rows,
+            key=lambda row: row[key],
+            json_columns=[
+                i
+                for i, field in enumerate(fields)
+                if isinstance(field, models.JSONField)
+            ],
+        )
+
+    def export_sample_sheet(self) -> Dict[str, int]:
+        """Export the sample sheet, partitioned by individual name"""
+        schema = {}
+        for column in SAMPLE_SHEET_COLUMNS:
+            if column in SAMPLE_SHEET_M2M:
+                schema[column] = pa.dictionary(pa.int32(), pa.string())
+            else:
+                path = SAMPLE_SHEET_PATHS[column]
+                schema[column] = arrow_type(
+                    resolve_path(Individual, path),
+                    dictionary=is_vocabulary_path(Individual, path),
+                )
+        rows = (
+            tuple(row.values()) for row in sample_sheet_rows(chunk_size=self.chunk_size)
+        )
+        return self.export_table(
+            SAMPLE_SHEET_TABLE, schema, rows, key=lambda row: row[0]
+        )
+
+    def export_table(
+        self,
+        name: str,
+        schema: Dict[str, Any],
+        rows: Iterable[Tuple],
+        key: Callable[[Tuple], Any],
+        json_columns: Optional[List[int]] = None,
+    ) -> Dict[str, int]:
+        """
+        Write the changed partitions of a table and update its manifest entry.
+
+        Args:
+            name: The table name, also the name of its directory.
+            schema: Column name to Arrow type.
+            rows: Value tuples in key order.
+            key: Function returning the partition key of a row.
+            json_columns: Positions of JSON values, written as JSON text.
+
+        Returns:
+            dict: The number of rows and of written, unchanged and removed
+            partitions.
+        """
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+        columns = list(schema)
+        previous = self.manifest.get(name, {})
+        bounds = [partition["bound"] for partition in previous.get("partitions", [])]
+        if previous.get("columns") != columns:
+            bounds = []
+
+        stats = dict.fromkeys(["rows", "written", "unchanged", "removed"], 0)
+        partitions = []
+        for bound, part in partition_rows(rows, key, bounds, self.partition_size):
+            filename = f"part-{partition_digest(columns, part)}.parquet"
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                stats["unchanged"] += 1
+            else:
+                self.write_partition(path, schema, part, json_columns or [])
+                stats["written"] += 1
+            partitions.append({"bound": bound, "rows": len(part), "file": filename})
+            stats["rows"] += len(part)
+        if partitions:
+            # new keys beyond the last bound go to the last partition
+            partitions[-1]["bound"] = None
+
+        current = {partition["file"] for partition in partitions}
+        for filename in os.listdir(directory):
+            if filename.endswith(".parquet") and filename not in current:
+                os.remove(os.path.join(directory, filename))
+                stats["removed"] += 1
+        self.manifest[name] = {"columns": columns, "partitions": partitions}
+        return stats
+
+    @staticmethod
+    def write_partition(
+        path: str, schema: Dict[str, Any], rows: List[Tuple], json_columns: List[int]
+    ):
+        """Write the rows of a partition to a Parquet file"""
+        arrays = []
+        for i, (column, data_type) in enumerate(schema.items()):
+            values = [row[i] for row in rows]
+            if i in json_columns:
+                values = [
+                    None if value is None else json.dumps(value) for value in values
+                ]
+            if pa.types.is_dictionary(data_type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=data_type))
+        table = pa.Table.from_arrays(arrays, names=list(schema))
+        # readers skip files starting with a dot while the file is written
+        partial = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}")
+        pq.write_table(table, partial, compression=PARQUET_COMPRESSION)
+        os.replace(partial, path)
+
+
+def read_table(directory: str, name: str):
+    """
+    Load an exported table into pandas.
+
+    Args:
+        directory: The export directory.
+        name: A model label, e.g. "repository.file", or SAMPLE_SHEET_TABLE.
+
+    Returns:
+        pd.DataFrame: All partitions of the table.
+    """
+    require_pyarrow()
+    return pq.read_table(os.path.join(directory, name)).to_pandas()
@@ -0,0 +1,296 @@
+"""
+Streaming load of JSON dumps as written by `dumpdata`.
+
+The dump is parsed object by object and spooled to one temporary JSON lines
+file per model. The models are then loaded in foreign key dependency order
+with batched `bulk_create` calls, existing rows with the same primary key are
+overwritten like `loaddata` does. Many-to-many links are spooled as well and
+inserted in bulk once all objects exist. Memory use is bounded by the batch
+size, not by the size of the dump.
+"""
+
+import json
+import os
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Type
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from repository.bulk import (
+    BULK_CREATE_BATCH_SIZE,
+    IN_QUERY_CHUNK_SIZE,
+    bulk_created,
+    bulk_link,
+    chunked,
+)
+
+READ_SIZE = 1 << 16
+
+
+def iter_json_array(fh: IO[str], read_size: int = READ_SIZE) -> Iterator[Dict]:
+    """
+    Yield the objects of a JSON array one by one.
+
+    Only a window of the file around the current object is held in memory.
+
+    Args:
+        fh: Text file containing a JSON array of objects.
+        read_size: Number of characters read at once.
+
+    Yields:
+        dict: The next object of the array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = fh.read(read_size)
+        eof = not data
+        buffer = buffer[pos:] + data
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip(" \t\r\n")
+    if buffer[pos : pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        pos = end
+        yield obj
+
+
+def model_load_levels(
+    models_: Iterable[Type[models.Model]],
+) -> List[List[Type[models.Model]]]:
+    """
+    Group models into levels that only reference models of earlier levels.
+
+    Only foreign keys between the given models are considered, many-to-many
+    relations are restored after all objects are loaded. The models of one
+    level can be loaded concurrently.
+
+    Args:
+        models_: The models to load.
+
+    Returns:
+        list: The levels in load order, each a list of models.
+    """
+    pending = set(models_)
+    levels = []
+    while pending:
+        ready = sorted(
+            (
+                model
+                for model in pending
+                if not any(
+                    field.related_model in pending and field.related_model is not model
+                    for field in model._meta.concrete_fields
+                    if field.is_relation
+                )
+            ),
+            key=lambda model: model._meta.label_lower,
+        )
+        if not ready:
+            raise ValueError(
+                f"Circular foreign keys between {sorted(map(str, pending))}"
+            )
+        levels.append(ready)
+        pending.difference_update(ready)
+    return levels
+
+
+def model_load_order(model_labels: Iterable[str]) -> List[Type[models.Model]]:
+    """
+    Sort models so that every model comes after the models it references.
+
+    Args:
+        model_labels: Model labels as used in dumps, e.g. "repository.file".
+
+    Returns:
+        list: The models in dependency order.
+    """
+    levels = model_load_levels(apps.get_model(label) for label in model_labels)
+    return [model for level in levels for model in level]
+
+
+@contextmanager
+def preserved_auto_now(models_: Iterable[Type[models.Model]]):
+    """Keep dumped values of `auto_now`/`auto_now_add` fields while loading"""
+    fields = [
+        field
+        for model in models_
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def bulk_upsert(
+    model: Type[models.Model], objects: List[models.Model], using: str = "default"
+):
+    """Insert `objects`, overwriting existing rows with the same primary key"""
+    update_fields = [
+        field.name for field in model._meta.concrete_fields if not field.primary_key
+    ]
+    if update_fields:
+        model._base_manager.using(using).bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=update_fields,
+        )
+    else:
+        model._base_manager.using(using).bulk_create(objects, ignore_conflicts=True)
+    bulk_created.send(sender=model, using=using)
+
+
+class DumpLoader:
+    """
+    Load a JSON dump in FK dependency order with bounded memory.
+
+    Args:
+        batch_size: Number of objects per `bulk_create` and link batch.
+        exclude: App labels or model labels ("app.model") to skip.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BULK_CREATE_BATCH_SIZE,
+        exclude: Optional[Iterable[str]] = None,
+    ):
+        self.batch_size = batch_size
+        self.exclude = {label.lower() for label in exclude or []}
+        self.loaded: Dict[str, int] = defaultdict(int)
+        self.linked: Dict[str, int] = defaultdict(int)
+
+    def excluded(self, label: str) -> bool:
+        return label in self.exclude or label.split(".")[0] in self.exclude
+
+    def load(self, fh: IO[str]) -> Dict[str, int]:
+        """
+        Load all objects and many-to-many links of a dump.
+
+        Args:
+            fh: Text file with the dump.
+
+        Returns:
+            dict: Number of loaded objects per model label.
+        """
+        with tempfile.TemporaryDirectory() as spool:
+            labels = self.spool_objects(fh, spool)
+            ordered = model_load_order(labels)
+            with transaction.atomic(), preserved_auto_now(ordered):
+                for model in ordered:
+                    self.load_model(model, os.path.join(spool, model._meta.label_lower))
+                for relation in sorted(os.listdir(spool)):
+                    if relation.endswith(".m2m"):
+                        self.link(
+                            relation[: -len(".m2m")], os.path.join(spool, relation)
+                        )
+                self.reset_sequences(ordered)
+        return dict(self.loaded)
+
+    def spool_objects(self, fh: IO[str], spool: str) -> List[str]:
+        """Write the objects of the dump to one JSON lines file per model"""
+        files = {}
+        try:
+            for obj in iter_json_array(fh):
+                label = obj["model"].lower()
+                if self.excluded(label):
+                    continue
+                if label not in files:
+                    files[label] = open(os.path.join(spool, label), "w")
+                files[label].write(json.dumps(obj) + "\n")
+        finally:
+            for spooled in files.values():
+                spooled.close()
+        return list(files)
+
+    def load_model(self, model: Type[models.Model], path: str):
+        """Insert the spooled objects of a model, spooling their M2M links"""
+        m2m_files = {}
+        try:
+            with open(path) as fh:
+                for batch in chunked(map(json.loads, fh), self.batch_size):
+                    objects = list(
+                        serializers.deserialize("python", batch, ignorenonexistent=True)
+                    )
+                    bulk_upsert(model, [obj.object for obj in objects])
+                    self.loaded[model._meta.label_lower] += len(objects)
+                    self.spool_links(model, objects, m2m_files, os.path.dirname(path))
+        finally:
+            for spooled in m2m_files.values():
+                spooled.close()
+
+    def spool_links(self, model, objects, m2m_files, spool: str):
+        """Clear the links of loaded objects and spool their dumped links"""
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            with_links = [obj for obj in objects if field.name in obj.m2m_data]
+            if not with_links or not through._meta.auto_created:
+                continue
+            # links in the dump replace the existing ones, like `set()`
+            for chunk in chunked(
+                [obj.object.pk for obj in with_links], IN_QUERY_CHUNK_SIZE
+            ):
+                through.objects.filter(
+                    **{f"{field.m2m_field_name()}__in": chunk}
+                ).delete()
+            relation = f"{model._meta.label_lower}.{field.name}"
+            if relation not in m2m_files:
+                m2m_files[relation] = open(os.path.join(spool, f"{relation}.m2m"), "w")
+            for obj in with_links:
+                for target in obj.m2m_data[field.name]:
+                    m2m_files[relation].write(
+                        json.dumps([obj.object.pk, target]) + "\n"
+                    )
+
+    def link(self, relation: str, path: str):
+        """Insert the spooled links of a many-to-many field in batches"""
+        app_label, model_name, field_name = relation.split(".")
+        descriptor = getattr(apps.get_model(app_label, model_name), field_name)
+        with open(path) as fh:
+            for batch in chunked(map(json.loads, fh), self.batch_size):
+                self.linked[relation] += bulk_link(
+                    descriptor, map(tuple, batch), batch_size=self.batch_size
+                )
+
+    def reset_sequences(self, models_: List[Type[models.Model]]):
+        """Move auto-increment sequences past the loaded primary keys"""
+        statements = connection.ops.sequence_reset_sql(no_style(), models_)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
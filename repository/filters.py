@@ -1,6 +1,51 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
 from django_filters import rest_framework as filters
 from django_filters import CharFilter, ChoiceFilter, ModelMultipleChoiceFilter
-from .models import Experiment, Individual
+from .bulk import bulk_created
+from .models import Experiment, Individual, Organism, SampleSex
+
+# Vocabulary choices are cached per process, changes made in another process
+# show up after this many seconds
+VOCABULARY_CHOICES_TIMEOUT = 300
+VOCABULARY_CHOICE_MODELS = [Organism, SampleSex]
+
+
+def vocabulary_choices_key(model):
+    return f"repository.filters.choices.{model._meta.label_lower}"
+
+
+def vocabulary_choices(model):
+    """
+    Cached (pk, label) choices of a vocabulary model for filter dropdowns.
+
+    Args:
+        model: The vocabulary model.
+
+    Returns:
+        callable: Returns the choices, querying the model only when they are
+        not cached.
+    """
+
+    def choices():
+        key = vocabulary_choices_key(model)
+        cached = cache.get(key)
+        if cached is None:
+            cached = [(obj.pk, str(obj)) for obj in model.objects.order_by("pk")]
+            cache.set(key, cached, VOCABULARY_CHOICES_TIMEOUT)
+        return cached
+
+    return choices
+
+
+def clear_vocabulary_choices(sender, **kwargs):
+    cache.delete(vocabulary_choices_key(sender))
+
+
+# bulk inserts of the importers and loaders send no post_save
+for vocabulary_model in VOCABULARY_CHOICE_MODELS:
+    for signal in (post_save, post_delete, bulk_created):
+        signal.connect(clear_vocabulary_choices, sender=vocabulary_model)
 
 
 class ExperimentFilter(filters.FilterSet):
@@ -27,6 +72,10 @@ class IndividualFilter(filters.FilterSet):
         lookup_expr="contains",
         label='Name'
     )
+    sex = ChoiceFilter(field_name="sex", choices=vocabulary_choices(SampleSex))
+    organism = ChoiceFilter(
+        field_name="organism", choices=vocabulary_choices(Organism)
+    )
 
 
     class Meta:
@@ -0,0 +1,281 @@
+"""
+Throughput metrics of the sheet importers.
+
+`ImportMetrics` collects, per named stage, the wall time, the number of rows
+and the number and duration of the database queries, classified into
+vocabulary lookups, other lookups, writes and many-to-many links by the table
+they touch. It also keeps the slowest rows of row-wise imports. The summary is
+a plain dict, written as JSON at the end of a run. Optionally the whole run is
+profiled with cProfile.
+"""
+
+import cProfile
+import heapq
+import json
+import logging
+import re
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache, partial, wraps
+from time import perf_counter
+from typing import Dict, Optional
+
+from django.apps import apps
+from django.db import connection
+
+from repository.models import (
+    Age,
+    Color,
+    Country,
+    ExternalCollection,
+    Instrument,
+    Organism,
+    Person,
+    SampleSex,
+    Tissue,
+    TissuePreservative,
+)
+
+logger = logging.getLogger(__name__)
+
+VOCABULARY_MODELS = [
+    Age,
+    Color,
+    Country,
+    ExternalCollection,
+    Instrument,
+    Organism,
+    Person,
+    SampleSex,
+    Tissue,
+    TissuePreservative,
+]
+
+QUERY_CATEGORIES = ["vocabulary", "lookup", "write", "m2m"]
+
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+def query_category(sql: str) -> str:
+    """
+    Classify a query by the first table it reads from or writes to.
+
+    Args:
+        sql: The SQL statement.
+
+    Returns:
+        str: One of QUERY_CATEGORIES.
+    """
+    vocabulary_tables, m2m_tables = _category_tables()
+    match = _TABLE_RE.search(sql)
+    table = match.group(1) if match else ""
+    if table in m2m_tables:
+        return "m2m"
+    if table in vocabulary_tables:
+        return "vocabulary"
+    if sql.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+        return "write"
+    return "lookup"
+
+
+@lru_cache(maxsize=None)
+def _category_tables():
+    vocabulary_tables = {model._meta.db_table for model in VOCABULARY_MODELS}
+    m2m_tables = {
+        field.remote_field.through._meta.db_table
+        for model in apps.get_app_config("repository").get_models()
+        for field in model._meta.many_to_many
+    }
+    return vocabulary_tables, m2m_tables
+
+
+def measured(stage: str):
+    """
+    Measure an importer method taking a sheet DataFrame as a stage.
+
+    The instance must provide the `ImportMetrics` as `metrics`.
+
+    Args:
+        stage: The stage name.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, df, *args, **kwargs):
+            with self.metrics.stage(stage, rows=len(df)):
+                return method(self, df, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ImportMetrics:
+    """
+    Collect per-stage timings and query counts of an import run.
+
+    Stages must not be nested, the queries of a nested stage would be counted
+    twice.
+    """
+
+    def __init__(
+        self, name: str, profile_path: Optional[str] = None, slowest: int = 10
+    ):
+        self.name = name
+        self.rows = 0
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.slowest = slowest
+        self.slow_rows = []
+        self.started = perf_counter()
+        self.profile_path = profile_path
+        self.profiler = None
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def __getstate__(self):
+        # metrics of worker processes are sent back to the parent
+        state = self.__dict__.copy()
+        state["profiler"] = None
+        return state
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """
+        Measure the wall time and the queries of a block.
+
+        Args:
+            name: The stage name, repeated stages are summed up.
+            rows: The number of rows handled in the block.
+        """
+        stats = self.stages.setdefault(name, defaultdict(float))
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(partial(self._count_query, stats)):
+                yield
+        finally:
+            stats["seconds"] += perf_counter() - start
+            stats["rows"] += rows
+
+    @staticmethod
+    def _count_query(stats, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            category = query_category(sql)
+            stats["queries"] += 1
+            stats[f"{category}_queries"] += 1
+            stats[f"{category}_seconds"] += perf_counter() - start
+
+    def record_row(self, key, seconds: float):
+        """Keep `key` if it is one of the `slowest` rows so far"""
+        item = (seconds, str(key))
+        if len(self.slow_rows) < self.slowest:
+            heapq.heappush(self.slow_rows, item)
+        else:
+            heapq.heappushpop(self.slow_rows, item)
+
+    def timed(self, func, sheet: str):
+        """
+        Wrap a row-wise import function to record the duration of each row.
+
+        Args:
+            func: Function called with a row `pd.Series`.
+            sheet: Sheet name used in the row key.
+
+        Returns:
+            The wrapped function.
+        """
+
+        @wraps(func)
+        def wrapper(row, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(row, *args, **kwargs)
+            finally:
+                self.record_row(f"{sheet} row {row.name}", perf_counter() - start)
+
+        return wrapper
+
+    def merge(self, other: "ImportMetrics"):
+        """Add the stages and rows of `other`, e.g. of a worker process"""
+        self.rows += other.rows
+        for name, other_stats in other.stages.items():
+            stats = self.stages.setdefault(name, defaultdict(float))
+            for key, value in other_stats.items():
+                stats[key] += value
+        for seconds, key in other.slow_rows:
+            self.record_row(key, seconds)
+
+    def summary(self) -> Dict:
+        """
+        Summarise the run.
+
+        Returns:
+            dict: Totals, per-stage metrics and the slowest rows, with rates
+            per row and per second.
+        """
+        seconds = perf_counter() - self.started
+        queries = sum(stats["queries"] for stats in self.stages.values())
+        return {
+            "name": self.name,
+            "rows": self.rows,
+            "seconds": round(seconds, 6),
+            "rows_per_second": _rate(self.rows, seconds),
+            "queries": int(queries),
+            "queries_per_row": _rate(queries, self.rows),
+            "stages": {
+                name: {
+                    "seconds": round(stats["seconds"], 6),
+                    "rows": int(stats["rows"]),
+                    "rows_per_second": _rate(stats["rows"], stats["seconds"]),
+                    "queries": int(stats["queries"]),
+                    "queries_per_row": _rate(stats["queries"], stats["rows"]),
+                    **{
+                        f"{category}_{unit}": round(stats[f"{category}_{unit}"], 6)
+                        for category in QUERY_CATEGORIES
+                        for unit in ("queries", "seconds")
+                    },
+                }
+                for name, stats in self.stages.items()
+            },
+            "slowest_rows": [
+                {"row": key, "seconds": round(seconds, 6)}
+                for seconds, key in sorted(self.slow_rows, reverse=True)
+            ],
+        }
+
+    def report(self, path: Optional[str] = None) -> Dict:
+        """
+        Stop profiling and write the summary as JSON.
+
+        Args:
+            path: File the summary is written to, stdout if not given.
+
+        Returns:
+            dict: The summary.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            self.profiler = None
+        summary = self.summary()
+        if path:
+            with open(path, "w") as fh:
+                json.dump(summary, fh, indent=2)
+        else:
+            json.dump(summary, sys.stdout, indent=2)
+            print()
+        return summary
+
+    def log(self) -> Dict:
+        """Log the summary as JSON, e.g. for imports through the admin"""
+        summary = self.summary()
+        logger.info(json.dumps(summary))
+        return summary
+
+
+def _rate(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 3) if denominator else None
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from repository.columnar import PARTITION_ROWS, ColumnarExport
+from repository.snapshots import SNAPSHOT_APP
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every model of the repository app and the flattened sample "
+        "sheet as partitioned Parquet datasets, rewriting only changed "
+        "partitions of a previous export. Requires pyarrow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Export directory")
+        parser.add_argument("--app", default=SNAPSHOT_APP)
+        parser.add_argument("--partition-size", type=int, default=PARTITION_ROWS)
+        parser.add_argument(
+            "--no-sample-sheet",
+            action="store_true",
+            help="Only export the model tables",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            export = ColumnarExport(
+                options["directory"], partition_size=options["partition_size"]
+            )
+        except ImportError as e:
+            raise CommandError(e)
+        stats = export.run(
+            app_label=options["app"], sample_sheet=not options["no_sample_sheet"]
+        )
+        for name, counts in stats.items():
+            self.stdout.write(
+                f"{name}: {counts['rows']} rows, {counts['written']} partitions "
+                f"written, {counts['unchanged']} unchanged, "
+                f"{counts['removed']} removed"
+            )
+        written = sum(counts["written"] for counts in stats.values())
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {written} partitions to {options['directory']}")
+        )
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from repository.sample_sheet import (
+    ITERATOR_CHUNK_SIZE,
+    SAMPLE_SHEET_FORMATS,
+    render_sample_sheet,
+    sample_sheet_queryset,
+    sample_sheet_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream the flattened Individual to File sample sheet as CSV, TSV or "
+        "NDJSON, optionally filtered like the individual and experiment lists."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-o", "--output", help="Output file, stdout if not given")
+        parser.add_argument(
+            "-f", "--format", choices=list(SAMPLE_SHEET_FORMATS), default="csv"
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="IndividualFilter or ExperimentFilter parameter, repeatable",
+        )
+        parser.add_argument("--chunk-size", type=int, default=ITERATOR_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        data = {}
+        for item in options["filter"]:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"Filter {item} is not of the form NAME=VALUE")
+            data[name] = value
+        try:
+            queryset = sample_sheet_queryset(data)
+        except ValueError as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        lines = render_sample_sheet(
+            sample_sheet_rows(queryset, chunk_size=options["chunk_size"]),
+            options["format"],
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as fh:
+                fh.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
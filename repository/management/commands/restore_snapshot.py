@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from repository.bulk import BULK_CREATE_BATCH_SIZE
+from repository.snapshots import Snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Restore a snapshot written by the snapshot command, streams are "
+        "loaded in parallel wherever the FK order allows. Rows are upserted "
+        "by primary key, rows created after the snapshot are kept unless "
+        "--truncate is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Snapshot directory")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=BULK_CREATE_BATCH_SIZE)
+        parser.add_argument(
+            "--truncate",
+            action="store_true",
+            help="Empty the tables of the snapshot before loading it",
+        )
+
+    def handle(self, *args, **options):
+        restored = Snapshot(options["directory"], workers=options["workers"]).restore(
+            batch_size=options["batch_size"], truncate=options["truncate"]
+        )
+        for label, rows in restored.items():
+            self.stdout.write(f"{label}: {rows} rows")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Restored {sum(restored.values())} rows from {options['directory']}"
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from repository.snapshots import COMPRESSION_LEVEL, SNAPSHOT_APP, Snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every model of the repository app to its own zstandard "
+        "compressed stream. The snapshot is consistent while the database is "
+        "written to. On PostgreSQL tables are dumped in parallel from one "
+        "exported snapshot, on other databases in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Snapshot directory")
+        parser.add_argument("--app", default=SNAPSHOT_APP)
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--level", type=int, default=COMPRESSION_LEVEL)
+
+    def handle(self, *args, **options):
+        manifest = Snapshot(options["directory"], workers=options["workers"]).take(
+            app_label=options["app"], level=options["level"]
+        )
+        for label, entry in manifest.items():
+            self.stdout.write(f"{label}: {entry['rows']} rows")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {len(manifest)} tables to {options['directory']}"
+            )
+        )
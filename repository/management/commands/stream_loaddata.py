@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from repository.bulk import BULK_CREATE_BATCH_SIZE
+from repository.dumps import DumpLoader
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a JSON dump (e.g. prod_dump.json) with bounded memory: objects "
+        "are inserted in FK dependency order with bulk_create, M2M links in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dump", help="JSON dump as written by dumpdata")
+        parser.add_argument("--batch-size", type=int, default=BULK_CREATE_BATCH_SIZE)
+        parser.add_argument(
+            "-e",
+            "--exclude",
+            action="append",
+            default=[],
+            help="App label or app_label.ModelName to skip, can be repeated",
+        )
+
+    def handle(self, *args, **options):
+        loader = DumpLoader(
+            batch_size=options["batch_size"], exclude=options["exclude"]
+        )
+        with open(options["dump"]) as fh:
+            loaded = loader.load(fh)
+
+        for label, count in loaded.items():
+            self.stdout.write(f"{label}: {count} objects")
+        for relation, count in loader.linked.items():
+            self.stdout.write(f"{relation}: {count} links")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Installed {sum(loaded.values())} objects from {options['dump']}"
+            )
+        )
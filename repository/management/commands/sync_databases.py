@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from repository.bulk import IN_QUERY_CHUNK_SIZE
+from repository.snapshots import SNAPSHOT_APP
+from repository.sync import DatabaseSync
+
+
+class Command(BaseCommand):
+    help = (
+        "Make the repository tables of the target database equal to the "
+        "source, writing only the rows whose hashes differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default="default", help="Source alias")
+        parser.add_argument("--target", required=True, help="Target alias")
+        parser.add_argument("--app", default=SNAPSHOT_APP)
+        parser.add_argument("--chunk-size", type=int, default=IN_QUERY_CHUNK_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the differences",
+        )
+
+    def handle(self, *args, **options):
+        for alias in (options["source"], options["target"]):
+            if alias not in connections:
+                raise CommandError(f"Unknown database alias {alias}")
+        try:
+            sync = DatabaseSync(
+                options["source"],
+                options["target"],
+                chunk_size=options["chunk_size"],
+                dry_run=options["dry_run"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        changes = sync.run(app_label=options["app"])
+        for label, counts in changes.items():
+            if any(counts.values()):
+                self.stdout.write(
+                    f"{label}: {counts['inserted']} inserted, "
+                    f"{counts['updated']} updated, {counts['deleted']} deleted"
+                )
+        total = sum(sum(counts.values()) for counts in changes.values())
+        verb = "Found" if options["dry_run"] else "Applied"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} row changes"))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.1 on 2026-10-17 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("repository", "0008_alter_samplingevent_sampling_latitude_dec_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=64)),
+                ("sheet", models.CharField(max_length=32)),
+                ("rows_done", models.PositiveIntegerField(default=0)),
+                ("completed", models.BooleanField(default=False)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("source", "sheet")},
+            },
+        ),
+    ]
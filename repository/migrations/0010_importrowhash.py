@@ -0,0 +1,34 @@
+# Generated by Django 4.2.1 on 2026-10-17 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("repository", "0009_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportRowHash",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sheet", models.CharField(max_length=32)),
+                ("key", models.CharField(max_length=255)),
+                ("digest", models.CharField(max_length=16)),
+                ("object_id", models.CharField(max_length=255)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("sheet", "key")},
+            },
+        ),
+    ]
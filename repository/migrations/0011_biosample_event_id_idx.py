@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-17 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("repository", "0010_importrowhash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="biosample",
+            index=models.Index(
+                fields=["sampling_event", "id"], name="biosample_event_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-17 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("repository", "0011_biosample_event_id_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="externalaccession",
+            name="accession_no",
+            field=models.CharField(db_index=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name="samplingevent",
+            name="ring_number",
+            field=models.CharField(
+                blank=True, db_index=True, default=None, max_length=128, null=True
+            ),
+        ),
+    ]
@@ -120,7 +120,7 @@ class ExternalAccession(models.Model):
         ENA = "ENA", "ENA"
         BIOSTUDIES = "ENA_BIOSTUDIES", "BIOSTUDIES"
 
-    accession_no = models.CharField(max_length=32)
+    accession_no = models.CharField(max_length=32, db_index=True)
     archive = models.CharField(max_length=16, choices=ExternalArchive.choices)
 
 
@@ -227,7 +227,9 @@ class SamplingEvent(models.Model):
     )
     picture_ids = models.TextField(default=None, null=True, blank=True)
     attributes = models.JSONField(default=dict, null=True, blank=True)
-    ring_number = models.CharField(max_length=128, default=None, null=True, blank=True)
+    ring_number = models.CharField(
+        max_length=128, default=None, null=True, blank=True, db_index=True
+    )
     logger_id = models.CharField(max_length=200, default=None, null=True, blank=True)
 
     comment = models.TextField(default=None, null=True, blank=True)
@@ -276,6 +278,14 @@ class BioSample(models.Model):
     )
     related_sample = models.ManyToManyField("self", blank=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the sample list
+            models.Index(
+                fields=["sampling_event", "id"], name="biosample_event_id_idx"
+            ),
+        ]
+
     @property
     def label(self):
         return f"{self.tissue_type} from {self.sampling_event.sampling_date}"
@@ -448,3 +458,35 @@ class File(models.Model):
 
     def __str__(self):
         return f"{self.filename} ({self.filetype})"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a chunked sheet import, committed together with each chunk."""
+
+    source = models.CharField(max_length=64)
+    sheet = models.CharField(max_length=32)
+    rows_done = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ["source", "sheet"]
+
+    def __str__(self):
+        return f"{self.sheet} {self.source[:8]}: {self.rows_done} rows"
+
+
+class ImportRowHash(models.Model):
+    """Content hash of an imported sheet row, keyed by the row's natural key."""
+
+    sheet = models.CharField(max_length=32)
+    key = models.CharField(max_length=255)
+    digest = models.CharField(max_length=16)
+    object_id = models.CharField(max_length=255)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ["sheet", "key"]
+
+    def __str__(self):
+        return f"{self.sheet} {self.key}: {self.digest}"
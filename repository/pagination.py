@@ -0,0 +1,211 @@
+"""
+Keyset (seek) pagination for the list views and the REST API.
+
+Pages are not addressed by number but by a cursor holding the ordering values
+of the last (or first) row of the neighbouring page. The next page is read
+with `WHERE (a, b) > (cursor) ORDER BY a, b LIMIT n`, which an index on the
+ordering columns answers by seeking to the cursor, so a page deep in the list
+costs the same as the first one. No COUNT query is issued.
+
+The ordering columns must be non-null and unique together, rows inserted or
+deleted between two requests then neither repeat nor go missing. The API
+endpoints use DRF's cursor pagination on the primary key, which works the
+same way.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.pagination import CursorPagination
+
+PAGE_SIZE = 100
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the ordering values of a row as URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str, width: int) -> List[Any]:
+    """
+    Decode a cursor created by `encode_cursor`.
+
+    Args:
+        cursor: The cursor from the query string.
+        width: The number of ordering columns.
+
+    Returns:
+        list: The ordering values.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != width:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence[Any], lookup: str) -> Q:
+    """
+    Row value comparison `(fields) > (values)` as Q object.
+
+    Args:
+        fields: The ordering columns.
+        values: The cursor values, one per column.
+        lookup: "gt" for rows after the cursor, "lt" for rows before.
+
+    Returns:
+        Q: The filter, `a > x OR (a = x AND b > y) ...`.
+    """
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = dict(zip(fields[:i], values[:i]))
+        condition |= Q(**equal, **{f"{field}__{lookup}": values[i]})
+    return condition
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated queryset.
+
+    Args:
+        object_list: The rows of the page, in ascending order.
+        fields: The ordering columns.
+        has_next: Whether rows follow the page.
+        has_previous: Whether rows precede the page.
+    """
+
+    def __init__(
+        self,
+        object_list: List[models.Model],
+        fields: Sequence[str],
+        has_next: bool,
+        has_previous: bool,
+    ):
+        self.object_list = object_list
+        self.fields = fields
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    def cursor(self, obj: models.Model) -> str:
+        return encode_cursor([getattr(obj, field) for field in self.fields])
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self._has_next:
+            return None
+        return self.cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if not self._has_previous:
+            return None
+        return self.cursor(self.object_list[0])
+
+
+def keyset_page(
+    queryset: models.QuerySet,
+    fields: Sequence[str],
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+) -> KeysetPage:
+    """
+    Read the page after or before a cursor, or the first page.
+
+    One more row than the page size is read to find out whether the list
+    continues in the paging direction. A page reached from a cursor always
+    has a page in the opposite direction.
+
+    Args:
+        queryset: The unordered queryset.
+        fields: The ordering columns, ascending.
+        after: Cursor of the last row of the previous page.
+        before: Cursor of the first row of the next page.
+        page_size: The number of rows per page.
+
+    Returns:
+        KeysetPage: The page.
+
+    Raises:
+        ValueError: If a cursor is malformed.
+    """
+    if before:
+        values = decode_cursor(before, len(fields))
+        queryset = queryset.filter(keyset_filter(fields, values, "lt"))
+        rows = list(queryset.order_by(*(f"-{f}" for f in fields))[: page_size + 1])
+        more = len(rows) > page_size
+        return KeysetPage(rows[:page_size][::-1], fields, True, more)
+
+    if after:
+        values = decode_cursor(after, len(fields))
+        queryset = queryset.filter(keyset_filter(fields, values, "gt"))
+    rows = list(queryset.order_by(*fields)[: page_size + 1])
+    more = len(rows) > page_size
+    return KeysetPage(rows[:page_size], fields, more, bool(after))
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset pagination for a `ListView`, driven by `?after=` and `?before=`.
+
+    The page is available in the template context as `page_obj`, with
+    `next_cursor` and `previous_cursor` for the navigation links.
+    """
+
+    keyset_fields: Sequence[str] = ("pk",)
+    paginate_by = PAGE_SIZE
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = keyset_page(
+                queryset,
+                self.keyset_fields,
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+                page_size=page_size,
+            )
+        except ValueError as e:
+            raise Http404(str(e)) from e
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class RepositoryCursorPagination(CursorPagination):
+    """
+    Cursor pagination of the API endpoints, ordered by primary key.
+
+    The page size defaults to `PAGE_SIZE` of `REST_FRAMEWORK` and can be set
+    per request with `?page_size=`, up to `API_MAX_PAGE_SIZE`.
+    """
+
+    ordering = "pk"
+    page_size_query_param = "page_size"
+
+    @property
+    def max_page_size(self):
+        return settings.API_MAX_PAGE_SIZE
@@ -1,4 +1,12 @@
+from collections import defaultdict
+from itertools import chain
+from time import perf_counter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
 from import_export import resources, fields, widgets
+from repository.bulk import filter_in_chunks, get_or_create_map, lookup_map
+from repository.import_metrics import ImportMetrics
 from repository.models import (
     BioSample,
     SamplingEvent,
@@ -20,29 +28,184 @@ class MultiElementSeparators:
     PRESERVATIVE_SEPARATOR = ";"
 
 
-class BioSampleResource(resources.ModelResource):
+class CachedWidgetMixin:
+    """
+    Resolve cell values from a map filled once per dataset.
+
+    `PrefetchRelationsMixin.before_import` fills the map with one chunked IN
+    query per column, afterwards cleaning a cell does not hit the database.
+    Without a filled map the widgets behave like their parent classes.
+    """
+
+    cache = None
+
+    def keys(self, values):
+        """Return the lookup keys referenced by the cells of a column"""
+        return [value for value in values if value not in (None, "")]
+
+    def prefetch(self, values):
+        """Load all objects referenced by `values` into the cache"""
+        try:
+            self.model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            # properties such as `label` can't be looked up in the database
+            return
+        self.cache = lookup_map(self.model, self.field, self.keys(values))
+
+    def clear_cache(self):
+        self.cache = None
+
+
+class CachedForeignKeyWidget(CachedWidgetMixin, widgets.ForeignKeyWidget):
+    def clean(self, value, row=None, **kwargs):
+        # rows prepared in `before_import_row` already carry the instance
+        if isinstance(value, self.model):
+            return value
+        if self.cache is None:
+            return super().clean(value, row, **kwargs)
+        if value in (None, ""):
+            return None
+        try:
+            return self.cache[value]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                f"{self.model.__name__} with {self.field}={value} does not exist."
+            )
+
+
+class CachedManyToManyWidget(CachedWidgetMixin, widgets.ManyToManyWidget):
+    def keys(self, values):
+        return list(chain.from_iterable(self.split(value) for value in values))
+
+    def split(self, value):
+        """Split a cell into its stripped, non-empty elements"""
+        if not value:
+            return []
+        return [
+            elem.strip() for elem in str(value).split(self.separator) if elem.strip()
+        ]
+
+    def clean(self, value, row=None, **kwargs):
+        if self.cache is None or isinstance(value, (float, int)):
+            return super().clean(value, row, **kwargs)
+        # unknown keys are skipped like in the `__in` filter of the parent
+        return [self.cache[key] for key in self.split(value) if key in self.cache]
+
+
+class PrefetchRelationsMixin:
+    """
+    Load all keys referenced by a dataset in bulk before the rows are imported.
+
+    Fills the cache of every `CachedWidgetMixin` widget whose column is part of
+    the dataset, so that the import costs a fixed number of lookup queries
+    instead of one query per cell.
+    """
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
+        for field in self.get_import_fields():
+            if (
+                isinstance(field.widget, CachedWidgetMixin)
+                and field.column_name in dataset.headers
+            ):
+                field.widget.prefetch(dataset[field.column_name])
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        for field in self.get_import_fields():
+            if isinstance(field.widget, CachedWidgetMixin):
+                field.widget.clear_cache()
+        super().after_import(dataset, result, using_transactions, dry_run, **kwargs)
+
+
+class ImportMetricsMixin:
+    """
+    Measure every `import_data` call as a stage of `ImportMetrics`.
+
+    Scripts share one `ImportMetrics` between resources by setting `metrics`
+    and count the rows of their sheets themselves, as a sheet may pass
+    through several resources and be imported in parts. Otherwise, e.g. for
+    imports through `ImportExportModelAdmin`, every import is measured on its
+    own and the summary is logged as JSON.
+    """
+
+    metrics = None
+
+    def import_data(self, dataset, *args, **kwargs):
+        name = self.__class__.__name__
+        if self.metrics is None:
+            self.active_metrics = ImportMetrics(name)
+            self.active_metrics.rows = len(dataset)
+        else:
+            self.active_metrics = self.metrics
+        with self.active_metrics.stage(name, rows=len(dataset)):
+            result = super().import_data(dataset, *args, **kwargs)
+        if self.metrics is None:
+            self.active_metrics.log()
+        return result
+
+    def import_row(self, row, instance_loader, **kwargs):
+        start = perf_counter()
+        try:
+            return super().import_row(row, instance_loader, **kwargs)
+        finally:
+            self.active_metrics.record_row(
+                f"{self.__class__.__name__} row {kwargs.get('row_number')}",
+                perf_counter() - start,
+            )
+
+
+class BioSampleResource(
+    ImportMetricsMixin, PrefetchRelationsMixin, resources.ModelResource
+):
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        self.sampling_events = defaultdict(list)
+        if "name" in dataset.headers:
+            for sampling_event in filter_in_chunks(
+                SamplingEvent.objects.all(), "individual_id", dataset["name"]
+            ):
+                self.sampling_events[sampling_event.individual_id].append(
+                    sampling_event
+                )
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
+
     def before_import_row(self, row, **kwargs):
-        ind_obj = Individual.objects.get(name=row["name"])
-        sampling_event_obj = SamplingEvent.objects.get(individual=ind_obj)
+        sampling_events = self.sampling_events.get(row["name"], [])
+        if not sampling_events:
+            raise SamplingEvent.DoesNotExist(
+                f"No SamplingEvent for individual {row['name']}."
+            )
+        if len(sampling_events) > 1:
+            raise SamplingEvent.MultipleObjectsReturned(
+                f"More than one SamplingEvent for individual {row['name']}."
+            )
 
-        row["sampling_event"] = sampling_event_obj
+        row["sampling_event"] = sampling_events[0]
+
+    def iter_queryset(self, queryset):
+        # the exported labels and M2M columns are loaded per chunk of rows,
+        # not per row, also for the querysets of admin exports
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.select_related(
+                "sampling_event__individual"
+            ).prefetch_related("preservative", "related_sample")
+        return super().iter_queryset(queryset)
 
     sampling_event = fields.Field(
         column_name="sampling_event",
         attribute="sampling_event",
-        widget=widgets.ForeignKeyWidget(SamplingEvent, field="label"),
+        widget=CachedForeignKeyWidget(SamplingEvent, field="label"),
     )
 
     tissue_type = fields.Field(
         column_name="tissue",
         attribute="tissue",
-        widget=widgets.ForeignKeyWidget(Tissue, field="name"),
+        widget=CachedForeignKeyWidget(Tissue, field="name"),
     )
 
     preservative = fields.Field(
         column_name="preservative",
         attribute="preservative",
-        widget=widgets.ManyToManyWidget(
+        widget=CachedManyToManyWidget(
             TissuePreservative,
             field="label",
             separator=MultiElementSeparators.PRESERVATIVE_SEPARATOR,
@@ -54,37 +217,46 @@ class BioSampleResource(resources.ModelResource):
         use_transactions = True
 
 
-class SamplingEventResource(resources.ModelResource):
-    def before_import_row(self, row, **kwargs):
-        # Ringer Name get or create
-        ringer_name_initials = row["ringer_name"].split(
-            MultiElementSeparators.RINGER_NAME_SEPARATOR
-        )
-        for initials in ringer_name_initials:
-            Person.objects.get_or_create(
-                initials=initials, defaults={"name": "", "affiliation": "Unknown"}
+class SamplingEventResource(
+    ImportMetricsMixin, PrefetchRelationsMixin, resources.ModelResource
+):
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        # Ringer Name get or create, all missing ringers in one bulk_create
+        if "ringer_name" in dataset.headers:
+            get_or_create_map(
+                Person,
+                "initials",
+                self.fields["ringer_name"].widget.keys(dataset["ringer_name"]),
+                defaults={"name": "", "affiliation": "Unknown"},
             )
+        self.individuals = {}
+        if "name" in dataset.headers:
+            self.individuals = lookup_map(Individual, "name", dataset["name"])
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
 
+    def before_import_row(self, row, **kwargs):
         individual = row["name"]
-        ind_obj = Individual.objects.get(name=individual)
-        row["name"] = ind_obj
+        try:
+            row["name"] = self.individuals[individual]
+        except KeyError:
+            raise Individual.DoesNotExist(f"Individual {individual} does not exist.")
 
     individual = fields.Field(
         column_name="name",
         attribute="individual",  # TODO check
-        widget=widgets.ForeignKeyWidget(Individual, field="name"),
+        widget=CachedForeignKeyWidget(Individual, field="name"),
     )
 
     collection_country = fields.Field(
         column_name="collection_country",
         attribute="collection_country",
-        widget=widgets.ForeignKeyWidget(Country, field="name"),
+        widget=CachedForeignKeyWidget(Country, field="name"),
     )
 
     ringer_name = fields.Field(
         column_name="ringer_name",
         attribute="ringer_name",
-        widget=widgets.ManyToManyWidget(
+        widget=CachedManyToManyWidget(
             Person,
             field="initials",
             separator=MultiElementSeparators.RINGER_NAME_SEPARATOR,
@@ -94,19 +266,19 @@ class SamplingEventResource(resources.ModelResource):
     throat_phenotype = fields.Field(
         column_name="throat_phenotype",
         attribute="throat_phenotype",
-        widget=widgets.ForeignKeyWidget(Color, field="label"),
+        widget=CachedForeignKeyWidget(Color, field="label"),
     )
 
     back_color_score = fields.Field(
         column_name="back_color_score",
         attribute="back_color_score",
-        widget=widgets.ForeignKeyWidget(Color, field="label"),
+        widget=CachedForeignKeyWidget(Color, field="label"),
     )
 
     neck_color_score = fields.Field(
         column_name="neck_color_score",
         attribute="neck_color_score",
-        widget=widgets.ForeignKeyWidget(Color, field="label"),
+        widget=CachedForeignKeyWidget(Color, field="label"),
     )
     collection_date = fields.Field(
         column_name="collection_date",
@@ -119,72 +291,76 @@ class SamplingEventResource(resources.ModelResource):
         use_transactions = True
 
 
-class IndividualResource(resources.ModelResource):
+class IndividualResource(
+    ImportMetricsMixin, PrefetchRelationsMixin, resources.ModelResource
+):
     organism = fields.Field(
         column_name="organism",
         attribute="organism",
-        widget=widgets.ForeignKeyWidget(Organism, field="scientific_name"),
+        widget=CachedForeignKeyWidget(Organism, field="scientific_name"),
     )
 
     age = fields.Field(
         column_name="age",
         attribute="age",
-        widget=widgets.ForeignKeyWidget(Age, field="label"),
+        widget=CachedForeignKeyWidget(Age, field="label"),
     )
 
     sex = fields.Field(
         column_name="sex",
         attribute="sex",
-        widget=widgets.ForeignKeyWidget(SampleSex, field="name"),
+        widget=CachedForeignKeyWidget(SampleSex, field="name"),
     )
 
     name = fields.Field(column_name="name", attribute="name")
 
     class Meta:
         model = Individual
+        # the sheet identifies individuals by name, their primary key
+        import_id_fields = ["name"]
         use_transactions = True
 
 
-class OrganismResource(resources.ModelResource):
+class OrganismResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Organism
 
 
-class AgeResource(resources.ModelResource):
+class AgeResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Age
 
 
-class SampleSexResource(resources.ModelResource):
+class SampleSexResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = SampleSex
 
 
-class ColorResource(resources.ModelResource):
+class ColorResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Color
 
 
-class PersonResource(resources.ModelResource):
+class PersonResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Person
 
 
-class CountryResource(resources.ModelResource):
+class CountryResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Country
 
 
-class InstrumentResource(resources.ModelResource):
+class InstrumentResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Instrument
 
 
-class TissuePreservativeResource(resources.ModelResource):
+class TissuePreservativeResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = TissuePreservative
 
 
-class TissueResource(resources.ModelResource):
+class TissueResource(ImportMetricsMixin, resources.ModelResource):
     class Meta:
         model = Tissue
@@ -0,0 +1,226 @@
+"""
+Flattened sample sheet over the whole lineage of an individual.
+
+One row per Individual → SamplingEvent → BioSample → Experiment → File path,
+with the labels of the vocabulary foreign keys. Branches without children,
+e.g. an individual that was never sequenced, are kept with empty columns.
+
+All scalar columns are read with a single joined `values()` query, streamed
+with `QuerySet.iterator()`, which uses a server-side cursor on PostgreSQL.
+The many-to-many columns are resolved set-wise, with one IN query per chunk of
+rows instead of one query per row. Rows are rendered as CSV, TSV or NDJSON
+while they are read, memory use is bounded by the chunk size.
+"""
+
+import csv
+import json
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from repository.bulk import chunked, filter_in_chunks
+from repository.filters import ExperimentFilter, IndividualFilter
+from repository.models import BioSample, Experiment, Individual, SamplingEvent
+
+ITERATOR_CHUNK_SIZE = 2000
+
+# Column to value path, relative to Individual
+SAMPLE_SHEET_PATHS = {
+    "name": "name",
+    "organism": "organism__scientific_name",
+    "sex": "sex__name",
+    "sampling_event": "sampling_event__id",
+    "collection_date": "sampling_event__sampling_date",
+    "collection_time": "sampling_event__sampling_time",
+    "collection_location": "sampling_event__sampling_location",
+    "collection_country": "sampling_event__sampling_country__name",
+    "collection_latitude_dec": "sampling_event__sampling_latitude_dec",
+    "collection_longitude_dec": "sampling_event__sampling_longitude_dec",
+    "age_at_sampling": "sampling_event__age_at_sampling",
+    "ring_number": "sampling_event__ring_number",
+    "throat_phenotype": "sampling_event__throat_phenotype__label",
+    "back_color_score": "sampling_event__back_color_score__label",
+    "neck_color_score": "sampling_event__neck_color_score__label",
+    "forehead_length": "sampling_event__forehead_length",
+    "bill_length": "sampling_event__bill_length",
+    "black_above_eye": "sampling_event__black_above_eye",
+    "length_third_primary": "sampling_event__length_third_primary",
+    "wing_length": "sampling_event__wing_length",
+    "tarsus_length": "sampling_event__tarsus_length",
+    "body_mass": "sampling_event__body_mass",
+    "biosample": "sampling_event__biosample__id",
+    "tissue_type": "sampling_event__biosample__tissue_type__name",
+    "tissue_sample_box": "sampling_event__biosample__tissue_sample_box",
+    "tissue_sample_tube": "sampling_event__biosample__tissue_sample_tube",
+    "external_sample_id": "sampling_event__biosample__external_sample_id",
+    "experiment": "sampling_event__biosample__experiment__id",
+    "experiment_title": "sampling_event__biosample__experiment__title",
+    "library_strategy": "sampling_event__biosample__experiment__library_strategy",
+    "library_layout": "sampling_event__biosample__experiment__library_layout",
+    "library_selection": "sampling_event__biosample__experiment__library_selection",
+    "library_source": "sampling_event__biosample__experiment__library_source",
+    "instrument_model": (
+        "sampling_event__biosample__experiment__instrument_model__model"
+    ),
+    "file": "sampling_event__biosample__experiment__file__id",
+    "filepath": "sampling_event__biosample__experiment__file__filepath",
+    "checksum": "sampling_event__biosample__experiment__file__checksum",
+    "checksum_type": "sampling_event__biosample__experiment__file__checksum_type",
+    "filetype": "sampling_event__biosample__experiment__file__filetype",
+    "host": "sampling_event__biosample__experiment__file__host",
+}
+
+# Many-to-many column to (key column, relation descriptor, label field,
+# separator), the separators are the ones of the import sheets
+SAMPLE_SHEET_M2M = {
+    "ringer_name": ("sampling_event", SamplingEvent.ringer_name, "initials", ","),
+    "preservative": ("biosample", BioSample.preservative, "label", ";"),
+}
+
+SAMPLE_SHEET_COLUMNS = list(SAMPLE_SHEET_PATHS)
+SAMPLE_SHEET_COLUMNS.insert(
+    SAMPLE_SHEET_COLUMNS.index("ring_number") + 1, "ringer_name"
+)
+SAMPLE_SHEET_COLUMNS.insert(
+    SAMPLE_SHEET_COLUMNS.index("tissue_type") + 1, "preservative"
+)
+
+# Format to (content type, CSV delimiter), NDJSON has no delimiter
+SAMPLE_SHEET_FORMATS = {
+    "csv": ("text/csv", ","),
+    "tsv": ("text/tab-separated-values", "\t"),
+    "ndjson": ("application/x-ndjson", None),
+}
+
+
+def sample_sheet_queryset(data: Optional[Mapping] = None) -> models.QuerySet:
+    """
+    The joined sample sheet query, filtered like the list views.
+
+    Args:
+        data: Query parameters of `IndividualFilter` and `ExperimentFilter`.
+            Experiment filters restrict the rows to the matching experiments.
+
+    Returns:
+        QuerySet: Dicts with the SAMPLE_SHEET_PATHS, in lineage order.
+
+    Raises:
+        ValueError: If a filter value is invalid.
+    """
+    individuals = Individual.objects.all()
+    experiment_filter = None
+    if data:
+        individual_filter = IndividualFilter(data, queryset=individuals)
+        experiment_filter = ExperimentFilter(data, queryset=Experiment.objects.all())
+        for filterset in (individual_filter, experiment_filter):
+            if not filterset.is_valid():
+                raise ValueError(filterset.errors.as_json())
+        individuals = individual_filter.qs
+
+    if experiment_filter is not None and any(
+        data.get(name) for name in experiment_filter.filters
+    ):
+        # the selected columns reuse the join of the filter
+        individuals = individuals.filter(
+            sampling_event__biosample__experiment__in=experiment_filter.qs.values("pk")
+        )
+    queryset = individuals.values(*SAMPLE_SHEET_PATHS.values())
+    return queryset.order_by(
+        "name",
+        "sampling_event__sampling_date",
+        "sampling_event__id",
+        "sampling_event__biosample__id",
+        "sampling_event__biosample__experiment__id",
+        "sampling_event__biosample__experiment__file__id",
+    )
+
+
+def m2m_labels(descriptor, label_field: str, ids: Iterable) -> Dict[Any, list]:
+    """
+    Collect the labels of the objects linked to each of `ids`.
+
+    Args:
+        descriptor: The many-to-many descriptor, e.g. `BioSample.preservative`.
+        label_field: Field of the linked model used as label.
+        ids: Primary keys of the objects owning the relation.
+
+    Returns:
+        dict: Owner pk to the sorted labels of its linked objects.
+    """
+    through = descriptor.through
+    source = descriptor.field.m2m_field_name()
+    target = descriptor.field.m2m_reverse_field_name()
+    labels = {}
+    links = filter_in_chunks(
+        through.objects.values_list(f"{source}_id", f"{target}__{label_field}"),
+        f"{source}_id",
+        ids,
+    )
+    for owner, label in links:
+        labels.setdefault(owner, []).append(label)
+    return {owner: sorted(values) for owner, values in labels.items()}
+
+
+def sample_sheet_rows(
+    queryset: Optional[models.QuerySet] = None,
+    chunk_size: int = ITERATOR_CHUNK_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the rows of the sample sheet.
+
+    Args:
+        queryset: A `sample_sheet_queryset()`, unfiltered if not given.
+        chunk_size: Rows fetched from the cursor and resolved at once.
+
+    Yields:
+        dict: The next row, with SAMPLE_SHEET_COLUMNS.
+    """
+    if queryset is None:
+        queryset = sample_sheet_queryset()
+    values = queryset.iterator(chunk_size=chunk_size)
+    for chunk in chunked(values, chunk_size):
+        labels = {
+            column: m2m_labels(
+                descriptor,
+                label_field,
+                (row[SAMPLE_SHEET_PATHS[key]] for row in chunk),
+            )
+            for column, (key, descriptor, label_field, _) in SAMPLE_SHEET_M2M.items()
+        }
+        for row in chunk:
+            flat = {column: row[path] for column, path in SAMPLE_SHEET_PATHS.items()}
+            for column, (key, _, _, separator) in SAMPLE_SHEET_M2M.items():
+                flat[column] = separator.join(labels[column].get(flat[key], []))
+            yield {column: flat[column] for column in SAMPLE_SHEET_COLUMNS}
+
+
+class _Echo:
+    """File-like object returning what is written, for streaming `csv` output"""
+
+    def write(self, value):
+        return value
+
+
+def render_sample_sheet(rows: Iterable[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    """
+    Render sample sheet rows line by line.
+
+    Args:
+        rows: Rows as yielded by `sample_sheet_rows`.
+        fmt: One of SAMPLE_SHEET_FORMATS.
+
+    Yields:
+        str: The header line, if any, and one line per row.
+    """
+    _, delimiter = SAMPLE_SHEET_FORMATS[fmt]
+    if delimiter is None:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+        return
+    writer = csv.writer(_Echo(), delimiter=delimiter, lineterminator="\n")
+    yield writer.writerow(SAMPLE_SHEET_COLUMNS)
+    for row in rows:
+        yield writer.writerow(
+            ["" if value is None else value for value in row.values()]
+        )
@@ -1,40 +1,391 @@
+"""
+Serializers of the REST API.
+
+All serializers support sparse fieldsets and on-demand expansion through the
+query parameters of the request:
+
+- `?fields=id,filepath` renders only the listed fields, dotted names trim
+  expanded relations, e.g. `?expand=experiment&fields=id,experiment.title`.
+- `?expand=experiment.sample` replaces relations listed in
+  `expandable_fields` with their nested representation, dotted names expand
+  further down the lineage.
+
+The queryset of a ViewSet is built from the remaining fields: only their
+columns are read, expanded foreign keys are joined and expanded reverse
+relations are prefetched, see `EagerLoadingMixin.eager_queryset`.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Prefetch, QuerySet
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from .models import BioSample, Experiment, File, Individual, SamplingEvent
 
-class ExperimentSerializer(serializers.HyperlinkedModelSerializer):
+Lookup = Union[str, Prefetch]
+
+
+def prefixed(prefix: str, lookup: Lookup) -> Lookup:
+    """Move a prefetch lookup below the relation `prefix`"""
+    if isinstance(lookup, Prefetch):
+        return Prefetch(
+            f"{prefix}__{lookup.prefetch_through}",
+            queryset=lookup.queryset,
+            to_attr=lookup.to_attr,
+        )
+    return f"{prefix}__{lookup}"
+
+
+def split_paths(value: Optional[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Split a comma separated list of dotted paths.
+
+    Args:
+        value: The query parameter, e.g. "id,experiment.title".
+
+    Returns:
+        tuple: The first path components, in order, and per first component
+        the remainders of its paths.
+    """
+    names, nested = [], {}
+    for path in (value or "").split(","):
+        name, _, rest = path.strip().partition(".")
+        if not name:
+            continue
+        if name not in names:
+            names.append(name)
+        if rest:
+            nested.setdefault(name, []).append(rest)
+    return names, nested
+
+
+class EagerLoadingMixin:
+    """
+    Derive the select_related and prefetch_related lookups of a queryset from
+    the fields of a serializer, so that serializing a page of objects costs a
+    fixed number of queries.
+
+    Nested serializers are followed: single ones are joined, lists of them
+    are prefetched with their own eager queryset. Relations read by other
+    fields, e.g. by `__str__` of a `StringRelatedField`, are declared per
+    field in `select_related_fields` and `prefetch_related_fields`, columns
+    read by properties in `field_columns`.
+
+    Also implements `?fields=` and `?expand=`, see the module documentation.
+    """
+
+    select_related_fields: Dict[str, Sequence[str]] = {}
+    prefetch_related_fields: Dict[str, Sequence[Lookup]] = {}
+    field_columns: Dict[str, Sequence[str]] = {}
+    # field name to (serializer class name, keyword arguments)
+    expandable_fields: Dict[str, Tuple[str, Dict]] = {}
+
+    def __init__(
+        self,
+        *args,
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if fields is None and expand is None and request is not None:
+            fields = request.query_params.get("fields")
+            expand = request.query_params.get("expand")
+        self.sparse = bool(fields)
+        self.expanded: List[str] = []
+        self.apply_expand(*split_paths(expand), split_paths(fields)[1])
+        if fields:
+            self.apply_fields(*split_paths(fields))
+
+    def apply_expand(
+        self,
+        names: List[str],
+        nested: Dict[str, List[str]],
+        nested_fields: Dict[str, List[str]],
+    ):
+        """Replace the expanded fields with nested serializers"""
+        unknown = [name for name in names if name not in self.expandable_fields]
+        if unknown:
+            raise serializers.ValidationError(
+                {"expand": [f"Cannot expand: {', '.join(unknown)}"]}
+            )
+        self.expanded = names
+        for name in names:
+            class_name, kwargs = self.expandable_fields[name]
+            serializer_class = globals()[class_name]
+            self.fields[name] = serializer_class(
+                read_only=True,
+                fields=",".join(nested_fields.get(name, [])),
+                expand=",".join(nested.get(name, [])),
+                **kwargs,
+            )
+
+    def apply_fields(self, names: List[str], nested: Dict[str, List[str]]):
+        """Drop the fields that were not requested"""
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise serializers.ValidationError(
+                {"fields": [f"Unknown fields: {', '.join(unknown)}"]}
+            )
+        for name in nested:
+            if not isinstance(self.child_of(self.fields[name]), EagerLoadingMixin):
+                raise serializers.ValidationError(
+                    {"fields": [f"Expand {name} to select its fields"]}
+                )
+        # expanding a relation implies its field
+        keep = set(names) | set(self.expanded)
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    @staticmethod
+    def child_of(field):
+        """The serializer of a list field, otherwise the field itself"""
+        if isinstance(field, serializers.ListSerializer):
+            return field.child
+        return field
+
+    def columns(self, model: type) -> List[str]:
+        """
+        The columns read by the current fields.
+
+        Args:
+            model: The serialized model.
+
+        Returns:
+            list: Field names for `only()`, all concrete fields unless the
+            fields were trimmed and each of them maps to known columns.
+        """
+        everything = [field.name for field in model._meta.concrete_fields]
+        if not self.sparse:
+            return everything
+        columns = [model._meta.pk.name]
+        for name, field in self.fields.items():
+            if name in self.field_columns:
+                columns += self.field_columns[name]
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return everything
+            if model_field.concrete:
+                columns.append(model_field.name)
+            elif not (model_field.one_to_many or model_field.many_to_many):
+                return everything
+        return columns
+
+    def relations(
+        self, model: type, required: Sequence[str] = ()
+    ) -> Tuple[List[str], List[Lookup], List[str]]:
+        """
+        The lookups needed to serialize the current fields.
+
+        Args:
+            model: The serialized model.
+            required: Columns to read in any case, e.g. the foreign key a
+                prefetch matches on.
+
+        Returns:
+            tuple: The select_related and prefetch_related lookups and the
+            columns for `only()`.
+        """
+        select, prefetch = [], []
+        columns = self.columns(model) + list(required)
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            many = isinstance(field, serializers.ListSerializer)
+            child = self.child_of(field)
+            if not isinstance(child, EagerLoadingMixin):
+                select += self.select_related_fields.get(name, [])
+                prefetch += self.prefetch_related_fields.get(name, [])
+                continue
+            child_model = child.Meta.model
+            if many:
+                # the prefetch matches the children on their foreign key
+                relation = model._meta.get_field(field.source)
+                remote = [relation.field.name] if relation.one_to_many else []
+                queryset = child.eager_queryset(
+                    child_model.objects.all(), required=remote
+                )
+                prefetch.append(Prefetch(field.source, queryset=queryset))
+                continue
+            child_select, child_prefetch, child_columns = child.relations(child_model)
+            select.append(field.source)
+            select += [f"{field.source}__{lookup}" for lookup in child_select]
+            prefetch += [prefixed(field.source, lookup) for lookup in child_prefetch]
+            columns += [f"{field.source}__{column}" for column in child_columns]
+        return select, prefetch, columns
+
+    def eager_queryset(self, queryset: QuerySet, required: Sequence[str] = ()):
+        """
+        Restrict a queryset to the columns and relations of the current fields.
+
+        Args:
+            queryset: The queryset of the serialized model.
+            required: Columns to read in any case.
+
+        Returns:
+            QuerySet: The queryset with `only()`, joins and prefetches.
+        """
+        select, prefetch, columns = self.relations(queryset.model, required)
+        queryset = queryset.only(*columns)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class ExperimentSerializer(EagerLoadingMixin, serializers.HyperlinkedModelSerializer):
     #    file = FileSerializer()
+    expandable_fields = {
+        "sample": ("SampleSerializer", {}),
+        "file": ("FileSerializer", {"many": True}),
+    }
+
     class Meta:
         model = Experiment
         fields = ["id", "title", "library_strategy"]
 
 
-class SampleSerializer(serializers.ModelSerializer):
+class SampleSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     # experiment = ExperimentSerializer()
     # experiment = serializers.StringRelatedField(many=True, read_only=True)
-    experiment = serializers.CharField()
+    experiment = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    prefetch_related_fields = {
+        "experiment": [
+            Prefetch("experiment", queryset=Experiment.objects.only("id", "sample_id"))
+        ]
+    }
+    expandable_fields = {
+        "sampling_event": ("SamplingEventSerializer", {}),
+        "experiment": ("ExperimentSerializer", {"many": True}),
+    }
 
     class Meta:
         model = BioSample
         fields = ["id", "tissue_type", "experiment"]
 
 
-class SamplingEventSerializer(serializers.ModelSerializer):
+class SamplingEventSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     biosample = serializers.StringRelatedField(many=True, read_only=True)
 
+    # BioSample.label reads the tissue type and the date of the prefetching
+    # sampling event
+    prefetch_related_fields = {
+        "biosample": [
+            Prefetch(
+                "biosample", queryset=BioSample.objects.select_related("tissue_type")
+            )
+        ]
+    }
+    field_columns = {"biosample": ["sampling_date"]}
+    expandable_fields = {
+        "individual": ("IndividualSerializer", {}),
+        "biosample": ("SampleSerializer", {"many": True}),
+    }
+
     class Meta:
         model = SamplingEvent
         fields = ("id", "sampling_date", "sampling_location", "biosample")
 
 
-class IndividualSerializer(serializers.ModelSerializer):
-    sampling_event = SamplingEventSerializer()
+class IndividualSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    sampling_event = SamplingEventSerializer(many=True, read_only=True)
 
     class Meta:
         model = Individual
         fields = ["name", "title", "sampling_event"]
 
 
-class FileSerializer(serializers.HyperlinkedModelSerializer):
+class FileSerializer(EagerLoadingMixin, serializers.HyperlinkedModelSerializer):
+    field_columns = {"filename": ["filepath"]}
+    expandable_fields = {"experiment": ("ExperimentSerializer", {})}
+
+    class Meta:
+        model = File
+        fields = ["id", "filename", "filepath"]
+
+
+class DeferredPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Accept a primary key without fetching its object, the bulk endpoints
+    check the keys of a whole batch at once.
+    """
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, ValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class BulkWriteSerializer(serializers.ModelSerializer):
+    """
+    Validate one item of a bulk request without database queries.
+
+    Foreign keys are validated as primary key values and unique fields are
+    not checked, both are done set-wise by `repository.bulk_api.BulkWriter`.
+    """
+
+    serializer_related_field = DeferredPrimaryKeyField
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(
+            field_name, model_field
+        )
+        field_kwargs["validators"] = [
+            validator
+            for validator in field_kwargs.get("validators", [])
+            if not isinstance(validator, UniqueValidator)
+        ]
+        return field_class, field_kwargs
+
+    def get_validators(self):
+        return []
+
+
+class BioSampleWriteSerializer(BulkWriteSerializer):
+    class Meta:
+        model = BioSample
+        fields = [
+            "sampling_event",
+            "tissue_type",
+            "tissue_sample_box",
+            "tissue_sample_tube",
+            "external_sample_id",
+        ]
+
+
+class ExperimentWriteSerializer(BulkWriteSerializer):
+    class Meta:
+        model = Experiment
+        fields = [
+            "sample",
+            "title",
+            "library_strategy",
+            "library_layout",
+            "library_selection",
+            "library_source",
+            "instrument_model",
+            "design_description",
+        ]
+
+
+class FileWriteSerializer(BulkWriteSerializer):
     class Meta:
         model = File
-        fields = ["filename"]
\ No newline at end of file
+        fields = [
+            "filepath",
+            "checksum",
+            "checksum_type",
+            "host",
+            "filetype",
+            "experiment",
+        ]
@@ -0,0 +1,265 @@
+"""
+Per-model, zstandard-compressed snapshots of the `repository` app.
+
+Every model, including the auto-created many-to-many through models, is
+written to its own `<app>.<model>.jsonl.zst` stream: one JSON array of raw
+column values per row, in primary key order. Rows are read with
+`QuerySet.iterator()`, which uses a server-side cursor on PostgreSQL. A
+`manifest.json` records the columns and row count of every stream.
+
+Snapshots are consistent while the database is written to. On PostgreSQL
+they are taken with one worker process per table, all reading the same
+REPEATABLE READ snapshot exported by `pg_export_snapshot()`. On other
+backends all tables are dumped by the parent process in a single transaction.
+
+Restores load the streams of all models whose foreign key targets are already
+loaded in parallel, level by level. Every stream is restored in its own
+transaction. Rows are upserted by primary key: rows created after the
+snapshot are kept unless the tables are truncated first. SQLite does not
+support concurrent writers, on SQLite streams are restored in the parent
+process.
+"""
+
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Type
+
+import zstandard
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+
+from repository.bulk import BULK_CREATE_BATCH_SIZE, chunked
+from repository.dumps import bulk_upsert, model_load_levels, preserved_auto_now
+
+MANIFEST = "manifest.json"
+SNAPSHOT_APP = "repository"
+ITERATOR_CHUNK_SIZE = 2000
+COMPRESSION_LEVEL = 3
+
+
+def snapshot_models(app_label: str = SNAPSHOT_APP) -> List[Type[models.Model]]:
+    """The models of an app, including auto-created M2M through models"""
+    return list(apps.get_app_config(app_label).get_models(include_auto_created=True))
+
+
+def stream_name(model: Type[models.Model]) -> str:
+    return f"{model._meta.label_lower}.jsonl.zst"
+
+
+def run_tasks(func, args: List, workers: int) -> List:
+    """Run `func` for every argument, in forked worker processes if workers > 1"""
+    if workers <= 1 or len(args) <= 1:
+        return [func(*arg) for arg in args]
+    # forked workers must not share the parent's connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("fork")
+    ) as executor:
+        return list(executor.map(func, *zip(*args)))
+
+
+@contextmanager
+def exported_snapshot():
+    """
+    Hold a REPEATABLE READ transaction open on PostgreSQL and export its snapshot.
+
+    The transaction runs on a connection of its own, which outlives the
+    closing of the parent's connections before the workers are forked.
+
+    Yields:
+        str: The snapshot id for `SET TRANSACTION SNAPSHOT`.
+    """
+    holder = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        holder.set_autocommit(False)
+        with holder.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("SELECT pg_export_snapshot()")
+            (snapshot,) = cursor.fetchone()
+        yield snapshot
+    finally:
+        holder.close()
+
+
+def dump_model(
+    label: str,
+    directory: str,
+    level: int = COMPRESSION_LEVEL,
+    snapshot: Optional[str] = None,
+) -> Dict:
+    """
+    Write all rows of a model to its compressed stream.
+
+    Args:
+        label: The model label, e.g. "repository.file".
+        directory: The snapshot directory.
+        level: The zstandard compression level.
+        snapshot: A PostgreSQL snapshot id exported by `exported_snapshot`,
+            the rows are read as of that snapshot.
+
+    Returns:
+        dict: The manifest entry of the stream.
+    """
+    model = apps.get_model(label)
+    columns = [field.attname for field in model._meta.concrete_fields]
+    rows = 0
+    queryset = model._base_manager.order_by("pk").values_list(*columns)
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+        with open(os.path.join(directory, stream_name(model)), "wb") as fh:
+            compressor = zstandard.ZstdCompressor(level=level)
+            with compressor.stream_writer(fh) as writer:
+                text = io.TextIOWrapper(writer, encoding="utf-8")
+                for row in queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+                    text.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+                    rows += 1
+                text.flush()
+    return {"stream": stream_name(model), "columns": columns, "rows": rows}
+
+
+def restore_model(
+    label: str, directory: str, entry: Dict, batch_size: int = BULK_CREATE_BATCH_SIZE
+) -> int:
+    """
+    Insert the rows of a compressed stream, overwriting rows with the same pk.
+
+    Args:
+        label: The model label, e.g. "repository.file".
+        directory: The snapshot directory.
+        entry: The manifest entry of the stream.
+        batch_size: Number of rows per `bulk_create`.
+
+    Returns:
+        int: The number of restored rows.
+    """
+    model = apps.get_model(label)
+    fields = [model._meta.get_field(column) for column in entry["columns"]]
+    rows = 0
+    with open(os.path.join(directory, entry["stream"]), "rb") as fh:
+        reader = zstandard.ZstdDecompressor().stream_reader(fh)
+        lines = io.TextIOWrapper(reader, encoding="utf-8")
+        with transaction.atomic(), preserved_auto_now([model]):
+            for batch in chunked(map(json.loads, lines), batch_size):
+                bulk_upsert(
+                    model,
+                    [
+                        model(
+                            **{
+                                field.attname: field.to_python(value)
+                                for field, value in zip(fields, row)
+                            }
+                        )
+                        for row in batch
+                    ],
+                )
+                rows += len(batch)
+    return rows
+
+
+class Snapshot:
+    """
+    Take and restore per-model snapshots in a directory.
+
+    Args:
+        directory: The snapshot directory.
+        workers: Number of worker processes, defaults to the CPU count.
+    """
+
+    def __init__(self, directory: str, workers: Optional[int] = None):
+        self.directory = directory
+        self.workers = workers or os.cpu_count()
+
+    def take(
+        self, app_label: str = SNAPSHOT_APP, level: int = COMPRESSION_LEVEL
+    ) -> Dict:
+        """
+        Dump every model of an app to its own stream.
+
+        On PostgreSQL one process per table reads the same exported snapshot,
+        elsewhere all tables are read in one transaction of this process.
+
+        Returns:
+            dict: The manifest, model label to stream entry.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        labels = [model._meta.label_lower for model in snapshot_models(app_label)]
+        if connection.vendor == "postgresql":
+            with exported_snapshot() as snapshot:
+                entries = run_tasks(
+                    dump_model,
+                    list(
+                        zip(
+                            labels,
+                            repeat(self.directory),
+                            repeat(level),
+                            repeat(snapshot),
+                        )
+                    ),
+                    self.workers,
+                )
+        else:
+            with transaction.atomic():
+                entries = [dump_model(label, self.directory, level) for label in labels]
+        manifest = dict(zip(labels, entries))
+        with open(os.path.join(self.directory, MANIFEST), "w") as fh:
+            json.dump(manifest, fh, indent=2)
+        return manifest
+
+    def restore(
+        self, batch_size: int = BULK_CREATE_BATCH_SIZE, truncate: bool = False
+    ) -> Dict[str, int]:
+        """
+        Load all streams of the snapshot, in parallel within each FK level.
+
+        Args:
+            batch_size: Number of rows per `bulk_create`.
+            truncate: Empty the tables of the snapshot first, so rows created
+                after the snapshot are removed. Otherwise rows are upserted by
+                primary key and newer rows are kept.
+
+        Returns:
+            dict: Number of restored rows per model label.
+        """
+        with open(os.path.join(self.directory, MANIFEST)) as fh:
+            manifest = json.load(fh)
+        if truncate:
+            tables = [apps.get_model(label)._meta.db_table for label in manifest]
+            connection.ops.execute_sql_flush(
+                connection.ops.sql_flush(no_style(), tables)
+            )
+        workers = self.workers
+        if workers > 1 and connection.vendor == "sqlite":
+            print("SQLite does not support concurrent writers, using one process")
+            workers = 1
+
+        restored = {}
+        levels = model_load_levels(apps.get_model(label) for label in manifest)
+        for level in levels:
+            labels = [model._meta.label_lower for model in level]
+            counts = run_tasks(
+                restore_model,
+                [
+                    (label, self.directory, manifest[label], batch_size)
+                    for label in labels
+                ],
+                workers,
+            )
+            restored.update(zip(labels, counts))
+
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [model for level in levels for model in level]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        return restored
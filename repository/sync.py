@@ -0,0 +1,318 @@
+"""
+Row-hash diff synchronisation between two configured databases.
+
+Every model of the `repository` app is read from the source and the target
+database in primary key ordered chunks, keyset paginated so each chunk is a
+single indexed range scan. Each row is reduced to a hash of its column values
+and only the rows whose hashes differ are written: missing and changed rows
+are upserted, rows that no longer exist in the source are deleted, all in
+bulk. Hashes are computed in Python from the values the ORM returns, so the
+source and the target can use different backends, e.g. SQLite and PostgreSQL.
+
+Rows are matched by primary key. The auto-increment ids of many-to-many
+through rows are not part of the data, their rows are matched by the pair of
+linked objects instead.
+
+All writes happen in one transaction on the target. Stale rows are deleted
+first, children before their parents, then the changed rows are upserted,
+parents first. Foreign key constraints are deferred until the commit, rows
+are therefore deleted without cascading and the final state only has to be
+consistent as a whole, e.g. when a row is re-linked to a new parent.
+"""
+
+import hashlib
+import json
+from typing import Dict, Iterator, List, Tuple, Type
+
+from django.core.management.color import no_style
+from django.db import connections, models, transaction
+
+from repository.bulk import IN_QUERY_CHUNK_SIZE
+from repository.dumps import bulk_upsert, model_load_levels, preserved_auto_now
+from repository.snapshots import SNAPSHOT_APP, snapshot_models
+
+DIGEST_SIZE = 16
+SYNC_ACTIONS = ["inserted", "updated", "deleted"]
+
+
+def row_digest(values: Tuple, json_columns: Tuple[int, ...] = ()) -> bytes:
+    """
+    Hash the column values of a row.
+
+    JSON values are serialised with sorted keys, PostgreSQL's `jsonb` does
+    not keep the key order. All other values are hashed by their `repr()`,
+    the ORM converts them to the same Python types on every backend.
+
+    Args:
+        values: The values as returned by `values_list()`.
+        json_columns: Positions of JSON values in `values`.
+
+    Returns:
+        bytes: The digest, equal for equal values on every backend.
+    """
+    if json_columns:
+        values = list(values)
+        for i in json_columns:
+            values[i] = json.dumps(values[i], sort_keys=True)
+    return hashlib.blake2b(repr(values).encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def key_columns(model: Type[models.Model]) -> List[str]:
+    """
+    The columns a row is matched by in both databases.
+
+    Args:
+        model: The model.
+
+    Returns:
+        list: The pk column, or the linked object columns of an auto-created
+        many-to-many through model.
+    """
+    if model._meta.auto_created:
+        return [
+            field.attname
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+    return [model._meta.pk.attname]
+
+
+def json_positions(model: Type[models.Model], columns: List[str]) -> Tuple[int, ...]:
+    """Positions of the JSON fields of a model in `columns`"""
+    return tuple(
+        i
+        for i, column in enumerate(columns)
+        if isinstance(model._meta.get_field(column), models.JSONField)
+    )
+
+
+def data_columns(model: Type[models.Model]) -> List[str]:
+    """The columns compared between the databases, key columns first"""
+    keys = key_columns(model)
+    return keys + [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname not in keys and not model._meta.auto_created
+    ]
+
+
+class DatabaseSync:
+    """
+    Make the repository tables of a target database equal to a source.
+
+    Args:
+        source: Alias of the database that is read from.
+        target: Alias of the database that is written to.
+        chunk_size: Number of rows compared and written at once.
+        dry_run: Only count the differences, do not write them.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        target: str,
+        chunk_size: int = IN_QUERY_CHUNK_SIZE,
+        dry_run: bool = False,
+    ):
+        if source == target:
+            raise ValueError("The source and the target database must differ")
+        self.source = source
+        self.target = target
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.changes: Dict[str, Dict[str, int]] = {}
+
+    def run(self, app_label: str = SNAPSHOT_APP) -> Dict[str, Dict[str, int]]:
+        """
+        Synchronise all models of an app, including M2M through models.
+
+        Returns:
+            dict: Per model label, the number of inserted, updated and
+            deleted rows.
+        """
+        ordered = [
+            model
+            for level in model_load_levels(snapshot_models(app_label))
+            for model in level
+        ]
+        with transaction.atomic(using=self.target), preserved_auto_now(ordered):
+            # Deleting first frees unique values taken by rows that are
+            # replaced under a different pk. Children go first, so only rows
+            # re-linked by the upsert still reference a deleted row.
+            for model in reversed(ordered):
+                self.delete_stale(model)
+            for model in ordered:
+                self.upsert_changed(model)
+            if not self.dry_run:
+                self.reset_sequences(ordered)
+        return self.changes
+
+    def model_changes(self, model: Type[models.Model]) -> Dict[str, int]:
+        """The inserted, updated and deleted row counters of a model"""
+        return self.changes.setdefault(
+            model._meta.label_lower, dict.fromkeys(SYNC_ACTIONS, 0)
+        )
+
+    def delete_stale(self, model: Type[models.Model]):
+        """Delete the rows of a model missing in the source"""
+        changes = self.model_changes(model)
+        for stale in self.stale_chunks(model):
+            changes["deleted"] += len(stale)
+            if not self.dry_run:
+                self.delete(model, stale)
+
+    def upsert_changed(self, model: Type[models.Model]):
+        """Insert the missing rows of a model and update the changed ones"""
+        changes = self.model_changes(model)
+        for inserted, updated in self.changed_chunks(model):
+            changes["inserted"] += len(inserted)
+            changes["updated"] += len(updated)
+            if not self.dry_run:
+                self.write(model, inserted, updated)
+
+    def chunks(
+        self, alias: str, model: Type[models.Model], columns: List[str]
+    ) -> Iterator[List[Tuple]]:
+        """
+        Read all rows of a model in pk order, keyset paginated.
+
+        Args:
+            alias: The database alias.
+            model: The model.
+            columns: The columns to read after the pk.
+
+        Yields:
+            list: The next chunk of rows.
+        """
+        pk = model._meta.pk.attname
+        columns = [pk] + columns
+        queryset = model._base_manager.using(alias).order_by(pk)
+        last = None
+        while True:
+            page = queryset if last is None else queryset.filter(pk__gt=last)
+            rows = list(page.values_list(*columns)[: self.chunk_size])
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def lookup(
+        self,
+        alias: str,
+        model: Type[models.Model],
+        keys: List[Tuple],
+        columns: List[str],
+    ) -> Dict[Tuple, Tuple]:
+        """
+        Fetch the rows of a model with the given keys.
+
+        Args:
+            alias: The database alias.
+            model: The model.
+            keys: Key column values, see `key_columns`.
+            columns: The columns to read, starting with the key columns.
+
+        Returns:
+            dict: Key to row of the rows that exist.
+        """
+        width = len(key_columns(model))
+        wanted = set(keys)
+        rows = (
+            model._base_manager.using(alias)
+            .filter(**{f"{columns[0]}__in": {key[0] for key in keys}})
+            .values_list(*columns)
+        )
+        found = {}
+        for row in rows:
+            key = row[:width]
+            if key in wanted:
+                found[key] = row
+        return found
+
+    def stale_chunks(self, model: Type[models.Model]) -> Iterator[List]:
+        """
+        Compare the keys of the target with the source chunk by chunk.
+
+        Yields:
+            list: Target pks of the next chunk whose keys are not in the source.
+        """
+        columns = key_columns(model)
+        for rows in self.chunks(self.target, model, columns):
+            keyed = {row[1:]: row[0] for row in rows}
+            existing = self.lookup(self.source, model, list(keyed), columns)
+            stale = [pk for key, pk in keyed.items() if key not in existing]
+            if stale:
+                yield stale
+
+    def changed_chunks(
+        self, model: Type[models.Model]
+    ) -> Iterator[Tuple[List[Tuple], List[Tuple]]]:
+        """
+        Compare the source with the target chunk by chunk.
+
+        Yields:
+            tuple: The source rows of the next chunk missing in the target and
+            those whose hashes differ.
+        """
+        width = len(key_columns(model))
+        columns = data_columns(model)
+        json_columns = json_positions(model, columns)
+        for rows in self.chunks(self.source, model, columns):
+            keyed = {row[1 : 1 + width]: row for row in rows}
+            existing = self.lookup(self.target, model, list(keyed), columns)
+            inserted, updated = [], []
+            for key, row in keyed.items():
+                if key not in existing:
+                    inserted.append(row)
+                elif row_digest(existing[key], json_columns) != row_digest(
+                    row[1:], json_columns
+                ):
+                    updated.append(row)
+            if inserted or updated:
+                yield inserted, updated
+
+    def write(
+        self, model: Type[models.Model], inserted: List[Tuple], updated: List[Tuple]
+    ):
+        """Upsert source rows into the target"""
+        columns = data_columns(model)
+        if model._meta.auto_created:
+            # through rows only consist of their key, the target assigns the id
+            model._base_manager.using(self.target).bulk_create(
+                [model(**dict(zip(columns, row[1:]))) for row in inserted],
+                ignore_conflicts=True,
+            )
+            return
+        bulk_upsert(
+            model,
+            [model(**dict(zip(columns, row[1:]))) for row in inserted + updated],
+            using=self.target,
+        )
+
+    def delete(self, model: Type[models.Model], pks: List):
+        """
+        Delete target rows by pk in one statement, without cascading.
+
+        `QuerySet.delete()` is not used, its collector refuses to delete a row
+        still referenced through a PROTECT foreign key even if the reference
+        is re-linked later in the same sync, e.g. the sampling events of a
+        renamed individual. The deferred constraints check the final state.
+        """
+        connection = connections[self.target]
+        quote = connection.ops.quote_name
+        pk = model._meta.pk
+        sql = "DELETE FROM {} WHERE {} IN ({})".format(
+            quote(model._meta.db_table),
+            quote(pk.column),
+            ", ".join(["%s"] * len(pks)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [pk.get_db_prep_value(key, connection) for key in pks])
+
+    def reset_sequences(self, models_: List[Type[models.Model]]):
+        """Move auto-increment sequences of the target past the synced pks"""
+        connection = connections[self.target]
+        statements = connection.ops.sequence_reset_sql(no_style(), models_)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -24,7 +24,7 @@ class ExperimentTable(tables.Table):
         verbose_name="Individual Name",
     )
     file = tables.Column(
-        accessor=A("file.count"),
+        accessor="file_count",
         verbose_name="# Files")
     experiment = tables.Column(accessor="id", linkify=True, verbose_name="Experiment")
 
@@ -62,7 +62,8 @@ class IndividualTable(tables.Table):
     # )
 
     sampling_events = tables.ManyToManyColumn(
-        accessor="sampling_event__sampling_date",
+        accessor="sampling_event",
+        transform=lambda event: event.sampling_date,
         verbose_name="Samples"
     )
     class Meta:
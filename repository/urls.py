@@ -5,6 +5,12 @@ from rest_framework import routers, serializers, viewsets
 
 from .models import BioSample, Experiment, File, Individual, SamplingEvent
 from .serializers import IndividualSerializer, SampleSerializer, FileSerializer, SamplingEventSerializer, ExperimentSerializer
+from .serializers import (
+    BioSampleWriteSerializer,
+    ExperimentWriteSerializer,
+    FileWriteSerializer,
+)
+from .bulk_api import BulkCreateMixin, ResolveView
 from . import views
 
 app_name = "repository"
@@ -13,29 +19,39 @@ app_name = "repository"
 
 
 # ViewSets define the view behavior.
-class IndividualViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+class RepositoryViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+    def get_queryset(self):
+        # load the relations the serializer reads along with each page
+        return self.get_serializer().eager_queryset(super().get_queryset())
+
+
+class IndividualViewSet(RepositoryViewSet):
     queryset = Individual.objects.all()
     serializer_class = IndividualSerializer
 
 
-class BioSampleViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+class BioSampleViewSet(BulkCreateMixin, RepositoryViewSet):
     queryset = BioSample.objects.all()
     serializer_class = SampleSerializer
+    bulk_serializer_class = BioSampleWriteSerializer
 
 
-class FileViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+class FileViewSet(BulkCreateMixin, RepositoryViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
+    bulk_serializer_class = FileWriteSerializer
+    natural_keys = ["checksum", "filepath"]
 
 
-class SamplingEventViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+class SamplingEventViewSet(RepositoryViewSet):
     queryset = SamplingEvent.objects.all()
     serializer_class = SamplingEventSerializer
 
 
-class ExperimentViewSet(LoginRequiredMixin, viewsets.ModelViewSet):
+class ExperimentViewSet(BulkCreateMixin, RepositoryViewSet):
     queryset = Experiment.objects.all()
     serializer_class = ExperimentSerializer
+    bulk_serializer_class = ExperimentWriteSerializer
 
 
 # Routers provide an easy way of automatically determining the URL conf.
@@ -59,11 +75,17 @@ urlpatterns = [
     path("file/<str:pk>/", views.FileView.as_view(), name="file"),
     path("sample/<str:pk>/", views.SampleView.as_view(), name="sample"),
     re_path(
-        "individual/(?P<name>[A-Za-z-0-9_]+)/",
+        r"^individual/(?P<name>[A-Za-z-0-9_]+)/$",
         views.IndividualView.as_view(),
         name="individual",
     ),
     path("sample/<str:sample_id>/modify", views.modify_sample, name="modify_sample"),
+    path(
+        "export/sample_sheet.<str:format>",
+        views.SampleSheetExportView.as_view(),
+        name="sample_sheet_export",
+    ),
+    path("api/resolve/", ResolveView.as_view(), name="resolve"),
     path("api/", include(router.urls)),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
 ]
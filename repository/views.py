@@ -1,5 +1,11 @@
+from django.db.models import Count, Prefetch
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
 from django.urls import reverse
 from django.views import View
@@ -10,9 +16,17 @@ from django_filters.views import FilterView
 from django_filters import rest_framework as filters
 
 
-from .models import BioSample, File, Experiment, Individual
+from .models import BioSample, File, Experiment, Individual, SamplingEvent
 from .filters import ExperimentFilter, IndividualFilter
+from .pagination import KeysetPaginationMixin
+from .sample_sheet import (
+    SAMPLE_SHEET_FORMATS,
+    render_sample_sheet,
+    sample_sheet_queryset,
+    sample_sheet_rows,
+)
 from .tables import ExperimentTable, IndividualTable
+from .xlsx import XlsxExportMixin
 
 
 from typing import Any, List
@@ -34,20 +48,24 @@ class GettingStartedView(LoginRequiredMixin, TemplateView):
     template_name = "repository/get_started.html"
 
 
-class SampleListView(LoginRequiredMixin, ListView):
+class SampleListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
-    View for listing all samples.
+    View for listing all samples, one page at a time.
     """
 
     template_name = "repository/list_samples.html"
     context_object_name = "all_samples_list"
+    # covered by the (sampling_event, id) index of BioSample
+    keyset_fields = ("sampling_event_id", "id")
 
     def get_queryset(self) -> List[Any]:
-        """Return all samples ordered by sampling event."""
-        return BioSample.objects.order_by("sampling_event")
+        """Return all samples with the relations of their labels."""
+        return BioSample.objects.select_related("tissue_type", "sampling_event")
 
 
-class IndividualListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class IndividualListView(
+    LoginRequiredMixin, XlsxExportMixin, SingleTableMixin, FilterView
+):
     """
     View for listing all individuals.
     """
@@ -58,16 +76,30 @@ class IndividualListView(LoginRequiredMixin, SingleTableMixin, FilterView):
 
     model = Individual
     table_class = IndividualTable
+    export_name = "individuals"
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = IndividualFilter
 
     def get_queryset(self) -> List[Any]:
-        """Return all individuals."""
-        return Individual.objects.all()
+        """
+        Return all individuals with the relations shown in the table.
+
+        Sampling dates are prefetched for all individuals of a page at once.
+        """
+        return Individual.objects.select_related("organism", "sex").prefetch_related(
+            Prefetch(
+                "sampling_event",
+                queryset=SamplingEvent.objects.only(
+                    "id", "individual_id", "sampling_date"
+                ).order_by("sampling_date"),
+            )
+        )
 
 
-class ExperimentListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class ExperimentListView(
+    LoginRequiredMixin, XlsxExportMixin, SingleTableMixin, FilterView
+):
     """
     View for listing all experiments.
     """
@@ -77,22 +109,32 @@ class ExperimentListView(LoginRequiredMixin, SingleTableMixin, FilterView):
 
     model = Experiment
     table_class = ExperimentTable
+    export_name = "experiments"
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = ExperimentFilter
 
     def get_queryset(self) -> List[Any]:
-        """Return all experiments."""
-        return Experiment.objects.all()
+        """
+        Return all experiments with the relations shown in the table.
+
+        The file count is annotated so that it can be sorted in SQL.
+        """
+        return Experiment.objects.select_related(
+            "sample__sampling_event__individual",
+            "sample__sampling_event__sampling_country",
+        ).annotate(file_count=Count("file"))
 
 
-class FileListView(LoginRequiredMixin, ListView):
+class FileListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
-    View for listing all files.
+    View for listing all files, one page at a time.
     """
 
     template_name = "repository/list_files.html"
     context_object_name = "all_files_list"
+    # unique and indexed
+    keyset_fields = ("filepath",)
 
     def get_queryset(self) -> List[Any]:
         """Return all files."""
@@ -104,8 +146,23 @@ class SampleView(LoginRequiredMixin, DetailView):
     View for displaying a sample.
     """
 
-    model = BioSample
     template_name = "repository/sample.html"
+    context_object_name = "sample"
+    queryset = BioSample.objects.select_related(
+        "sampling_event__individual__organism",
+        "sampling_event__individual__sex",
+        "sampling_event__sampling_country",
+        "sampling_event__throat_phenotype",
+        "sampling_event__back_color_score",
+        "sampling_event__neck_color_score",
+        "tissue_type",
+    ).prefetch_related(
+        "preservative",
+        Prefetch(
+            "experiment", queryset=Experiment.objects.select_related("instrument_model")
+        ),
+        "experiment__file",
+    )
 
 
 class IndividualView(LoginRequiredMixin, View):
@@ -127,7 +184,26 @@ class IndividualView(LoginRequiredMixin, View):
         """
         # Get the arbitrary string from the URL parameters
         name = kwargs.get("name")
-        individual = get_object_or_404(Individual, name=name)
+        individual = get_object_or_404(
+            Individual.objects.select_related("organism", "sex").prefetch_related(
+                Prefetch(
+                    "sampling_event",
+                    queryset=SamplingEvent.objects.select_related(
+                        "sampling_country",
+                        "throat_phenotype",
+                        "back_color_score",
+                        "neck_color_score",
+                    ).order_by("sampling_date", "id"),
+                ),
+                Prefetch(
+                    "sampling_event__biosample",
+                    queryset=BioSample.objects.select_related("tissue_type"),
+                ),
+                "sampling_event__biosample__preservative",
+                "sampling_event__biosample__experiment__file",
+            ),
+            name=name,
+        )
 
         return render(request, "repository/individual.html", {"individual": individual})
 
@@ -152,7 +228,14 @@ class ExperimentView(LoginRequiredMixin, View):
         # Get the arbitrary string from the URL parameters
         id = kwargs.get("id")
 
-        experiment = get_object_or_404(Experiment, id=id)
+        experiment = get_object_or_404(
+            Experiment.objects.select_related(
+                "sample__sampling_event__individual",
+                "sample__tissue_type",
+                "instrument_model",
+            ).prefetch_related("file"),
+            id=id,
+        )
         return render(request, "repository/experiment.html", {"experiment": experiment})
 
 
@@ -174,12 +257,53 @@ class FileView(LoginRequiredMixin, View):
             HTTP response with the rendered file template.
         """
         # Get the arbitrary string from the URL parameters
-        id = kwargs.get("id")
+        id = kwargs.get("pk")
 
-        file = get_object_or_404(File, id=id)
+        file = get_object_or_404(
+            File.objects.select_related(
+                "experiment__sample__sampling_event__individual"
+            ),
+            id=id,
+        )
         return render(request, "repository/file.html", {"file": file})
 
 
+class SampleSheetExportView(LoginRequiredMixin, View):
+    """
+    View streaming the flattened sample sheet as CSV, TSV or NDJSON.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests for the sample sheet export.
+
+        Args:
+            request: The HTTP request, its query parameters are applied as
+                `IndividualFilter` and `ExperimentFilter` filters.
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments, `format` is one of
+                SAMPLE_SHEET_FORMATS.
+
+        Returns:
+            Streaming HTTP response with the sample sheet as attachment.
+        """
+        fmt = kwargs.get("format")
+        if fmt not in SAMPLE_SHEET_FORMATS:
+            raise Http404(f"Unknown sample sheet format {fmt}")
+        try:
+            queryset = sample_sheet_queryset(request.GET)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e), content_type="application/json")
+
+        content_type, _ = SAMPLE_SHEET_FORMATS[fmt]
+        response = StreamingHttpResponse(
+            render_sample_sheet(sample_sheet_rows(queryset), fmt),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="sample_sheet.{fmt}"'
+        return response
+
+
 def modify_sample(request, sample_id):
     sample = get_object_or_404(BioSample, pk=sample_id)
     print(sample)
@@ -191,7 +315,7 @@ def modify_sample(request, sample_id):
             request,
             "repository/sample.html",
             {
-                "Sample": sample,
+                "sample": sample,
                 "error_message": "You didn't select a choice.",
             },
         )
@@ -132,9 +132,18 @@ REST_FRAMEWORK = {
     # or allow read-only access for unauthenticated users.
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
-    ]
+    ],
+    # Cursor pagination on the primary key, see repository.pagination
+    "DEFAULT_PAGINATION_CLASS": "repository.pagination.RepositoryCursorPagination",
+    "PAGE_SIZE": 100,
 }
 
+# Upper bound of the ?page_size= of the API endpoints
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 1000))
+
+# Upper bound of the keys per request of the resolve endpoint
+API_MAX_RESOLVE_KEYS = int(os.environ.get("API_MAX_RESOLVE_KEYS", 50000))
+
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = "/"
 
@@ -151,4 +160,15 @@ DJANGO_TABLES2_TABLE_ATTRS = {
     'thead': {
         'class': 'table-light',
     },
-}
\ No newline at end of file
+}
+# Import throughput summaries (see repository/import_metrics.py)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "repository.import_metrics": {"handlers": ["console"], "level": "INFO"},
+    },
+}
@@ -1,3 +1,9 @@
 from .base import *  # noqa: F403 F401
 
 DEBUG = True
+
+# Second database, e.g. a local copy of production to `manage.py sync_databases`
+DATABASES["sync"] = {  # noqa: F405
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": BASE_DIR / "db.sync.sqlite3",  # noqa: F405
+}
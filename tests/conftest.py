@@ -0,0 +1,164 @@
+import pandas as pd
+import pytest
+from django.core.cache import cache
+
+from repository.models import (
+    BioSample,
+    Experiment,
+    File,
+    Instrument,
+    SamplingEvent,
+    Tissue,
+    TissuePreservative,
+)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-perf-baseline",
+        action="store_true",
+        help="Record the query counts and latencies of the performance suite "
+        "as the new baseline instead of comparing against it.",
+    )
+
+
+@pytest.fixture
+def vocabulary(db):
+    """Vocabulary the importers expect to exist before a sheet is loaded."""
+    Tissue.objects.create(name="whole blood", description="")
+    for label in ["EtOH", "FTA", "QLB"]:
+        TissuePreservative.objects.create(label=label, description="")
+    Instrument.objects.create(platform="Illumina", model="NovaSeq 6000")
+
+
+def make_sheets(n_individuals, offset=0):
+    """Build sample, experiment and file sheets for `n_individuals` birds."""
+    names = [f"OE{offset + i:05d}" for i in range(n_individuals)]
+    samples = pd.DataFrame(
+        {
+            "name": names,
+            "organism": "Oenanthe oenanthe",
+            "sex": ["male", "female"] * (n_individuals // 2)
+            + ["male"] * (n_individuals % 2),
+            "collection_country": "Switzerland",
+            "collection_location": "Sempach",
+            "collection_date": "12/05/2021",
+            "collection_time": "10:00",
+            "collection_latitude": None,
+            "collection_longitude": None,
+            "collection_latitude_dec": 47.1234567891,
+            "collection_longitude_dec": 8.1234,
+            "throat_phenotype": "black",
+            "back_color_score": None,
+            "neck_color_score": "white",
+            "forehead_length": 10.5,
+            "bill_length": 15.25,
+            "black_above_eye": 1,
+            "length_third_primary": 80,
+            "wing_length": 95.5,
+            "tarsus_length": 25,
+            "body_mass": 22.3,
+            "projection_first_primary_over_primary_coverts": None,
+            "picture_ids": None,
+            "ring_number": [f"R{offset + i}" for i in range(n_individuals)],
+            "ringer_name": "AB,CD",
+            "preservative": "EtOH;FTA",
+            "external_collection_name": None,
+            "tissue_sample_box": "Box1",
+            "tissue_sample_tube": [str(i) for i in range(n_individuals)],
+            "external_sample_id": None,
+        }
+    )
+    experiments = pd.DataFrame(
+        {
+            "individual": names,
+            "tissue_type": "whole blood",
+            "instrument_model": "NovaSeq 6000",
+            "platform": "Illumina",
+            "library_strategy": "WGS",
+            "library_layout": "PAIRED",
+            "library_selection": "RANDOM",
+            "library_source": "GENOMIC",
+            "design_description": "",
+            "i7": "AAA",
+            "i5": "CCC",
+            "date_extraction": None,
+            "dilution": None,
+        }
+    )
+    files = pd.DataFrame(
+        {
+            "sample_name": names * 2,
+            "filepath": [
+                f"/data/{name}_R{read}.fastq.gz" for read in (1, 2) for name in names
+            ],
+            "checksum": [f"{name}{read}" for read in (1, 2) for name in names],
+            "checksum_type": "MD5",
+            "host": "EULER",
+            "filetype": "fastq",
+        }
+    )
+    return {"samples": samples, "experiments": experiments, "files": files}
+
+
+@pytest.fixture
+def sheets():
+    return make_sheets
+
+
+def add_recaptures(individual, n):
+    """Sample an individual `n` more times, each with one sequenced biosample"""
+    template = individual.sampling_event.first()
+    biosample = template.biosample.first()
+    experiment = biosample.experiment.first()
+    for i in range(n):
+        event = SamplingEvent.objects.create(
+            individual=individual,
+            sampling_date=f"2022-05-{i + 1:02d}",
+            sampling_country=template.sampling_country,
+            throat_phenotype=template.throat_phenotype,
+            neck_color_score=template.neck_color_score,
+        )
+        sample = BioSample.objects.create(
+            sampling_event=event, tissue_type=biosample.tissue_type
+        )
+        sample.preservative.set(TissuePreservative.objects.all())
+        add_runs(sample, experiment, 2)
+
+
+def add_runs(biosample, template, n):
+    """Sequence a biosample `n` more times, each run with two files"""
+    for i in range(n):
+        experiment = Experiment.objects.create(
+            title=f"run {i}",
+            sample=biosample,
+            library_strategy=template.library_strategy,
+            library_layout=template.library_layout,
+            library_selection=template.library_selection,
+            library_source=template.library_source,
+            instrument_model=template.instrument_model,
+            design_description="",
+        )
+        for read in (1, 2):
+            File.objects.create(
+                filepath=f"/data/{experiment.id}_R{read}.fastq.gz",
+                checksum=f"{experiment.id}{read}",
+                checksum_type="md5",
+                experiment=experiment,
+            )
+
+
+@pytest.fixture
+def recaptures():
+    return add_recaptures
+
+
+@pytest.fixture
+def runs():
+    return add_runs
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Cached vocabulary choices must not leak between tests."""
+    cache.clear()
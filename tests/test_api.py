@@ -0,0 +1,149 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from repository.models import File, Individual
+from utils.bulk_importer import BulkImporter
+
+
+def get_json(client, url, params=None):
+    """Request an API URL, the `next` links already carry their parameters"""
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, params)
+    assert response.status_code == 200
+    return len(context), response.json()
+
+
+@pytest.mark.django_db
+def test_file_list_is_cursor_paginated(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(5))
+    url = reverse("repository:file-list")
+    pages, params = [], {"format": "json", "page_size": 3}
+    while True:
+        _, page = get_json(admin_client, url, params)
+        pages.append(page["results"])
+        if not page["next"]:
+            break
+        url, params = page["next"], None
+    assert [len(results) for results in pages] == [3, 3, 3, 1]
+    assert sorted(f["filename"] for results in pages for f in results) == sorted(
+        path.split("/")[-1] for path in File.objects.values_list("filepath", flat=True)
+    )
+    assert "count" not in page
+
+
+@pytest.mark.django_db
+def test_page_size_is_bounded(vocabulary, sheets, admin_client, settings):
+    settings.API_MAX_PAGE_SIZE = 4
+    BulkImporter().run(sheets(5))
+    _, page = get_json(
+        admin_client,
+        reverse("repository:file-list"),
+        {"format": "json", "page_size": 1000},
+    )
+    assert len(page["results"]) == 4
+
+
+@pytest.mark.django_db
+def test_deep_pages_cost_the_same(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(10))
+    url = reverse("repository:file-list")
+    first, page = get_json(admin_client, url, {"format": "json", "page_size": 2})
+    for _ in range(5):
+        deep, page = get_json(admin_client, page["next"])
+    assert deep == first
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "name", ["individual", "biosample", "samplingevent", "experiment", "file"]
+)
+def test_list_queries_do_not_grow(vocabulary, sheets, recaptures, admin_client, name):
+    url = reverse(f"repository:{name}-list")
+    BulkImporter().run(sheets(2))
+    few, _ = get_json(admin_client, url, {"format": "json"})
+    BulkImporter().run(sheets(8, offset=2))
+    for individual in Individual.objects.all()[:3]:
+        recaptures(individual, 2)
+    many, _ = get_json(admin_client, url, {"format": "json"})
+    assert many == few
+
+
+@pytest.mark.django_db
+def test_individual_nests_its_sampling_events(
+    vocabulary, sheets, recaptures, admin_client
+):
+    BulkImporter().run(sheets(1))
+    recaptures(Individual.objects.get(), 2)
+    _, page = get_json(
+        admin_client, reverse("repository:individual-list"), {"format": "json"}
+    )
+    events = page["results"][0]["sampling_event"]
+    assert len(events) == 3
+    assert all(event["biosample"] for event in events)
+    _, page = get_json(
+        admin_client, reverse("repository:biosample-list"), {"format": "json"}
+    )
+    assert all(
+        experiment.startswith("EXP_")
+        for sample in page["results"]
+        for experiment in sample["experiment"]
+    )
+
+
+@pytest.mark.django_db
+def test_individual_detail_is_served_by_the_api(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(1))
+    _, individual = get_json(
+        admin_client,
+        reverse("repository:individual-detail", args=["OE00000"]),
+        {"format": "json"},
+    )
+    assert individual["name"] == "OE00000"
+
+
+@pytest.mark.django_db
+def test_sparse_fields_read_only_their_columns(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(2))
+    with CaptureQueriesContext(connection) as context:
+        response = admin_client.get(
+            reverse("repository:file-list"), {"format": "json", "fields": "id,filepath"}
+        )
+    assert {tuple(file) for file in response.json()["results"]} == {("id", "filepath")}
+    (query,) = [
+        q["sql"] for q in context.captured_queries if "repository_file" in q["sql"]
+    ]
+    assert query.startswith(
+        'SELECT "repository_file"."id", "repository_file"."filepath" FROM'
+    )
+
+
+@pytest.mark.django_db
+def test_expand_joins_the_lineage(vocabulary, sheets, admin_client):
+    url = reverse("repository:file-list")
+    params = {
+        "format": "json",
+        "expand": "experiment.sample.sampling_event.individual",
+        "fields": "id,experiment.sample",
+    }
+    BulkImporter().run(sheets(2))
+    few, _ = get_json(admin_client, url, params)
+    BulkImporter().run(sheets(8, offset=2))
+    many, page = get_json(admin_client, url, params)
+    assert many == few
+    file = page["results"][0]
+    assert set(file) == {"id", "experiment"}
+    individual = file["experiment"]["sample"]["sampling_event"]["individual"]
+    assert individual["name"].startswith("OE")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params", [{"fields": "nope"}, {"expand": "nope"}, {"fields": "experiment.title"}]
+)
+def test_unknown_fields_are_rejected(vocabulary, admin_client, params):
+    response = admin_client.get(
+        reverse("repository:file-list"), {"format": "json", **params}
+    )
+    assert response.status_code == 400
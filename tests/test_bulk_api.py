@@ -0,0 +1,188 @@
+import json
+import math
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from repository.bulk import BULK_CREATE_BATCH_SIZE, IN_QUERY_CHUNK_SIZE
+from repository.models import BioSample, Experiment, File, Individual, Instrument
+from repository.serializers import FileWriteSerializer
+from utils.bulk_importer import BulkImporter
+
+
+def post(client, name, items, **params):
+    url = reverse(f"repository:{name}-list")
+    if params:
+        url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(url, json.dumps(items), content_type="application/json")
+    return len(context), response
+
+
+def delivery(experiment, n, prefix="run1"):
+    return [
+        {
+            "filepath": f"/data/{prefix}/{i:05d}.fastq.gz",
+            "checksum": f"{prefix}{i}",
+            "checksum_type": "md5",
+            "host": "EULER",
+            "filetype": "fastq",
+            "experiment": experiment.pk,
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.django_db
+def test_delivery_is_registered_in_a_handful_of_queries(
+    vocabulary, sheets, admin_client
+):
+    BulkImporter().run(sheets(1))
+    experiment = Experiment.objects.get()
+    queries, response = post(admin_client, "file", delivery(experiment, 5000))
+    assert response.status_code == 201
+    assert response.json()["created"] == 5000
+    assert File.objects.filter(experiment=experiment).count() == 5002
+    # SQLite limits the rows per INSERT by its bind-parameter limit
+    fields = FileWriteSerializer.Meta.fields + ["id"]
+    batch = connection.ops.bulk_batch_size(fields, [None] * BULK_CREATE_BATCH_SIZE)
+    inserts = math.ceil(5000 / min(batch, BULK_CREATE_BATCH_SIZE))
+    assert queries <= 20 + inserts
+
+
+@pytest.mark.django_db
+def test_upsert_is_idempotent(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(1))
+    experiment = Experiment.objects.get()
+    items = delivery(experiment, 3)
+    post(admin_client, "file", items)
+
+    items[1]["filepath"] = "/archive/00001.fastq.gz"
+    items.append(delivery(experiment, 4)[3])
+    _, response = post(admin_client, "file", items, upsert="true")
+    assert response.status_code == 201
+    assert [result["status"] for result in response.json()["results"]] == [
+        "unchanged",
+        "updated",
+        "unchanged",
+        "created",
+    ]
+    assert File.objects.get(checksum="run11").filepath == "/archive/00001.fastq.gz"
+
+
+@pytest.mark.django_db
+def test_failed_items_are_reported(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(1))
+    experiment = Experiment.objects.get()
+    items = delivery(experiment, 5)
+    items[1]["experiment"] = "EXP_MISSING"
+    items[2]["checksum"] = items[0]["checksum"]
+    items[3]["filepath"] = "/data/OE00000_R1.fastq.gz"
+    items[4]["filetype"] = "cram"
+    _, response = post(admin_client, "file", items)
+    assert response.status_code == 207
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created"] + ["error"] * 4
+    assert [list(result["errors"]) for result in results[1:]] == [
+        ["experiment"],
+        ["checksum"],
+        ["filepath"],
+        ["filetype"],
+    ]
+    assert File.objects.count() == 3
+
+    # different files match the checksum and the filepath of the item
+    items[3]["checksum"] = items[0]["checksum"]
+    _, response = post(admin_client, "file", items[3:4], upsert="true")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_samples_and_experiments_are_created_in_bulk(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(1))
+    sample = BioSample.objects.get()
+    _, response = post(
+        admin_client,
+        "biosample",
+        [
+            {"sampling_event": sample.sampling_event_id, "tissue_sample_tube": str(i)}
+            for i in range(3)
+        ],
+    )
+    assert response.status_code == 201
+    ids = [result["id"] for result in response.json()["results"]]
+    experiment = {
+        "title": "resequencing",
+        "library_strategy": "WGS",
+        "library_layout": "PAIRED",
+        "library_selection": "RANDOM",
+        "library_source": "GENOMIC",
+        "instrument_model": Instrument.objects.get().pk,
+        "design_description": "second library",
+    }
+    _, response = post(
+        admin_client, "experiment", [{**experiment, "sample": pk} for pk in ids]
+    )
+    assert response.status_code == 201
+    assert Experiment.objects.filter(sample__in=ids).count() == 3
+
+    _, response = post(admin_client, "experiment", [experiment], upsert="true")
+    assert response.status_code == 400
+
+
+def resolve(client, kind, keys):
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(
+            reverse("repository:resolve"),
+            json.dumps({"kind": kind, "keys": keys}),
+            content_type="application/json",
+        )
+    return len(context), response
+
+
+@pytest.mark.django_db
+def test_resolve_maps_keys_to_their_owners(
+    vocabulary, sheets, recaptures, admin_client
+):
+    BulkImporter().run(sheets(3))
+    recaptures(Individual.objects.get(name="OE00000"), 2)
+    experiment = Experiment.objects.filter(sample__sampling_event__ring_number="R1")[0]
+    experiment.external_accession.create(accession_no="ERX000001", archive="ENA")
+
+    file = File.objects.first()
+    unknown = [f"missing{i}" for i in range(5000)]
+    queries, response = resolve(
+        admin_client, "checksum", [file.checksum, file.checksum] + unknown
+    )
+    assert response.status_code == 200
+    assert response.json()["found"] == {file.checksum: file.pk}
+    assert response.json()["missing"] == unknown
+    assert queries <= 5 + math.ceil(5001 / IN_QUERY_CHUNK_SIZE)
+
+    _, response = resolve(admin_client, "filepath", [file.filepath])
+    assert response.json()["found"] == {file.filepath: file.pk}
+    _, response = resolve(admin_client, "accession_no", ["ERX000001"])
+    assert response.json()["found"] == {"ERX000001": [experiment.pk]}
+    _, response = resolve(admin_client, "ring_number", ["R0", "R2", "R9"])
+    assert response.json()["found"] == {"R0": ["OE00000"], "R2": ["OE00002"]}
+    assert response.json()["missing"] == ["R9"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "body", [{"kind": "nope", "keys": []}, {"kind": "checksum", "keys": "abc"}, []]
+)
+def test_resolve_rejects_malformed_requests(admin_client, body):
+    response = admin_client.post(
+        reverse("repository:resolve"), json.dumps(body), content_type="application/json"
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_resolve_limits_the_keys(admin_client, settings):
+    settings.API_MAX_RESOLVE_KEYS = 2
+    _, response = resolve(admin_client, "checksum", ["a", "b", "c"])
+    assert response.status_code == 400
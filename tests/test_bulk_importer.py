@@ -0,0 +1,95 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from repository.models import BioSample, Experiment, File, Individual, SamplingEvent
+from utils.bulk_importer import BulkImporter
+from utils.naive_sample_importer import main
+
+
+@pytest.mark.django_db
+def test_bulk_import_creates_lineage(vocabulary, sheets):
+    importer = BulkImporter()
+    importer.run(sheets(10))
+
+    assert importer.errors == []
+    assert Individual.objects.count() == 10
+    assert SamplingEvent.objects.count() == 10
+    assert BioSample.objects.count() == 10
+    assert Experiment.objects.count() == 10
+    assert File.objects.count() == 20
+
+    event = SamplingEvent.objects.get(individual="OE00001")
+    assert set(event.ringer_name.values_list("initials", flat=True)) == {"AB", "CD"}
+    assert str(event.sampling_latitude_dec) == "47.12345679"
+    biosample = event.biosample.get()
+    assert set(biosample.preservative.values_list("label", flat=True)) == {
+        "EtOH",
+        "FTA",
+    }
+
+
+@pytest.mark.django_db
+def test_bulk_import_is_idempotent(vocabulary, sheets):
+    BulkImporter().run(sheets(5))
+    importer = BulkImporter()
+    importer.run(sheets(5))
+
+    assert sum(importer.created.values()) == 0
+    assert File.objects.count() == 10
+
+
+@pytest.mark.django_db
+def test_bulk_import_reports_invalid_rows(vocabulary, sheets):
+    data = sheets(3)
+    data["samples"].loc[1, "wing_length"] = 12345
+    data["samples"].loc[2, "name"] = None
+    importer = BulkImporter()
+    importer.import_samples(data["samples"])
+
+    assert [error["row"] for error in importer.errors] == [2, 1]
+    assert Individual.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_import_query_count_is_independent_of_rows(vocabulary, sheets):
+    def count_queries(data):
+        with CaptureQueriesContext(connection) as context:
+            BulkImporter().run(data)
+        return len(context.captured_queries)
+
+    BulkImporter().run(sheets(1, offset=1000))
+    small = count_queries(sheets(5))
+    large = count_queries(sheets(200, offset=100))
+    # only the number of INSERT batches (bounded by SQLite's bind-parameter
+    # limit) grows with the sheet
+    assert large - small < 10
+
+
+def lineage_counts():
+    return [
+        model.objects.count()
+        for model in (Individual, SamplingEvent, BioSample, Experiment, File)
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["bulk", "parallel"])
+def test_importing_the_same_files_twice_creates_nothing(
+    vocabulary, sheets, tmp_path, capsys, mode
+):
+    argv = ["--mode", mode, "--metrics", str(tmp_path / "metrics.json")]
+    for label, df in sheets(6).items():
+        df.to_csv(tmp_path / f"{label}.csv", index=False)
+        argv.append(f"--{label}={tmp_path / f'{label}.csv'}")
+    main(argv)
+    assert lineage_counts() == [6, 6, 6, 6, 12]
+    assert BioSample.objects.filter(tissue_sample_tube="0").exists()
+    capsys.readouterr()
+
+    main(argv)
+    assert capsys.readouterr().out.splitlines()[-1] == (
+        "Created: {'Individual': 0, 'SamplingEvent': 0, 'BioSample': 0, "
+        "'Experiment': 0, 'File': 0}, failed rows: 0"
+    )
+    assert lineage_counts() == [6, 6, 6, 6, 12]
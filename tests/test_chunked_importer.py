@@ -0,0 +1,90 @@
+import pytest
+
+from repository.models import BioSample, File, ImportCheckpoint, Individual
+from utils.bulk_importer import BulkImporter
+from utils.chunked_importer import ChunkedImporter
+from utils.naive_sample_importer import main
+
+
+@pytest.fixture
+def sheet_paths(tmp_path, sheets):
+    paths = {}
+    for label, df in sheets(10).items():
+        paths[label] = str(tmp_path / f"{label}.csv")
+        df.to_csv(paths[label], index=False)
+    return paths
+
+
+@pytest.mark.django_db
+def test_chunked_import(vocabulary, sheet_paths):
+    importer = ChunkedImporter(chunk_size=3)
+    importer.run(sheet_paths)
+
+    assert importer.importer.errors == []
+    assert Individual.objects.count() == 10
+    assert File.objects.count() == 20
+    assert set(ImportCheckpoint.objects.values_list("sheet", "completed")) == {
+        ("samples", True),
+        ("experiments", True),
+        ("files", True),
+    }
+
+
+@pytest.mark.django_db
+def test_chunked_import_resumes_after_last_committed_chunk(vocabulary, sheet_paths):
+    class FailingImporter(BulkImporter):
+        def import_samples(self, df):
+            if df.index[0] >= 6:
+                raise RuntimeError("connection lost")
+            return super().import_samples(df)
+
+    with pytest.raises(RuntimeError):
+        ChunkedImporter(chunk_size=3, importer=FailingImporter()).run(sheet_paths)
+
+    assert Individual.objects.count() == 6
+    assert ImportCheckpoint.objects.get(sheet="samples").rows_done == 6
+
+    importer = ChunkedImporter(chunk_size=3)
+    importer.run(sheet_paths)
+
+    assert importer.importer.created["Individual"] == 4
+    assert Individual.objects.count() == 10
+    assert File.objects.count() == 20
+
+
+@pytest.mark.django_db
+def test_chunked_import_from_the_command_line(
+    vocabulary, sheet_paths, tmp_path, capsys
+):
+    argv = [f"--{label}={path}" for label, path in sheet_paths.items()]
+    argv += ["--mode", "chunked", "--chunk-size", "4"]
+    main(argv + ["--metrics", str(tmp_path / "metrics.json")])
+
+    committed = [
+        line for line in capsys.readouterr().out.splitlines() if "committed" in line
+    ]
+    assert committed[:3] == [
+        "samples: 4 rows committed",
+        "samples: 8 rows committed",
+        "samples: 10 rows committed",
+    ]
+    assert Individual.objects.count() == 10
+    assert ImportCheckpoint.objects.filter(completed=True).count() == 3
+
+
+@pytest.mark.django_db
+def test_chunked_import_matches_the_rows_of_a_bulk_import(
+    vocabulary, sheet_paths, tmp_path
+):
+    argv = [f"--{label}={path}" for label, path in sheet_paths.items()]
+    argv += ["--metrics", str(tmp_path / "metrics.json")]
+    main(argv + ["--mode", "bulk"])
+
+    importer = ChunkedImporter(chunk_size=4)
+    importer.run(sheet_paths)
+
+    # cells are read as text in every mode, e.g. tube "0" and not 0.0
+    assert importer.importer.errors == []
+    assert sum(importer.importer.created.values()) == 0
+    assert BioSample.objects.count() == 10
+    assert BioSample.objects.filter(tissue_sample_tube="0").exists()
@@ -0,0 +1,59 @@
+import pytest
+
+from repository.columnar import SAMPLE_SHEET_TABLE, partition_rows
+from utils.bulk_importer import BulkImporter
+
+
+def partitions(rows, bounds, size):
+    return list(partition_rows(rows, lambda row: row, bounds, size))
+
+
+def test_partition_rows_first_export():
+    assert partitions([1, 2, 3, 4, 5], [], 2) == [(2, [1, 2]), (4, [3, 4]), (None, [5])]
+    # equal keys are not split
+    assert partitions([1, 1, 1, 2], [], 2) == [(1, [1, 1, 1]), (None, [2])]
+
+
+def test_partition_rows_keeps_previous_bounds():
+    bounds = [2, 4, None]
+    # a changed middle partition does not move the others
+    assert partitions([1, 2, 3, 3.5, 4, 5], bounds, 2) == [
+        (2, [1, 2]),
+        (4, [3, 3.5, 4]),
+        (None, [5]),
+    ]
+    # empty partitions are dropped, new keys go to the open-ended one
+    assert partitions([1, 2, 5, 6, 7], bounds, 2) == [
+        (2, [1, 2]),
+        (6, [5, 6]),
+        (None, [7]),
+    ]
+    # partitions that grew to twice the size are split
+    assert partitions([1, 2, 2.1, 2.2, 2.3, 2.4, 3], bounds, 2) == [
+        (2, [1, 2]),
+        (2.4, [2.1, 2.2, 2.3, 2.4]),
+        (4, [3]),
+    ]
+
+
+@pytest.mark.django_db
+def test_columnar_export(vocabulary, sheets, tmp_path):
+    pytest.importorskip("pyarrow")
+    from repository.columnar import ColumnarExport, read_table
+    from repository.models import Individual
+
+    BulkImporter().run(sheets(4))
+    stats = ColumnarExport(str(tmp_path), partition_size=2).run()
+    assert stats["repository.file"]["rows"] == 8
+    assert stats[SAMPLE_SHEET_TABLE]["rows"] == 8
+
+    sheet = read_table(str(tmp_path), SAMPLE_SHEET_TABLE)
+    assert str(sheet["bill_length"].dtype) == "object"
+    assert sheet["organism"].dtype.name == "category"
+
+    Individual.objects.filter(name="OE00003").update(title="changed")
+    stats = ColumnarExport(str(tmp_path), partition_size=2).run()
+    assert stats["repository.individual"]["written"] == 1
+    assert stats["repository.file"]["written"] == 0
+    individuals = read_table(str(tmp_path), "repository.individual")
+    assert individuals.set_index("name").loc["OE00003", "title"] == "changed"
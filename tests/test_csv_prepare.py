@@ -0,0 +1,66 @@
+import pandas as pd
+
+from utils.csv_prepare import prepare_csvs, tissue_preservative_mapper
+
+COLUMN_RENAME_MAP = {
+    "Ring": "name",
+    "Species": "organism",
+    "Sex": "sex",
+    "preservative": "preservative",
+}
+
+
+def write_raw_csv(path, rows):
+    columns = [
+        "Ring",
+        "Species",
+        "Sex",
+        "EtOH",
+        "Thymol",
+        "FTA",
+        "QLB",
+        "RNAlater",
+        "BC-QLB",
+    ]
+    pd.DataFrame(rows, columns=columns).to_csv(path, index=False)
+    return str(path)
+
+
+def test_tissue_preservative_mapper():
+    df = pd.DataFrame(
+        {
+            "EtOH": ["yes", None, "no"],
+            "Thymol": [None, None, None],
+            "FTA": ["yes", "yes", "no"],
+            "QLB": [None, None, None],
+            "RNAlater": [None, None, None],
+            "BC-QLB": [None, "yes", None],
+        }
+    )
+    mapped = tissue_preservative_mapper(df)
+    assert mapped["preservative"].to_list() == ["EtOH;FTA", "FTA;BC-QLB", ""]
+    assert mapped.columns.to_list() == ["preservative"]
+
+
+def test_prepare_csvs(tmp_path):
+    first = write_raw_csv(
+        tmp_path / "first.csv",
+        [
+            ["A1", "O. oenanthe", "M", "yes", None, None, None, None, None],
+            ["A2", None, "female?", None, None, "yes", None, None, None],
+        ],
+    )
+    second = write_raw_csv(
+        tmp_path / "second.csv",
+        [["B1", "O. seebohmi", "unknown", None, None, None, "yes", None, None]],
+    )
+    prepared = prepare_csvs([first, second], COLUMN_RENAME_MAP, workers=2)
+    assert prepared["name"].to_list() == ["A1", "A2", "B1"]
+    assert prepared["title"].to_list() == ["A1", "A2", "B1"]
+    assert prepared["organism"].to_list() == [
+        "Oenanthe oenanthe",
+        "Unknown",
+        "Oenanthe seebohmi",
+    ]
+    assert prepared["sex"].to_list() == ["male", "female", "unknown"]
+    assert prepared["preservative"].to_list() == ["EtOH", "FTA", "QLB"]
@@ -0,0 +1,67 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from repository.models import BioSample, Experiment, File, Individual
+from utils.bulk_importer import BulkImporter
+
+# the session and the user take two queries of every page
+INDIVIDUAL_QUERIES = 8
+SAMPLE_QUERIES = 6
+EXPERIMENT_QUERIES = 4
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(context), response.content.decode()
+
+
+@pytest.mark.django_db
+def test_individual_page_queries_do_not_grow(
+    vocabulary, sheets, recaptures, admin_client
+):
+    BulkImporter().run(sheets(1))
+    individual = Individual.objects.get()
+    url = individual.get_absolute_url()
+    few, _ = count_queries(admin_client, url)
+    assert few <= INDIVIDUAL_QUERIES
+    recaptures(individual, 5)
+    many, content = count_queries(admin_client, url)
+    assert many == few
+    assert content.count("fastq.gz</a>") == 2 + 5 * 2 * 2
+    assert "EtOH, FTA" in content
+
+
+@pytest.mark.django_db
+def test_sample_page_queries_do_not_grow(vocabulary, sheets, runs, admin_client):
+    BulkImporter().run(sheets(1))
+    biosample = BioSample.objects.get()
+    url = biosample.get_absolute_url()
+    few, _ = count_queries(admin_client, url)
+    assert few <= SAMPLE_QUERIES
+    runs(biosample, biosample.experiment.get(), 5)
+    many, content = count_queries(admin_client, url)
+    assert many == few
+    assert content.count("fastq.gz</a>") == 2 + 5 * 2
+    assert "OE00000" in content
+
+
+@pytest.mark.django_db
+def test_experiment_page_queries_do_not_grow(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(1))
+    experiment = Experiment.objects.get()
+    url = experiment.get_absolute_url()
+    few, _ = count_queries(admin_client, url)
+    assert few <= EXPERIMENT_QUERIES
+    for i in range(10):
+        File.objects.create(
+            filepath=f"/data/extra_{i}.fastq.gz",
+            checksum=f"extra{i}",
+            checksum_type="md5",
+            experiment=experiment,
+        )
+    many, content = count_queries(admin_client, url)
+    assert many == few
+    assert content.count('class="collapse small"') == 12
@@ -0,0 +1,51 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from repository.dumps import iter_json_array, model_load_order
+from repository.models import BioSample, Individual, SamplingEvent
+from utils.bulk_importer import BulkImporter
+
+
+def test_iter_json_array_reads_in_small_windows():
+    objects = [
+        {"model": "repository.color", "pk": i, "fields": {"label": "[,]"}}
+        for i in range(50)
+    ]
+    fh = io.StringIO(" \n" + json.dumps(objects, indent=2))
+    assert list(iter_json_array(fh, read_size=7)) == objects
+
+
+def test_model_load_order():
+    labels = ["repository.file", "repository.individual", "repository.organism"]
+    labels += ["repository.samplingevent", "repository.biosample"]
+    labels += ["repository.experiment", "repository.instrument"]
+    order = [model._meta.label_lower for model in model_load_order(labels)]
+    assert order.index("repository.organism") < order.index("repository.individual")
+    assert order.index("repository.individual") < order.index(
+        "repository.samplingevent"
+    )
+    assert order.index("repository.biosample") < order.index("repository.experiment")
+    assert order.index("repository.experiment") < order.index("repository.file")
+
+
+@pytest.mark.django_db
+def test_stream_loaddata_restores_dumped_state(vocabulary, sheets, tmp_path):
+    BulkImporter().run(sheets(5))
+    dump = tmp_path / "dump.json"
+    call_command("dumpdata", "repository", output=str(dump))
+    before = json.loads(dump.read_text())
+
+    individual = Individual.objects.get(name="OE00001")
+    individual.title = "changed"
+    individual.save()
+    event = SamplingEvent.objects.get(individual=individual)
+    event.ringer_name.clear()
+    BioSample.objects.get(sampling_event=event).preservative.clear()
+
+    call_command("stream_loaddata", str(dump), batch_size=2, stdout=io.StringIO())
+    call_command("dumpdata", "repository", output=str(dump))
+
+    assert json.loads(dump.read_text()) == before
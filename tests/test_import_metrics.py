@@ -0,0 +1,101 @@
+import json
+
+import pytest
+import tablib
+
+from repository.import_metrics import ImportMetrics, query_category
+from repository.resources import OrganismResource
+from utils.bulk_importer import BulkImporter
+from utils.naive_sample_importer import main
+
+
+def test_query_category():
+    assert query_category('SELECT * FROM "repository_organism"') == "vocabulary"
+    assert (
+        query_category('INSERT INTO "repository_biosample_preservative" VALUES (1)')
+        == "m2m"
+    )
+    assert query_category('INSERT INTO "repository_file" VALUES (1)') == "write"
+    assert query_category('SELECT * FROM "repository_individual"') == "lookup"
+
+
+@pytest.mark.django_db
+def test_bulk_import_metrics(vocabulary, sheets, tmp_path):
+    metrics = ImportMetrics("test", profile_path=str(tmp_path / "import.prof"))
+    BulkImporter(metrics=metrics).run(sheets(10))
+    summary = metrics.report(str(tmp_path / "metrics.json"))
+
+    assert json.loads((tmp_path / "metrics.json").read_text()) == summary
+    assert (tmp_path / "import.prof").exists()
+    assert summary["rows"] == 40
+    assert set(summary["stages"]) == {"samples", "experiments", "files"}
+    samples = summary["stages"]["samples"]
+    assert samples["rows"] == 10
+    assert samples["vocabulary_queries"] > 0
+    assert samples["write_queries"] > 0
+    assert samples["m2m_queries"] > 0
+    assert samples["queries"] == sum(
+        samples[f"{category}_queries"]
+        for category in ["vocabulary", "lookup", "write", "m2m"]
+    )
+
+
+@pytest.mark.django_db
+def test_resource_import_records_slowest_rows():
+    metrics = ImportMetrics("test", slowest=2)
+    resource = OrganismResource()
+    resource.metrics = metrics
+    dataset = tablib.Dataset(
+        *[(f"Oenanthe {i}", f"wheatear {i}") for i in range(5)],
+        headers=["scientific_name", "common_name"],
+    )
+    metrics.rows = len(dataset)
+    resource.import_data(dataset, dry_run=False)
+
+    summary = metrics.summary()
+    assert summary["rows"] == 5
+    assert summary["stages"]["OrganismResource"]["rows"] == 5
+    assert len(summary["slowest_rows"]) == 2
+
+
+@pytest.mark.django_db
+def test_repeated_resource_imports_count_the_sheet_once():
+    metrics = ImportMetrics("test")
+    dataset = tablib.Dataset(
+        *[(f"Oenanthe {i}", f"wheatear {i}") for i in range(4)],
+        headers=["scientific_name", "common_name"],
+    )
+    metrics.rows = len(dataset)
+    resource = OrganismResource()
+    resource.metrics = metrics
+    # e.g. a failing block imported again in halves
+    for part in (dataset, dataset[:2], dataset[2:]):
+        resource.import_data(
+            tablib.Dataset(*part, headers=dataset.headers), dry_run=True
+        )
+
+    summary = metrics.summary()
+    assert summary["rows"] == 4
+    assert summary["stages"]["OrganismResource"]["rows"] == 8
+
+    standalone = OrganismResource()
+    standalone.import_data(dataset, dry_run=True)
+    assert standalone.active_metrics.rows == 4
+
+
+@pytest.mark.django_db
+def test_importer_writes_metrics_and_profile(vocabulary, sheets, tmp_path):
+    argv = ["--mode", "bulk"]
+    for label, df in sheets(10).items():
+        df.to_csv(tmp_path / f"{label}.csv", index=False)
+        argv.append(f"--{label}={tmp_path / f'{label}.csv'}")
+    main(
+        argv
+        + ["--metrics", str(tmp_path / "metrics.json")]
+        + ["--profile", str(tmp_path / "import.prof")]
+    )
+
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary["name"] == "naive_sample_importer bulk"
+    assert summary["rows"] == 40
+    assert (tmp_path / "import.prof").exists()
@@ -0,0 +1,85 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from repository.models import File, ImportRowHash, Individual, SamplingEvent
+from utils.incremental_importer import IncrementalImporter
+from utils.naive_sample_importer import main
+
+
+def write_sheets(tmp_path, sheets):
+    paths = {}
+    for label, df in sheets.items():
+        paths[label] = str(tmp_path / f"{label}.csv")
+        df.to_csv(paths[label], index=False)
+    return paths
+
+
+@pytest.mark.django_db
+def test_incremental_import_skips_unchanged_rows(vocabulary, sheets, tmp_path):
+    paths = write_sheets(tmp_path, sheets(10))
+    stats = IncrementalImporter().run(paths)
+
+    assert stats["samples"]["new"] == 10
+    assert stats["files"]["new"] == 20
+    assert Individual.objects.count() == 10
+    assert File.objects.count() == 20
+    assert ImportRowHash.objects.count() == 40
+
+    importer = IncrementalImporter()
+    with CaptureQueriesContext(connection) as queries:
+        stats = importer.run(paths)
+
+    assert {label: stats[label]["unchanged"] for label in stats} == {
+        "samples": 10,
+        "experiments": 10,
+        "files": 20,
+    }
+    assert sum(importer.importer.created.values()) == 0
+    # hashes, object ids and stored keys per sheet, no model work
+    assert len(queries) <= 3 * 3 + 2
+
+
+@pytest.mark.django_db
+def test_incremental_import_updates_changed_and_reports_removed_rows(
+    vocabulary, sheets, tmp_path
+):
+    data = sheets(10)
+    IncrementalImporter().run(write_sheets(tmp_path, data))
+
+    data["samples"].loc[3, "wing_length"] = 101
+    data["samples"].loc[3, "ringer_name"] = "EF"
+    data["files"].loc[0, "host"] = "archive"
+    data["files"] = data["files"].drop(index=19)
+    importer = IncrementalImporter()
+    stats = importer.run(write_sheets(tmp_path, data))
+
+    assert importer.importer.errors == []
+    assert stats["samples"]["changed"] == 1
+    assert stats["samples"]["unchanged"] == 9
+    assert stats["files"]["changed"] == 1
+    assert importer.removed["files"] == ["OE000092"]
+    assert sum(importer.importer.created.values()) == 0
+
+    event = SamplingEvent.objects.get(individual="OE00003")
+    assert event.wing_length == 101
+    assert list(event.ringer_name.values_list("initials", flat=True)) == ["EF"]
+    assert File.objects.get(checksum="OE000001").host == "archive"
+    assert File.objects.count() == 20
+
+
+@pytest.mark.django_db
+def test_incremental_import_from_the_command_line(vocabulary, sheets, tmp_path):
+    data = sheets(10)
+    paths = write_sheets(tmp_path, data)
+    argv = [f"--{label}={path}" for label, path in paths.items()]
+    argv += ["--mode", "incremental", "--metrics", str(tmp_path / "metrics.json")]
+    main(argv)
+
+    data["samples"].loc[10] = data["samples"].loc[9]
+    data["samples"].loc[10, ["name", "ring_number"]] = ["OE00010", "R10"]
+    write_sheets(tmp_path, data)
+    main(argv)
+
+    assert Individual.objects.count() == 11
+    assert ImportRowHash.objects.filter(sheet="samples").count() == 11
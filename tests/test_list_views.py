@@ -0,0 +1,131 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from repository.filters import vocabulary_choices, vocabulary_choices_key
+from repository.models import BioSample, File, Organism, Tissue
+from repository.pagination import decode_cursor
+from repository.views import FileListView, SampleListView
+from utils.bulk_importer import BulkImporter
+
+
+def count_queries(client, url, params=None):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, params or {})
+    assert response.status_code == 200
+    return len(context), response
+
+
+@pytest.mark.django_db
+def test_experiment_list_queries_do_not_grow(vocabulary, sheets, admin_client):
+    url = reverse("repository:experiments_list")
+    BulkImporter().run(sheets(2))
+    few, _ = count_queries(admin_client, url)
+    BulkImporter().run(sheets(8, offset=2))
+    many, _ = count_queries(admin_client, url)
+    assert many == few
+
+
+@pytest.mark.django_db
+def test_experiment_list_sorts_by_file_count(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(3))
+    File.objects.filter(filepath__startswith="/data/OE00001").delete()
+    _, response = count_queries(
+        admin_client, reverse("repository:experiments_list"), {"sort": "file"}
+    )
+    table = response.context["table"]
+    assert [row.get_cell_value("file") for row in table.rows] == [0, 2, 2]
+
+
+@pytest.mark.django_db
+def test_individual_list_queries_do_not_grow(vocabulary, sheets, admin_client):
+    url = reverse("repository:individual_list")
+    BulkImporter().run(sheets(2))
+    cold, _ = count_queries(admin_client, url)
+    few, _ = count_queries(admin_client, url)
+    assert few == cold - 2
+    BulkImporter().run(sheets(8, offset=2))
+    with CaptureQueriesContext(connection) as context:
+        response = admin_client.get(url)
+    assert len(context) == few
+    # the sex and organism dropdowns are served from the cache
+    assert not [
+        query
+        for query in context.captured_queries
+        if 'FROM "repository_samplesex"' in query["sql"]
+        or 'FROM "repository_organism"' in query["sql"]
+    ]
+    table = response.context["table"]
+    assert [row.get_cell_value("sampling_events") for row in table.rows][0] == (
+        "2021-05-12"
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_imported_vocabulary_shows_up_in_the_dropdowns(vocabulary, sheets):
+    choices = vocabulary_choices(Organism)
+    assert choices() == []
+    data = sheets(1)
+    data["samples"]["organism"] = "Oenanthe pleschanka"
+    BulkImporter().run(data)
+    assert [pk for pk, _ in choices()] == [
+        Organism.objects.get(scientific_name="Oenanthe pleschanka").pk
+    ]
+
+    # saving other models keeps the cached choices
+    Tissue.objects.create(name="feather", description="")
+    assert cache.get(vocabulary_choices_key(Organism)) is not None
+
+
+@pytest.mark.django_db
+def test_file_list_pages_forward_and_back(
+    vocabulary, sheets, admin_client, monkeypatch
+):
+    monkeypatch.setattr(FileListView, "paginate_by", 3)
+    url = reverse("repository:files_list")
+    BulkImporter().run(sheets(4))
+    pages, params = [], {}
+    while True:
+        _, response = count_queries(admin_client, url, params)
+        page = response.context["page_obj"]
+        pages.append([file.filepath for file in page])
+        if not page.has_next():
+            break
+        params = {"after": page.next_cursor}
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert sum(pages, []) == sorted(File.objects.values_list("filepath", flat=True))
+
+    _, response = count_queries(
+        admin_client, url, {"before": response.context["page_obj"].previous_cursor}
+    )
+    assert [file.filepath for file in response.context["page_obj"]] == pages[1]
+    assert response.context["page_obj"].has_previous()
+
+
+@pytest.mark.django_db
+def test_sample_list_page_queries_do_not_grow(
+    vocabulary, sheets, admin_client, monkeypatch
+):
+    monkeypatch.setattr(SampleListView, "paginate_by", 2)
+    url = reverse("repository:samples_list")
+    BulkImporter().run(sheets(3))
+    first, response = count_queries(admin_client, url)
+    cursor = response.context["page_obj"].next_cursor
+    BulkImporter().run(sheets(8, offset=3))
+    deep, response = count_queries(admin_client, url, {"after": cursor})
+    assert deep == first
+    last = tuple(decode_cursor(cursor, 2))
+    after = [
+        sample
+        for sample in BioSample.objects.order_by("sampling_event_id", "id")
+        if (sample.sampling_event_id, sample.id) > last
+    ]
+    assert list(response.context["page_obj"]) == after[:2]
+
+
+@pytest.mark.django_db
+def test_invalid_cursor_is_not_found(admin_client):
+    response = admin_client.get(reverse("repository:files_list"), {"after": "nope"})
+    assert response.status_code == 404
@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+from django.db import connection
+
+from repository.models import File, Individual
+from utils.naive_sample_importer import build_parser
+from utils.parallel_importer import ParallelImporter, partition_of, split_by_key
+
+
+def test_split_by_key_keeps_keys_together(sheets):
+    samples = sheets(50)["samples"]
+    samples = samples.loc[list(samples.index) * 2]
+    parts = split_by_key(samples, "name", 4)
+
+    assert sum(len(part) for part in parts) == 100
+    names = [set(part["name"]) for part in parts]
+    assert all(a.isdisjoint(b) for i, a in enumerate(names) for b in names[i + 1 :])
+    # crc32 of the names is stable, so are the partitions
+    assert [len(part) for part in parts] == [24, 26, 24, 26]
+    assert {"OE00004", "OE00006"} <= names[0] and {"OE00000", "OE00002"} <= names[1]
+
+
+@pytest.mark.django_db
+def test_parallel_import_merges_partitions(vocabulary, sheets):
+    data = sheets(20)
+    data["files"].loc[39, "checksum"] = data["files"].loc[0, "checksum"]
+    importer = ParallelImporter(workers=1)
+    importer.run(data)
+
+    assert Individual.objects.count() == 20
+    assert File.objects.count() == 39
+    assert importer.errors == [
+        {
+            "sheet": "files",
+            "row": 39,
+            "reason": "duplicate checksum or filepath /data/OE00019_R2.fastq.gz "
+            "in sheet",
+        }
+    ]
+
+
+@pytest.mark.django_db
+def test_parallel_import_merges_results_and_errors_of_all_partitions(
+    vocabulary, sheets
+):
+    data = sheets(20)
+    # bad rows of individuals in different partitions
+    assert partition_of("OE00003", 3) != partition_of("OE00007", 3)
+    data["samples"].loc[[3, 7], "wing_length"] = 12345
+    data["files"].loc[[5, 6], "checksum"] = None
+    importer = ParallelImporter(workers=1, partitions=3)
+    importer.run(data)
+
+    assert importer.created == {
+        "Individual": 18,
+        "SamplingEvent": 18,
+        "BioSample": 18,
+        "Experiment": 18,
+        "File": 34,
+    }
+    errors = [(error["sheet"], error["row"]) for error in importer.errors]
+    assert errors == sorted(errors)
+    assert ("samples", 3) in errors and ("samples", 7) in errors
+    # rows missing a key fail on the missing value, not as duplicates
+    reasons = {
+        error["row"]: error["reason"]
+        for error in importer.errors
+        if error["sheet"] == "files"
+    }
+    assert reasons[5] == reasons[6] == "missing checksum"
+
+
+@pytest.fixture
+def file_database(transactional_db, tmp_path):
+    """
+    Point the default connection at a file copy of the test database.
+
+    Forked workers cannot share the in-memory one, the in-memory connection is
+    kept aside and restored afterwards.
+    """
+    connection.ensure_connection()
+    memory, name = connection.connection, connection.settings_dict["NAME"]
+    target = sqlite3.connect(tmp_path / "db.sqlite3")
+    memory.backup(target)
+    target.close()
+    connection.connection = None
+    connection.settings_dict["NAME"] = str(tmp_path / "db.sqlite3")
+    yield
+    connection.close()
+    connection.settings_dict["NAME"] = name
+    connection.connection = memory
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partitions_are_imported_by_worker_processes(vocabulary, sheets, file_database):
+    # SQLite has a single writer, one partition per stage keeps the worker
+    # transactions from overlapping
+    importer = ParallelImporter(partitions=1)
+    importer.workers = 2
+    importer.run(sheets(10))
+
+    assert importer.created == {
+        "Individual": 10,
+        "SamplingEvent": 10,
+        "BioSample": 10,
+        "Experiment": 10,
+        "File": 20,
+    }
+    assert (
+        File.objects.filter(
+            experiment__sample__sampling_event__individual__name="OE00009"
+        ).count()
+        == 2
+    )
+    assert importer.metrics.rows == 40
+
+
+def test_workers_are_read_from_the_command_line():
+    args = build_parser().parse_args(
+        "--samples s.csv --experiments e.csv --files f.csv"
+        " --mode parallel --workers 4".split()
+    )
+    assert (args.mode, args.workers) == ("parallel", 4)
@@ -0,0 +1,227 @@
+"""
+Query-count and latency regression suite for every URL of the repository app.
+
+A synthetic dataset is seeded once, then every named route in
+`repository/urls.py` is requested by a logged-in user. The number of queries
+of each request and the latency percentiles over `REPEATS` requests are
+compared with `performance_baseline.json`:
+
+- more queries than recorded fail the test,
+- a p95 latency above `LATENCY_FACTOR` times the recorded one, and more than
+  `LATENCY_SLACK_MS` above it, fails the test.
+
+Routes without a baseline entry fail as well, a new view has to be given a
+budget. After an intended change, record a new baseline with
+
+    pytest tests/test_performance.py --update-perf-baseline
+
+and commit the updated JSON file with the change.
+"""
+
+import json
+import os
+import statistics
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+
+from repository import urls
+from repository.models import File, Individual
+from utils.bulk_importer import BulkImporter
+
+BASELINE = os.path.join(os.path.dirname(__file__), "performance_baseline.json")
+REPEATS = 10
+LATENCY_FACTOR = 3.0
+LATENCY_SLACK_MS = 50.0
+
+# Seed: individuals, of which a few are recaptured and sequenced repeatedly
+INDIVIDUALS = 60
+RECAPTURED = 5
+RECAPTURES = 4
+
+
+class Post(dict):
+    """Parameters sent as JSON body of a POST request instead of a query"""
+
+
+def route_names(patterns, namespace="repository"):
+    """The names of all routes, including those of included URLconfs"""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace is None:
+                names |= route_names(pattern.url_patterns, namespace)
+        elif pattern.name:
+            names.add(f"{namespace}:{pattern.name}")
+    return names
+
+
+def requests_to_time():
+    """
+    The requests of the suite.
+
+    Returns:
+        dict: Case name to (route name, URL, query parameters or `Post`).
+    """
+    # the imported lineage of a recaptured individual
+    individual = Individual.objects.order_by("name").first()
+    event = individual.sampling_event.order_by("sampling_date").first()
+    sample = event.biosample.get()
+    experiment = sample.experiment.get()
+    file = experiment.file.order_by("filepath").first()
+    pages = {
+        "repository:index": [],
+        "repository:get_started": [],
+        "repository:individual_list": [],
+        "repository:samples_list": [],
+        "repository:experiments_list": [],
+        "repository:files_list": [],
+        "repository:individual": [individual.name],
+        "repository:sample": [sample.id],
+        "repository:experiment": [experiment.id],
+        "repository:file": [file.id],
+        "repository:modify_sample": [sample.id],
+        "repository:sample_sheet_export": ["csv"],
+    }
+    cases = {name: (name, reverse(name, args=args), {}) for name, args in pages.items()}
+    cases["repository:individual_list?_export=xlsx"] = (
+        "repository:individual_list",
+        reverse("repository:individual_list"),
+        {"_export": "xlsx"},
+    )
+    cases["repository:experiments_list?_export=xlsx"] = (
+        "repository:experiments_list",
+        reverse("repository:experiments_list"),
+        {"_export": "xlsx"},
+    )
+
+    api = {
+        "individual": individual.pk,
+        "biosample": sample.pk,
+        "samplingevent": event.pk,
+        "experiment": experiment.pk,
+        "file": file.pk,
+    }
+    cases["repository:api-root"] = (
+        "repository:api-root",
+        reverse("repository:api-root"),
+        {"format": "json"},
+    )
+    for basename, pk in api.items():
+        for action, args in (("list", []), ("detail", [pk])):
+            name = f"repository:{basename}-{action}"
+            cases[name] = (name, reverse(name, args=args), {"format": "json"})
+    for params in (
+        {"fields": "id,filepath"},
+        {"expand": "experiment.sample.sampling_event.individual"},
+    ):
+        name = "repository:file-list"
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        cases[f"{name}?{query}"] = (
+            name,
+            reverse(name),
+            {"format": "json", **params},
+        )
+    # a pipeline checking which of its checksums are registered
+    checksums = list(File.objects.values_list("checksum", flat=True))
+    cases["repository:resolve"] = (
+        "repository:resolve",
+        reverse("repository:resolve"),
+        Post(kind="checksum", keys=checksums + [f"new{i}" for i in range(1000)]),
+    )
+    return cases
+
+
+def fetch(client, url, params):
+    """Request a URL and read the whole, possibly streamed, response"""
+    if isinstance(params, Post):
+        response = client.post(url, json.dumps(params), content_type="application/json")
+    else:
+        response = client.get(url, params)
+    assert response.status_code == 200, url
+    return b"".join(response) if response.streaming else response.content
+
+
+def measure(client, url, params):
+    """
+    Request a URL repeatedly.
+
+    Returns:
+        dict: The query count of a warm request and the p50 and p95 latency.
+    """
+    # the first request fills caches, e.g. of the filter choices
+    fetch(client, url, params)
+    with CaptureQueriesContext(connection) as context:
+        fetch(client, url, params)
+    # later requests reset the query log
+    queries = len(context)
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fetch(client, url, params)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "queries": queries,
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 2),
+    }
+
+
+def regressions(name, measured, baseline):
+    """The budget violations of a request, as messages"""
+    if name not in baseline:
+        return [f"{name}: no baseline, record one with --update-perf-baseline"]
+    expected = baseline[name]
+    problems = []
+    if measured["queries"] > expected["queries"]:
+        problems.append(
+            f"{name}: {measured['queries']} queries, budget {expected['queries']}"
+        )
+    limit = max(
+        expected["p95_ms"] * LATENCY_FACTOR, expected["p95_ms"] + LATENCY_SLACK_MS
+    )
+    if measured["p95_ms"] > limit:
+        problems.append(
+            f"{name}: p95 {measured['p95_ms']} ms, "
+            f"baseline {expected['p95_ms']} ms, limit {limit:.2f} ms"
+        )
+    return problems
+
+
+@pytest.fixture
+def dataset(vocabulary, sheets, recaptures):
+    BulkImporter().run(sheets(INDIVIDUALS))
+    for individual in Individual.objects.order_by("name")[:RECAPTURED]:
+        recaptures(individual, RECAPTURES)
+
+
+@pytest.mark.django_db
+def test_every_route_is_timed(dataset):
+    timed = {name for name, _, _ in requests_to_time().values()}
+    assert route_names(urls.urlpatterns) == timed
+
+
+@pytest.mark.django_db
+def test_queries_and_latency_within_baseline(dataset, admin_client, request):
+    results = {
+        name: measure(admin_client, url, params)
+        for name, (_, url, params) in requests_to_time().items()
+    }
+    if request.config.getoption("--update-perf-baseline"):
+        with open(BASELINE, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        return
+
+    with open(BASELINE) as fh:
+        baseline = json.load(fh)
+    problems = [
+        problem
+        for name, measured in results.items()
+        for problem in regressions(name, measured, baseline)
+    ]
+    assert not problems, "\n".join(problems)
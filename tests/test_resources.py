@@ -0,0 +1,151 @@
+import math
+
+import pytest
+import tablib
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from repository.models import (
+    Color,
+    Individual,
+    Organism,
+    Person,
+    SamplingEvent,
+)
+from repository.resources import (
+    BioSampleResource,
+    IndividualResource,
+    SamplingEventResource,
+)
+from utils.bulk_importer import BulkImporter
+from utils.sample_importer import bisect_import
+
+LOOKUP_TABLES = [
+    "repository_individual",
+    "repository_country",
+    "repository_color",
+    "repository_person",
+]
+
+
+@pytest.fixture
+def individuals(db):
+    organism = Organism.objects.create(scientific_name="Oenanthe oenanthe")
+    Color.objects.create(label="black", description="")
+    return [
+        Individual.objects.create(name=f"OE{i:03d}", organism=organism).name
+        for i in range(30)
+    ]
+
+
+def sampling_event_dataset(names):
+    return tablib.Dataset(
+        *[(name, "", "AB, CD, X" + name[-3:], "black", "") for name in names],
+        headers=[
+            "name",
+            "collection_country",
+            "ringer_name",
+            "throat_phenotype",
+            "back_color_score",
+        ],
+    )
+
+
+def lookup_queries(dataset):
+    with CaptureQueriesContext(connection) as context:
+        result = SamplingEventResource().import_data(dataset, dry_run=True)
+    assert not result.has_errors()
+    assert not result.has_validation_errors()
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if query["sql"].startswith("SELECT")
+        and any(f'FROM "{table}"' in query["sql"] for table in LOOKUP_TABLES)
+    ]
+
+
+def test_sampling_event_import_resolves_relations_per_dataset(individuals):
+    small = lookup_queries(sampling_event_dataset(individuals[:3]))
+    large = lookup_queries(sampling_event_dataset(individuals))
+
+    # only saving the ringer M2M and rendering its diff are left per row
+    assert len(large) - len(small) == 3 * (len(individuals) - 3)
+
+
+def test_biosample_export_queries_do_not_grow_with_rows(vocabulary, sheets):
+    def export():
+        with CaptureQueriesContext(connection) as context:
+            dataset = BioSampleResource().export()
+        return dataset, len(context.captured_queries)
+
+    BulkImporter().run(sheets(2))
+    small, queries = export()
+    BulkImporter().run(sheets(10, offset=2))
+    large, large_queries = export()
+
+    assert len(large) == len(small) + 10
+    assert large_queries == queries
+    row = dict(zip(large.headers, large[0]))
+    assert row["sampling_event"] == "OE00000 sampled on 2021-05-12"
+    assert row["preservative"] == "EtOH;FTA"
+
+
+def test_sampling_event_import_creates_missing_ringers(individuals):
+    result = SamplingEventResource().import_data(sampling_event_dataset(individuals))
+
+    assert not result.has_errors()
+    assert Person.objects.filter(initials__startswith="X").count() == 30
+    event = SamplingEvent.objects.get(individual="OE001")
+    assert set(event.ringer_name.values_list("initials", flat=True)) == {
+        "AB",
+        "CD",
+        "X001",
+    }
+    assert event.throat_phenotype.label == "black"
+
+
+def test_sampling_event_import_reports_unknown_individual(individuals):
+    result = SamplingEventResource().import_data(
+        sampling_event_dataset(["OE999"]), dry_run=True
+    )
+
+    assert result.has_errors()
+
+
+def test_individual_import_reports_unknown_organism(individuals):
+    dataset = tablib.Dataset(
+        ("OE1", "Oenanthe nowhere", ""), headers=["name", "organism", "sex"]
+    )
+    result = IndividualResource().import_data(dataset, dry_run=True)
+
+    assert result.has_errors() or result.has_validation_errors()
+
+
+def test_bisect_import_isolates_the_failing_rows(individuals):
+    class CountingIndividualResource(IndividualResource):
+        calls = 0
+
+        def import_data(self, *args, **kwargs):
+            self.calls += 1
+            return super().import_data(*args, **kwargs)
+
+    names = [f"NEW{i:03d}" for i in range(64)]
+    organisms = ["Oenanthe oenanthe"] * 64
+    organisms[9] = organisms[40] = "Oenanthe nowhere"
+    dataset = tablib.Dataset(
+        *[(name, organism, "") for name, organism in zip(names, organisms)],
+        headers=["name", "organism", "sex"],
+    )
+    rows = list(range(100, 164))
+    resource = CountingIndividualResource()
+    failed = bisect_import(resource, dataset, rows)
+
+    assert list(failed) == [109, 140]
+    assert set(failed.values()) == {
+        "Organism with scientific_name=Oenanthe nowhere does not exist."
+    }
+    assert set(
+        Individual.objects.filter(name__startswith="NEW").values_list("name", flat=True)
+    ) == set(names) - {"NEW009", "NEW040"}
+    # at most two failing blocks per level of halving
+    assert resource.calls <= 1 + 2 * len(failed) * math.log2(len(rows))
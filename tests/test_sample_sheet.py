@@ -0,0 +1,84 @@
+import csv
+import json
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from repository.models import Experiment, Individual, Organism
+from repository.sample_sheet import (
+    SAMPLE_SHEET_COLUMNS,
+    sample_sheet_queryset,
+    sample_sheet_rows,
+)
+from utils.bulk_importer import BulkImporter
+
+
+@pytest.fixture
+def lineage(vocabulary, sheets):
+    BulkImporter().run(sheets(3))
+    # an individual without sampling events is kept with empty columns
+    Individual.objects.create(name="OE99999", organism=Organism.objects.first())
+    Experiment.objects.filter(sample__sampling_event__individual="OE00002").update(
+        library_strategy="RNA-Seq"
+    )
+
+
+@pytest.mark.django_db
+def test_sample_sheet_rows(lineage, django_assert_num_queries):
+    # the joined rows and one query per many-to-many column and chunk
+    with django_assert_num_queries(3):
+        rows = list(sample_sheet_rows())
+    assert len(rows) == 7
+    assert list(sample_sheet_rows(chunk_size=4)) == rows
+    assert list(rows[0]) == SAMPLE_SHEET_COLUMNS
+    first = rows[0]
+    assert first["name"] == "OE00000"
+    assert first["organism"] == "Oenanthe oenanthe"
+    assert first["ringer_name"] == "AB,CD"
+    assert first["preservative"] == "EtOH;FTA"
+    assert {row["filepath"] for row in rows[:2]} == {
+        "/data/OE00000_R1.fastq.gz",
+        "/data/OE00000_R2.fastq.gz",
+    }
+    assert rows[-1]["name"] == "OE99999"
+    assert rows[-1]["file"] is None
+
+
+@pytest.mark.django_db
+def test_sample_sheet_filters(lineage):
+    rows = list(sample_sheet_rows(sample_sheet_queryset({"library_strategy": "WGS"})))
+    assert {row["name"] for row in rows} == {"OE00000", "OE00001"}
+    rows = list(sample_sheet_rows(sample_sheet_queryset({"name": "0001"})))
+    assert [row["name"] for row in rows] == ["OE00001", "OE00001"]
+    with pytest.raises(ValueError):
+        sample_sheet_queryset({"library_strategy": "unknown"})
+
+
+@pytest.mark.django_db
+def test_export_sample_sheet_command(lineage, tmp_path):
+    path = tmp_path / "sheet.tsv"
+    call_command(
+        "export_sample_sheet",
+        output=str(path),
+        format="tsv",
+        filter=["library_strategy=RNA-Seq"],
+    )
+    rows = list(csv.DictReader(path.open(), delimiter="\t"))
+    assert sorted(row["checksum"] for row in rows) == ["OE000021", "OE000022"]
+    assert rows[0]["collection_date"] == "2021-05-12"
+
+
+@pytest.mark.django_db
+def test_sample_sheet_export_view(lineage, admin_client):
+    url = reverse("repository:sample_sheet_export", args=["ndjson"])
+    response = admin_client.get(url, {"sex": ""})
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert len(lines) == 7
+    assert json.loads(lines[0])["bill_length"] == "15.25"
+
+    assert admin_client.get(url, {"sex": "x"}).status_code == 400
+    url = reverse("repository:sample_sheet_export", args=["xml"])
+    assert admin_client.get(url).status_code == 404
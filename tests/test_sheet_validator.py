@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from repository.models import Individual
+from utils.naive_sample_importer import main
+from utils.sheet_validator import ERROR_COLUMNS, validate_sheet, validate_sheets
+
+
+def test_valid_sheets_have_no_errors(sheets):
+    assert validate_sheets(sheets(10)).empty
+
+
+def test_validate_sheet_reports_row_column_and_reason(sheets):
+    data = sheets(10)
+    samples = data["samples"]
+    samples.loc[2, "bill_length"] = 30
+    samples.loc[3, "wing_length"] = "long"
+    samples.loc[4, "collection_date"] = "2021-05-12"
+    samples.loc[5, "collection_latitude_dec"] = -200
+    samples.loc[6, "name"] = "$$"
+    data["experiments"].loc[1, "library_layout"] = "TRIPLE"
+
+    errors = validate_sheets(data)
+
+    assert errors.columns.to_list() == ERROR_COLUMNS
+    assert errors[["sheet", "row", "column"]].values.tolist() == [
+        ["samples", 2, "bill_length"],
+        ["samples", 3, "wing_length"],
+        ["samples", 4, "collection_date"],
+        ["samples", 5, "collection_latitude_dec"],
+        ["samples", 6, "name"],
+        ["experiments", 1, "library_layout"],
+    ]
+    assert errors["reason"][0] == "Ensure this value is less than or equal to 25."
+    assert errors["reason"][3] == "Ensure this value is greater than or equal to -180."
+
+
+def test_validate_sheet_reports_missing_columns(sheets):
+    files = sheets(2)["files"].drop(columns="host")
+    errors = validate_sheet("files", files)
+    assert errors[["column", "reason"]].values.tolist() == [["host", "missing column"]]
+
+
+@pytest.mark.django_db
+def test_importer_validates_before_importing(vocabulary, sheets, tmp_path):
+    data = sheets(3)
+    data["samples"].loc[1, "bill_length"] = 30
+    argv = ["--mode", "bulk", "--validate"]
+    for label, df in data.items():
+        df.to_csv(tmp_path / f"{label}.csv", index=False)
+        argv.append(f"--{label}={tmp_path / f'{label}.csv'}")
+
+    with pytest.raises(SystemExit, match="1 validation errors, nothing imported"):
+        main(argv + ["--error-report", str(tmp_path / "errors.csv")])
+
+    report = pd.read_csv(tmp_path / "errors.csv")
+    assert report[["sheet", "row", "column"]].values.tolist() == [
+        ["samples", 1, "bill_length"]
+    ]
+    assert not Individual.objects.exists()
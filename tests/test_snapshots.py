@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from repository.models import File, Individual
+from repository.snapshots import MANIFEST
+from utils.bulk_importer import BulkImporter
+
+
+def dump(tmp_path):
+    path = tmp_path / "dump.json"
+    call_command("dumpdata", "repository", output=str(path))
+    return json.loads(path.read_text())
+
+
+@pytest.mark.django_db
+def test_snapshot_and_restore(vocabulary, sheets, tmp_path):
+    BulkImporter().run(sheets(5))
+    before = dump(tmp_path)
+    directory = tmp_path / "snapshot"
+
+    call_command("snapshot", str(directory), workers=1, stdout=io.StringIO())
+    manifest = json.loads((directory / MANIFEST).read_text())
+    assert manifest["repository.file"]["rows"] == 10
+    assert manifest["repository.samplingevent_ringer_name"]["rows"] == 10
+    assert (directory / "repository.file.jsonl.zst").exists()
+
+    File.objects.all().delete()
+    Individual.objects.filter(name="OE00001").update(title="changed")
+
+    call_command("restore_snapshot", str(directory), workers=1, stdout=io.StringIO())
+    assert dump(tmp_path) == before
+
+
+@pytest.mark.django_db
+def test_restore_truncates_rows_created_after_the_snapshot(
+    vocabulary, sheets, tmp_path
+):
+    BulkImporter().run(sheets(2))
+    before = dump(tmp_path)
+    directory = tmp_path / "snapshot"
+    call_command("snapshot", str(directory), stdout=io.StringIO())
+
+    BulkImporter().run(sheets(1, offset=2))
+    call_command("restore_snapshot", str(directory), workers=1, stdout=io.StringIO())
+    assert Individual.objects.filter(name="OE00002").exists()
+
+    call_command(
+        "restore_snapshot",
+        str(directory),
+        workers=1,
+        truncate=True,
+        stdout=io.StringIO(),
+    )
+    assert dump(tmp_path) == before
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from repository.models import BioSample, File, Individual, Person, SamplingEvent
+from repository.sync import DatabaseSync
+from utils.bulk_importer import BulkImporter
+
+databases = ["default", "sync"]
+
+
+def dump(tmp_path, database):
+    path = tmp_path / f"{database}.json"
+    call_command("dumpdata", "repository", database=database, output=str(path))
+    return sorted(
+        json.loads(path.read_text()), key=lambda obj: (obj["model"], str(obj["pk"]))
+    )
+
+
+@pytest.mark.django_db(databases=databases)
+def test_sync_copies_and_diffs(vocabulary, sheets, tmp_path):
+    BulkImporter().run(sheets(6))
+    changes = DatabaseSync("default", "sync").run()
+    assert changes["repository.file"]["inserted"] == 12
+    assert changes["repository.samplingevent_ringer_name"]["inserted"] == 12
+    assert dump(tmp_path, "sync") == dump(tmp_path, "default")
+
+    Individual.objects.filter(name="OE00001").update(title="changed")
+    File.objects.filter(pk=File.objects.order_by("pk")[0].pk).delete()
+    event = SamplingEvent.objects.get(individual_id="OE00002")
+    event.ringer_name.add(Person.objects.create(initials="EF"))
+    BioSample.objects.get(sampling_event__individual_id="OE00003").preservative.clear()
+    # rows are matched by pk, the target row with the same id is overwritten
+    Person.objects.using("sync").create(initials="XY")
+    Person.objects.using("sync").create(initials="YZ")
+
+    dry = DatabaseSync("default", "sync", dry_run=True).run()
+    assert dry["repository.individual"] == {"inserted": 0, "updated": 1, "deleted": 0}
+    assert Individual.objects.using("sync").get(name="OE00001").title != "changed"
+
+    changes = DatabaseSync("default", "sync", chunk_size=4).run()
+    assert changes["repository.individual"]["updated"] == 1
+    assert changes["repository.file"]["deleted"] == 1
+    assert changes["repository.person"] == {"inserted": 0, "updated": 1, "deleted": 1}
+    assert changes["repository.samplingevent_ringer_name"]["inserted"] == 1
+    assert changes["repository.biosample_preservative"]["deleted"] == 2
+    assert changes["repository.experiment"] == dict.fromkeys(
+        changes["repository.experiment"], 0
+    )
+    assert dump(tmp_path, "sync") == dump(tmp_path, "default")
+
+
+@pytest.mark.django_db(databases=databases)
+def test_sync_deletes_stale_rows_children_first(vocabulary, sheets):
+    BulkImporter().run(sheets(3))
+    DatabaseSync("default", "sync").run()
+    # rename an individual, its sampling event is re-linked to the new name
+    renamed = Individual.objects.get(name="OE00001")
+    renamed.name = "OE99999"
+    renamed.save()
+    SamplingEvent.objects.filter(individual_id="OE00001").update(
+        individual_id="OE99999"
+    )
+    Individual.objects.filter(name="OE00001").delete()
+    # remove a whole lineage
+    File.objects.filter(
+        experiment__sample__sampling_event__individual_id="OE00002"
+    ).delete()
+    event = SamplingEvent.objects.get(individual_id="OE00002")
+    BioSample.objects.get(sampling_event=event).experiment.all().delete()
+    BioSample.objects.filter(sampling_event=event).delete()
+    event.delete()
+    Individual.objects.filter(name="OE00002").delete()
+
+    with CaptureQueriesContext(connections["sync"]) as queries:
+        changes = DatabaseSync("default", "sync").run()
+
+    deleted = [
+        query["sql"].split('"')[1]
+        for query in queries.captured_queries
+        if query["sql"].startswith("DELETE")
+    ]
+    children_first = [
+        ("file", "experiment"),
+        ("experiment", "biosample"),
+        ("biosample_preservative", "biosample"),
+        ("biosample", "samplingevent"),
+        ("samplingevent_ringer_name", "samplingevent"),
+        ("samplingevent", "individual"),
+    ]
+    for child, parent in children_first:
+        assert deleted.index(f"repository_{child}") < deleted.index(
+            f"repository_{parent}"
+        )
+    assert changes["repository.individual"] == {
+        "inserted": 1,
+        "updated": 0,
+        "deleted": 2,
+    }
+    assert changes["repository.samplingevent"]["updated"] == 1
+    assert set(Individual.objects.using("sync").values_list("name", flat=True)) == {
+        "OE00000",
+        "OE99999",
+    }
+    assert SamplingEvent.objects.using("sync").filter(individual_id="OE99999").exists()
@@ -1,16 +1,20 @@
 import pytest
-
-from repository.views import SampleView
 from django.urls import reverse
-from django.test import RequestFactory
 
 
-@pytest.mark.django_db  #
-def test_sampleview():
-    path = reverse("index")
-    request = RequestFactory().get(path)  # get the path for the list of contacts
-    response = SampleView(request)
+@pytest.mark.django_db
+def test_index_view(admin_client):
+    response = admin_client.get(reverse("repository:index"))
 
     # assert status code from requesting the view
     # is 200(OK success status response code)
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_views_require_login(client):
+    path = reverse("repository:samples_list")
+    response = client.get(path)
+
+    assert response.status_code == 302
+    assert response.url.startswith(reverse("login"))
@@ -0,0 +1,75 @@
+import datetime
+import io
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import load_workbook
+
+from repository.models import Experiment
+from utils.bulk_importer import BulkImporter
+
+
+def workbook_rows(response):
+    assert response.status_code == 200
+    assert response["Content-Disposition"].endswith('.xlsx"')
+    content = b"".join(response.streaming_content)
+    sheet = load_workbook(io.BytesIO(content), read_only=True).active
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+@pytest.mark.django_db
+def test_experiment_list_xlsx_export(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(3))
+    Experiment.objects.filter(sample__sampling_event__individual="OE00002").update(
+        library_strategy="RNA-Seq"
+    )
+    response = admin_client.get(
+        reverse("repository:experiments_list"),
+        {"library_strategy": "WGS", "sort": "-individual", "_export": "xlsx"},
+    )
+    rows = workbook_rows(response)
+    assert rows[0] == [
+        "Experiment",
+        "Individual Name",
+        "Country",
+        "Sampling Date",
+        "Library strategy",
+        "# Files",
+    ]
+    assert [row[1] for row in rows[1:]] == ["OE00001", "OE00000"]
+    # values as rendered in the table, dates as Excel dates
+    assert rows[1][2] == "Switzerland ()"
+    assert rows[1][3].date() == datetime.date(2021, 5, 12)
+    assert rows[1][4:] == ["WGS", 2]
+
+
+@pytest.mark.django_db
+def test_individual_list_xlsx_export(vocabulary, sheets, admin_client):
+    BulkImporter().run(sheets(2))
+    response = admin_client.get(
+        reverse("repository:individual_list"), {"_export": "xlsx"}
+    )
+    rows = workbook_rows(response)
+    assert rows[0] == ["Name", "Species", "Sex", "Samples"]
+    assert rows[1][:3] == ["OE00000", "Oenanthe oenanthe", "male"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("view", ["individual_list", "experiments_list"])
+def test_xlsx_export_queries_do_not_grow_with_rows(
+    vocabulary, sheets, admin_client, view
+):
+    def export_queries():
+        with CaptureQueriesContext(connection) as queries:
+            rows = workbook_rows(
+                admin_client.get(reverse(f"repository:{view}"), {"_export": "xlsx"})
+            )
+        return len(rows), len(queries)
+
+    BulkImporter().run(sheets(2))
+    rows, queries = export_queries()
+    # the related objects are prefetched per chunk of the iterator
+    BulkImporter().run(sheets(10, offset=2))
+    assert export_queries() == (rows + 10, queries)
@@ -0,0 +1,634 @@
+"""
+Batch import of the sample, experiment and file sheets.
+
+Set-based counterpart of the row-wise functions in `naive_sample_importer.py`.
+All vocabularies and parent objects of a sheet are resolved with a few chunked
+IN queries up front, then Individuals, SamplingEvents, BioSamples,
+Experiments, Files and the M2M through-rows are inserted with `bulk_create` in
+dependency order. The number of queries depends on the number of distinct
+keys per IN chunk, not on the number of rows.
+"""
+
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, List, Optional
+
+import pandas as pd
+from django.db import transaction
+
+from repository.bulk import (
+    BULK_CREATE_BATCH_SIZE,
+    bulk_link,
+    filter_in_chunks,
+    get_or_create_map,
+    lookup_map,
+)
+from repository.import_metrics import ImportMetrics, measured
+from repository.models import (
+    BioSample,
+    SamplingEvent,
+    Organism,
+    Experiment,
+    SampleSex,
+    File,
+    Color,
+    Tissue,
+    TissuePreservative,
+    Person,
+    ExternalCollection,
+    Country,
+    Instrument,
+    Individual,
+)
+from sampledb.settings.base import DATE_INPUT_FORMATS
+
+# Labels for input data
+INPUT_DATA_LABELS = ["samples", "experiments", "files"]
+
+# Additional attributes for experiment spreadsheet
+EXP_SPREADSHEET_ADDITIONAL_ATTRIBUTES = ["i7", "i5", "date_extraction", "dilution"]
+
+RINGER_NAME_SEPARATOR = ","
+PRESERVATIVE_SEPARATOR = ";"
+
+# FIXME assume everything is blood, as the naive importer does
+DEFAULT_TISSUE_NAME = "whole blood"
+
+COLOR_COLUMNS = ["throat_phenotype", "back_color_score", "neck_color_score"]
+
+# Sample sheet columns that map to SamplingEvent fields of a different name
+SAMPLING_EVENT_COLUMN_MAP = {
+    "collection_location": "sampling_location",
+    "collection_date": "sampling_date",
+    "collection_time": "sampling_time",
+    "collection_latitude": "sampling_latitude",
+    "collection_longitude": "sampling_longitude",
+    "collection_latitude_dec": "sampling_latitude_dec",
+    "collection_longitude_dec": "sampling_longitude_dec",
+}
+
+# Sample sheet columns copied verbatim to SamplingEvent fields
+SAMPLING_EVENT_COLUMNS = [
+    "forehead_length",
+    "bill_length",
+    "black_above_eye",
+    "length_third_primary",
+    "wing_length",
+    "tarsus_length",
+    "body_mass",
+    "projection_first_primary_over_primary_coverts",
+    "picture_ids",
+    "ring_number",
+]
+
+BIOSAMPLE_COLUMNS = ["tissue_sample_box", "tissue_sample_tube", "external_sample_id"]
+
+EXPERIMENT_COLUMNS = [
+    "library_strategy",
+    "library_layout",
+    "library_selection",
+    "library_source",
+    "design_description",
+]
+
+
+def blank_to_none(df: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of `df` with NaN and empty strings replaced by None"""
+    df = df.astype(object)
+    return df.where(df.notna() & (df != ""), None)
+
+
+def parse_dates(series: pd.Series) -> pd.Series:
+    """Vectorized `parse_date`: try all DATE_INPUT_FORMATS column-wise"""
+    parsed = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    for date_format in DATE_INPUT_FORMATS:
+        parsed = parsed.fillna(
+            pd.to_datetime(series, format=date_format, errors="coerce")
+        )
+    return parsed.dt.date.astype(object).where(parsed.notna(), None)
+
+
+def to_decimal_column(series: pd.Series, field):
+    """
+    Round a column to the precision of a DecimalField.
+
+    Args:
+        series: Column with numbers, numeric strings or None.
+        field: The target `models.DecimalField`.
+
+    Returns:
+        tuple: The rounded column (None for missing values) and a boolean mask
+        of values that are not numeric or do not fit into `max_digits`.
+    """
+    numeric = pd.to_numeric(series, errors="coerce").round(field.decimal_places)
+    limit = 10 ** (field.max_digits - field.decimal_places)
+    invalid = (series.notna() & numeric.isna()) | (numeric.abs() >= limit)
+    return numeric.astype(object).where(numeric.notna(), None), invalid
+
+
+def model_values(model, values: Dict) -> Dict:
+    """Replace None by "" for the non-nullable text fields of `model`"""
+    return {
+        name: ""
+        if value is None
+        and not model._meta.get_field(name).null
+        and model._meta.get_field(name).empty_strings_allowed
+        else value
+        for name, value in values.items()
+    }
+
+
+def split_multi(value: Optional[str], separator: str) -> List[str]:
+    """Split a multi-element cell into its stripped, non-empty elements"""
+    if not value:
+        return []
+    return [elem.strip() for elem in str(value).split(separator) if elem.strip()]
+
+
+def split_ringers(df: pd.DataFrame) -> pd.Series:
+    """Split the `ringer_name` column into lists of initials"""
+    return df["ringer_name"].map(
+        lambda value: split_multi(value, RINGER_NAME_SEPARATOR)
+    )
+
+
+def split_preservatives(df: pd.DataFrame) -> pd.Series:
+    """Split the `preservative` column into lists of labels"""
+    return df["preservative"].map(
+        lambda value: split_multi(value, PRESERVATIVE_SEPARATOR)
+    )
+
+
+class BulkImporter:
+    """
+    Import the three input sheets with a constant number of queries per chunk
+    of distinct keys.
+
+    Sampling events are matched on (individual, sampling date), biosamples on
+    (sampling event, tissue, box, tube, external sample id), experiments on
+    all imported fields and files on filepath/checksum. Rows that cannot be
+    imported are collected in `errors` instead of aborting the import.
+    """
+
+    def __init__(
+        self,
+        tissue_name: str = DEFAULT_TISSUE_NAME,
+        batch_size: int = BULK_CREATE_BATCH_SIZE,
+        metrics: Optional[ImportMetrics] = None,
+    ):
+        self.tissue_name = tissue_name
+        self.batch_size = batch_size
+        self.metrics = metrics or ImportMetrics("bulk")
+        self.errors: List[Dict] = []
+        self.created: Counter = Counter()
+
+    def error(self, sheet: str, row, reason: str):
+        """Record (and print) a row that could not be imported"""
+        print(f"ERROR: {sheet} row {row}: {reason}")
+        self.errors.append({"sheet": sheet, "row": row, "reason": reason})
+
+    def _bulk_create(self, model, objects: List):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.created[model.__name__] += len(objects)
+
+    def run(self, data: Dict[str, pd.DataFrame]):
+        """
+        Import all sheets in dependency order within one transaction.
+
+        Args:
+            data: Mapping of INPUT_DATA_LABELS to the loaded DataFrames.
+
+        Returns:
+            Counter: Number of created objects per model.
+        """
+        self.metrics.rows += sum(len(df) for df in data.values())
+        with transaction.atomic():
+            self.import_samples(data["samples"])
+            experiments = data["experiments"].copy()
+            experiments.loc[:, "experiment_id"] = self.import_experiments(experiments)
+            files = data["files"].merge(
+                experiments,
+                how="left",
+                left_on="sample_name",
+                right_on="individual",
+                validate="many_to_one",
+            )
+            self.import_files(files)
+
+        print(f"Created: {dict(self.created)}, failed rows: {len(self.errors)}")
+        return self.created
+
+    def prepare_samples(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Normalise the sample sheet column-wise and drop invalid rows"""
+        df = blank_to_none(df)
+        df["organism"] = df["organism"].fillna("Unknown")
+        df["sex"] = df["sex"].fillna("unknown")
+        df["collection_country"] = df["collection_country"].fillna("Unknown")
+        df["collection_date"] = parse_dates(df["collection_date"])
+
+        valid = df["name"].notna()
+        for row in df.index[~valid]:
+            self.error("samples", row, "Can't import data without sample name")
+
+        for column in SAMPLING_EVENT_COLUMNS + list(SAMPLING_EVENT_COLUMN_MAP):
+            field = SamplingEvent._meta.get_field(
+                SAMPLING_EVENT_COLUMN_MAP.get(column, column)
+            )
+            if field.get_internal_type() != "DecimalField":
+                continue
+            df[column], invalid = to_decimal_column(df[column], field)
+            for row in df.index[invalid & valid]:
+                self.error("samples", row, f"invalid decimal value for {column}")
+            valid &= ~invalid
+
+        return df[valid]
+
+    @measured("samples")
+    def import_samples(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Create individuals, sampling events and biosamples from the sample sheet.
+
+        Args:
+            df: The sample sheet.
+
+        Returns:
+            pd.Series: BioSample ids aligned to the index of `df`, None for rows
+            that were not imported.
+        """
+        biosample_ids = pd.Series(None, index=df.index, dtype=object)
+        df = self.prepare_samples(df)
+        if df.empty:
+            return biosample_ids
+
+        vocabularies = self.resolve_sample_vocabularies(df)
+        organisms = vocabularies["organism"]
+        sexes = vocabularies["sex"]
+        persons = vocabularies["person"]
+        preservative_map = vocabularies["preservative"]
+        ringers = split_ringers(df)
+        preservatives = split_preservatives(df)
+        tissue = Tissue.objects.get(name=self.tissue_name)
+
+        # preload the parent objects that already exist
+        individuals = lookup_map(Individual, "name", df["name"])
+        events = {
+            (event.individual_id, event.sampling_date): event
+            for event in filter_in_chunks(
+                SamplingEvent.objects.all(), "individual_id", df["name"]
+            )
+        }
+        biosamples = {
+            self._biosample_key(biosample): biosample
+            for biosample in filter_in_chunks(
+                BioSample.objects.all(),
+                "sampling_event_id",
+                [event.pk for event in events.values()],
+            )
+        }
+
+        new_individuals, new_events, new_biosamples = [], [], []
+        ringer_links, preservative_links = [], []
+
+        for row, record in zip(df.index, df.to_dict("records")):
+            name = record["name"]
+            organism = organisms[record["organism"]]
+            sex = sexes[record["sex"]]
+            individual = individuals.get(name)
+            if individual is None:
+                individual = Individual(
+                    name=name, title=name, organism=organism, sex=sex
+                )
+                individuals[name] = individual
+                new_individuals.append(individual)
+            elif (individual.organism_id, individual.sex_id) != (organism.pk, sex.pk):
+                self.error(
+                    "samples",
+                    row,
+                    f"Could not create individual {name}: organism or sex "
+                    "differs from the existing individual",
+                )
+                continue
+
+            event = events.get((name, record["collection_date"]))
+            if event is None:
+                event = SamplingEvent(
+                    individual=individual,
+                    comment="",
+                    **self.sampling_event_values(record, vocabularies),
+                )
+                events[(name, record["collection_date"])] = event
+                new_events.append(event)
+
+            ringer_links += [
+                (event.pk, persons[initials].pk) for initials in ringers[row]
+            ]
+
+            biosample = BioSample(
+                sampling_event=event,
+                tissue_type=tissue,
+                **self.biosample_values(record, vocabularies),
+            )
+            key = self._biosample_key(biosample)
+            if key in biosamples:
+                biosample = biosamples[key]
+            else:
+                biosamples[key] = biosample
+                new_biosamples.append(biosample)
+            biosample_ids[row] = biosample.pk
+
+            for label in preservatives[row]:
+                if label not in preservative_map:
+                    self.error("samples", row, f"unknown preservative {label}")
+                    continue
+                preservative_links.append((biosample.pk, preservative_map[label].pk))
+
+        self._bulk_create(Individual, new_individuals)
+        self._bulk_create(SamplingEvent, new_events)
+        # ringers replace the existing ones like `RelatedManager.set()`
+        bulk_link(SamplingEvent.ringer_name, ringer_links, replace=True)
+        self._bulk_create(BioSample, new_biosamples)
+        bulk_link(BioSample.preservative, preservative_links)
+        return biosample_ids
+
+    def resolve_sample_vocabularies(self, df: pd.DataFrame) -> Dict[str, Dict]:
+        """
+        Resolve, and create where missing, the vocabularies of a sample sheet.
+
+        Args:
+            df: The sample sheet as returned by `prepare_samples`.
+
+        Returns:
+            dict: Vocabulary name to a mapping of sheet value to instance.
+        """
+        return {
+            "organism": get_or_create_map(Organism, "scientific_name", df["organism"]),
+            "sex": get_or_create_map(SampleSex, "name", df["sex"]),
+            "country": get_or_create_map(Country, "name", df["collection_country"]),
+            "color": get_or_create_map(
+                Color, "label", chain.from_iterable(df[c] for c in COLOR_COLUMNS)
+            ),
+            "person": get_or_create_map(
+                Person,
+                "initials",
+                chain.from_iterable(split_ringers(df)),
+                defaults={"name": "", "affiliation": "Unknown"},
+            ),
+            "collection": get_or_create_map(
+                ExternalCollection, "name", df["external_collection_name"]
+            ),
+            "preservative": lookup_map(
+                TissuePreservative,
+                "label",
+                chain.from_iterable(split_preservatives(df)),
+            ),
+        }
+
+    @staticmethod
+    def sampling_event_values(record: Dict, vocabularies: Dict[str, Dict]) -> Dict:
+        """SamplingEvent field values of a prepared sample sheet record"""
+        return {
+            "sampling_country": vocabularies["country"][record["collection_country"]],
+            **{
+                field: record[column]
+                for column, field in SAMPLING_EVENT_COLUMN_MAP.items()
+            },
+            **{column: record[column] for column in SAMPLING_EVENT_COLUMNS},
+            **{
+                column: vocabularies["color"].get(record[column])
+                for column in COLOR_COLUMNS
+            },
+        }
+
+    @staticmethod
+    def biosample_values(record: Dict, vocabularies: Dict[str, Dict]) -> Dict:
+        """BioSample field values of a prepared sample sheet record"""
+        return {
+            "external_collection_name": vocabularies["collection"].get(
+                record["external_collection_name"]
+            ),
+            **{column: record[column] for column in BIOSAMPLE_COLUMNS},
+        }
+
+    @staticmethod
+    def _biosample_key(biosample: BioSample) -> tuple:
+        return (
+            biosample.sampling_event_id,
+            biosample.tissue_type_id,
+            biosample.external_collection_name_id,
+        ) + tuple(getattr(biosample, column) for column in BIOSAMPLE_COLUMNS)
+
+    @measured("experiments")
+    def import_experiments(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Create experiments for the biosamples referenced in the experiment sheet.
+
+        Args:
+            df: The experiment sheet.
+
+        Returns:
+            pd.Series: Experiment ids aligned to the index of `df`, None for
+            rows that were not imported.
+        """
+        experiment_ids = pd.Series(None, index=df.index, dtype=object)
+        df = blank_to_none(df)
+        if df.empty:
+            return experiment_ids
+
+        events = defaultdict(list)
+        for event in filter_in_chunks(
+            SamplingEvent.objects.values("id", "individual_id"),
+            "individual_id",
+            df["individual"],
+        ):
+            events[event["individual_id"]].append(event["id"])
+
+        tissues = get_or_create_map(Tissue, "name", df["tissue_type"])
+        biosamples = defaultdict(list)
+        for biosample in filter_in_chunks(
+            BioSample.objects.values("id", "sampling_event_id", "tissue_type_id"),
+            "sampling_event_id",
+            chain.from_iterable(events.values()),
+        ):
+            key = (biosample["sampling_event_id"], biosample["tissue_type_id"])
+            biosamples[key].append(biosample["id"])
+
+        instruments = self.instrument_map(df)
+        experiments = {
+            self._experiment_key(experiment): experiment
+            for experiment in filter_in_chunks(
+                Experiment.objects.all(),
+                "sample_id",
+                chain.from_iterable(biosamples.values()),
+            )
+        }
+
+        new_experiments = []
+        for row, record in zip(df.index, df.to_dict("records")):
+            individual = record["individual"]
+            if len(events[individual]) != 1:
+                self.error(
+                    "experiments",
+                    row,
+                    f"expected one SamplingEvent for {individual}, "
+                    f"found {len(events[individual])}",
+                )
+                continue
+            tissue = tissues.get(record["tissue_type"])
+            sample_ids = biosamples[
+                (events[individual][0], tissue.pk if tissue else None)
+            ]
+            if len(sample_ids) != 1:
+                self.error(
+                    "experiments",
+                    row,
+                    f"expected one BioSample for {individual}, found {len(sample_ids)}",
+                )
+                continue
+            instrument = instruments.get(
+                (record["instrument_model"], record["platform"])
+            )
+            if instrument is None:
+                self.error(
+                    "experiments",
+                    row,
+                    f"Instrument {record['platform']} {record['instrument_model']} "
+                    "not found",
+                )
+                continue
+
+            experiment = Experiment(
+                title="",
+                sample_id=sample_ids[0],
+                **self.experiment_values(record, instrument),
+            )
+            key = self._experiment_key(experiment)
+            if key in experiments:
+                experiment = experiments[key]
+            else:
+                experiments[key] = experiment
+                new_experiments.append(experiment)
+            experiment_ids[row] = experiment.pk
+
+        self._bulk_create(Experiment, new_experiments)
+        return experiment_ids
+
+    @staticmethod
+    def instrument_map(df: pd.DataFrame) -> Dict[tuple, Instrument]:
+        """Map the (model, platform) pairs of an experiment sheet to instruments"""
+        return {
+            (instrument.model, instrument.platform): instrument
+            for instrument in filter_in_chunks(
+                Instrument.objects.all(), "model", df["instrument_model"]
+            )
+        }
+
+    @staticmethod
+    def experiment_values(record: Dict, instrument: Instrument) -> Dict:
+        """Experiment field values of an experiment sheet record"""
+        return {
+            "instrument_model": instrument,
+            "exp_attributes": str(
+                dict(
+                    (fieldname, record.get(fieldname))
+                    for fieldname in EXP_SPREADSHEET_ADDITIONAL_ATTRIBUTES
+                )
+            ),
+            **model_values(
+                Experiment, {column: record[column] for column in EXPERIMENT_COLUMNS}
+            ),
+        }
+
+    @staticmethod
+    def _experiment_key(experiment: Experiment) -> tuple:
+        return (
+            experiment.title,
+            experiment.sample_id,
+            experiment.instrument_model_id,
+            experiment.exp_attributes,
+        ) + tuple(getattr(experiment, column) for column in EXPERIMENT_COLUMNS)
+
+    def experiment_ids_by_individual(self, names) -> Dict[str, str]:
+        """
+        Map individual names to the id of their experiment.
+
+        Set-based replacement for merging the file sheet with the experiment
+        sheet when the latter is no longer in memory. Individuals with more
+        than one experiment are ambiguous and left out.
+
+        Args:
+            names: Individual names, e.g. the `sample_name` column.
+
+        Returns:
+            dict: Individual name to experiment id.
+        """
+        experiments = defaultdict(list)
+        for experiment in filter_in_chunks(
+            Experiment.objects.values("id", "sample__sampling_event__individual_id"),
+            "sample__sampling_event__individual_id",
+            names,
+        ):
+            name = experiment["sample__sampling_event__individual_id"]
+            experiments[name].append(experiment["id"])
+        return {name: ids[0] for name, ids in experiments.items() if len(ids) == 1}
+
+    @measured("files")
+    def import_files(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Create files for the file sheet merged with the imported experiments.
+
+        Args:
+            df: The file sheet with an `experiment_id` column.
+
+        Returns:
+            pd.Series: File ids aligned to the index of `df`, None for rows
+            that were not imported.
+        """
+        file_ids = pd.Series(None, index=df.index, dtype=object)
+        df = blank_to_none(df)
+        if df.empty:
+            return file_ids
+        df["checksum_type"] = df["checksum_type"].map(
+            lambda value: value.lower() if value else value
+        )
+
+        by_checksum = lookup_map(File, "checksum", df["checksum"])
+        by_filepath = lookup_map(File, "filepath", df["filepath"])
+
+        new_files = []
+        for row, record in zip(df.index, df.to_dict("records")):
+            missing = [key for key in ["checksum", "filepath"] if record[key] is None]
+            if missing:
+                self.error("files", row, f"missing {' and '.join(missing)}")
+                continue
+            if record["experiment_id"] is None:
+                self.error("files", row, f"no experiment for {record['filepath']}")
+                continue
+            file = by_checksum.get(record["checksum"]) or by_filepath.get(
+                record["filepath"]
+            )
+            if file is None:
+                file = File(
+                    filepath=record["filepath"],
+                    checksum=record["checksum"],
+                    checksum_type=record["checksum_type"],
+                    host=record["host"],
+                    filetype=record["filetype"],
+                    experiment_id=record["experiment_id"],
+                )
+                by_checksum[file.checksum] = by_filepath[file.filepath] = file
+                new_files.append(file)
+            elif (file.filepath, file.checksum, file.experiment_id) != (
+                record["filepath"],
+                record["checksum"],
+                record["experiment_id"],
+            ):
+                self.error(
+                    "files",
+                    row,
+                    f"{record['filepath']} conflicts with existing file {file.pk}",
+                )
+                continue
+            file_ids[row] = file.pk
+
+        self._bulk_create(File, new_files)
+        return file_ids
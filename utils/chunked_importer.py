@@ -0,0 +1,128 @@
+"""
+Chunked, resumable import of the sample, experiment and file sheets.
+
+The sheets are streamed in fixed-size chunks instead of being loaded into
+memory at once. Every chunk is imported by `BulkImporter` inside its own
+atomic block, together with an `ImportCheckpoint` row recording how far the
+sheet has been imported. A rerun with the same input file continues after the
+last committed chunk.
+"""
+
+import hashlib
+from typing import Dict, Iterator
+
+import pandas as pd
+from django.db import transaction
+
+from repository.models import ImportCheckpoint
+from utils.bulk_importer import BulkImporter, INPUT_DATA_LABELS
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """Return the sha256 hex digest of a file, read block by block"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def read_csv_chunks(
+    path: str, chunk_size: int, skip_rows: int = 0
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV file in chunks of at most `chunk_size` rows.
+
+    Cells are read as text like `utils.sheets.read_sheet`, so the chunked
+    import stores the same values as the other import modes.
+
+    Args:
+        path: Path to the CSV file.
+        chunk_size: Maximum number of rows per chunk.
+        skip_rows: Number of data rows (after the header) to skip.
+
+    Yields:
+        pd.DataFrame: The next chunk, indexed by the row position in the file.
+    """
+    with pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        skiprows=range(1, skip_rows + 1),
+        dtype=str,
+        keep_default_na=False,
+    ) as reader:
+        for chunk in reader:
+            chunk.index += skip_rows
+            yield chunk
+
+
+class ChunkedImporter:
+    """
+    Import the input sheets chunk by chunk with one transaction per chunk.
+
+    Progress is tracked per sheet and input file content, so a failed import
+    can be rerun with the same files and resumes where it stopped.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, importer=None):
+        self.chunk_size = chunk_size
+        self.importer = importer or BulkImporter()
+
+    def run(self, paths: Dict[str, str]):
+        """
+        Import all sheets in dependency order.
+
+        Args:
+            paths: Mapping of INPUT_DATA_LABELS to CSV file paths.
+
+        Returns:
+            Counter: Number of created objects per model.
+        """
+        for label in INPUT_DATA_LABELS:
+            self.import_sheet(label, paths[label])
+
+        print(
+            f"Created: {dict(self.importer.created)}, "
+            f"failed rows: {len(self.importer.errors)}"
+        )
+        return self.importer.created
+
+    def import_sheet(self, label: str, path: str):
+        """Import a single sheet, starting after its last committed chunk"""
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=file_fingerprint(path), sheet=label
+        )
+        if checkpoint.completed:
+            print(f"{label}: {path} already imported, skipping")
+            return
+        if checkpoint.rows_done:
+            print(f"{label}: resuming after row {checkpoint.rows_done}")
+
+        import_chunk = getattr(self, f"import_{label}_chunk")
+        for chunk in read_csv_chunks(path, self.chunk_size, checkpoint.rows_done):
+            self.importer.metrics.rows += len(chunk)
+            with transaction.atomic():
+                import_chunk(chunk)
+                checkpoint.rows_done += len(chunk)
+                checkpoint.save()
+            print(f"{label}: {checkpoint.rows_done} rows committed")
+
+        checkpoint.completed = True
+        checkpoint.save()
+
+    def import_samples_chunk(self, chunk: pd.DataFrame):
+        self.importer.import_samples(chunk)
+
+    def import_experiments_chunk(self, chunk: pd.DataFrame):
+        self.importer.import_experiments(chunk)
+
+    def import_files_chunk(self, chunk: pd.DataFrame):
+        # resolve the experiments from the database instead of merging with
+        # the experiment sheet, which is not kept in memory
+        experiment_ids = self.importer.experiment_ids_by_individual(
+            chunk["sample_name"]
+        )
+        chunk["experiment_id"] = chunk["sample_name"].map(experiment_ids)
+        self.importer.import_files(chunk)
@@ -1,11 +1,13 @@
-import pandas as pd
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
 
-# Read command line arguments as input CSV files
-input_csv = sys.argv[1:]
+COLUMN_INFO_CSV = "resources/samples_column_info.csv"
 
-# Load the column information from a CSV file
-df_column_info = pd.read_csv("resources/samples_column_info.csv")
+TISSUE_PRESERVATIVE_COLUMNS = ["EtOH", "Thymol", "FTA", "QLB", "RNAlater", "BC-QLB"]
 
 
 def get_column_map(df):
@@ -19,12 +21,20 @@ def get_column_map(df):
         dict: A dictionary mapping old column names to new column names.
     """
     df_subset = df[["column_name_tissueDB", "column_name_new"]].dropna()
-    df_t = df_subset.transpose()
-    df_t.columns = df_t.loc["column_name_tissueDB",].to_list()
-    df_t = df_t.drop("column_name_tissueDB")
-    column_map = df_t.to_dict("list")
-    column_map = dict((key, value[0]) for key, value in column_map.items())
-    return column_map
+    return dict(zip(df_subset.column_name_tissueDB, df_subset.column_name_new))
+
+
+def load_column_map(column_info_csv=COLUMN_INFO_CSV):
+    """
+    Loads the column mapping from the column information CSV file.
+
+    Args:
+        column_info_csv (str): Path to the column information CSV file.
+
+    Returns:
+        dict: A dictionary mapping old column names to new column names.
+    """
+    return get_column_map(pd.read_csv(column_info_csv))
 
 
 def tissue_preservative_mapper(df, target_colname="preservative"):
@@ -38,14 +48,13 @@ def tissue_preservative_mapper(df, target_colname="preservative"):
     Returns:
         pd.DataFrame: DataFrame with the preservation data mapped to the target column.
     """
-    _tp_colnames = ["EtOH", "Thymol", "FTA", "QLB", "RNAlater", "BC-QLB"]
-    tp_cols = df[_tp_colnames]
-    tp_cols = tp_cols.fillna("no")
-    tp_series = tp_cols.apply(
-        lambda row: ";".join(row[row == "yes"].index.to_list()), axis=1
-    )
-    df[target_colname] = tp_series
-    df = df.drop(columns=_tp_colnames)
+    tp_cols = df[TISSUE_PRESERVATIVE_COLUMNS].eq("yes")
+    # concatenate "<column>;" for every column marked "yes", column by column
+    tp_series = pd.Series("", index=df.index)
+    for colname in TISSUE_PRESERVATIVE_COLUMNS:
+        tp_series += np.where(tp_cols[colname], f"{colname};", "")
+    df[target_colname] = tp_series.str.rstrip(";")
+    df = df.drop(columns=TISSUE_PRESERVATIVE_COLUMNS)
     return df
 
 
@@ -55,6 +64,7 @@ def prepare_csv(input_csv, column_rename_map):
 
     Args:
         input_csv (str): Path to the input CSV file.
+        column_rename_map (dict): Mapping of old to new column names.
 
     Returns:
         pd.DataFrame: Processed DataFrame with renamed and modified columns.
@@ -65,35 +75,54 @@ def prepare_csv(input_csv, column_rename_map):
     csv_raw = tissue_preservative_mapper(csv_raw)
     # Rename columns according to the mapping
     csv_renamed = csv_raw.rename(columns=column_rename_map)
-    # Filter columns based on the mapping
-    csv_filtered = csv_renamed[list(set(column_rename_map.values()))]
+    # Filter columns based on the mapping, in a stable order
+    csv_filtered = csv_renamed[list(dict.fromkeys(column_rename_map.values()))]
     # Fill missing values with empty strings
     csv_filledNA = csv_filtered.fillna("")
     csv_filledNA["title"] = csv_filledNA.name
 
     # Replace empty organism values with "Unknown"
-    csv_filledNA.loc[csv_filledNA.organism == "", "organism"] = "Unknown"
+    organism = csv_filledNA.organism.astype(str)
+    organism = organism.where(organism != "", "Unknown")
+    # Replace "O." with "Oenanthe" in organism names
+    csv_filledNA["organism"] = organism.str.replace("O.", "Oenanthe", regex=False)
 
     # Update sex values to "male" or "female" based on patterns
-    csv_filledNA.loc[
-        csv_filledNA.sex.str.contains("^m.*", regex=True, case=False), "sex"
-    ] = "male"
-    csv_filledNA.loc[
-        csv_filledNA.sex.str.contains("^f.*", regex=True, case=False), "sex"
-    ] = "female"
-
-    # Replace "O." with "Oenanthe" in organism names
-    csv_filledNA["organism"] = csv_filledNA.organism.apply(
-        lambda x: x.replace("O.", "Oenanthe")
+    sex = csv_filledNA.sex.astype(str)
+    csv_filledNA["sex"] = np.select(
+        [sex.str.match("^f", case=False), sex.str.match("^m", case=False)],
+        ["female", "male"],
+        default=sex,
     )
     return csv_filledNA
 
 
-# Generate a mapping of old column names to new column names
-column_rename_map = get_column_map(df_column_info)
+def prepare_csvs(input_csvs, column_rename_map=None, workers=None):
+    """
+    Preprocesses several input CSV files concurrently and concatenates them.
 
-# Process and concatenate all input CSV files
-csv_output = pd.concat([prepare_csv(file, column_rename_map) for file in input_csv])
+    Args:
+        input_csvs (list): Paths to the input CSV files.
+        column_rename_map (dict): Mapping of old to new column names, loaded
+            from COLUMN_INFO_CSV if not given.
+        workers (int): Number of worker processes, defaults to the CPU count.
 
-# Write the final processed CSV to stdout
-csv_output.to_csv(sys.stdout, index=False)
+    Returns:
+        pd.DataFrame: The processed input files in the given order.
+    """
+    if column_rename_map is None:
+        column_rename_map = load_column_map()
+    prepare = partial(prepare_csv, column_rename_map=column_rename_map)
+
+    if len(input_csvs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            prepared = list(executor.map(prepare, input_csvs))
+    else:
+        prepared = [prepare(input_csv) for input_csv in input_csvs]
+    return pd.concat(prepared)
+
+
+if __name__ == "__main__":
+    # Read command line arguments as input CSV files, process and concatenate
+    # them and write the final processed CSV to stdout
+    prepare_csvs(sys.argv[1:]).to_csv(sys.stdout, index=False)
@@ -0,0 +1,407 @@
+"""
+Incremental re-import of the sample, experiment and file sheets.
+
+Every imported row is recorded as an `ImportRowHash` holding a hash of the
+row's cell text and the id of the object imported from it, keyed by a natural
+key: individual name and collection date for samples, individual and tissue
+type for experiments and the checksum for files. On a rerun each sheet is
+split into
+
+* unchanged rows, whose hash matches the stored one, skipped without any
+  model work,
+* changed rows, written as targeted updates of the object imported from the
+  row,
+* new rows, imported by `BulkImporter`,
+
+and keys stored for a sheet but missing from it are reported as removed. A
+rerun costs one chunked IN query for the stored hashes plus work proportional
+to the number of new and changed rows.
+"""
+
+from collections import Counter
+from typing import Dict, List
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from repository.bulk import (
+    BULK_CREATE_BATCH_SIZE,
+    bulk_link,
+    filter_in_chunks,
+    lookup_map,
+)
+from repository.import_metrics import measured
+from repository.models import (
+    BioSample,
+    Experiment,
+    File,
+    ImportRowHash,
+    Individual,
+    SamplingEvent,
+)
+from utils.bulk_importer import (
+    BIOSAMPLE_COLUMNS,
+    COLOR_COLUMNS,
+    EXPERIMENT_COLUMNS,
+    INPUT_DATA_LABELS,
+    SAMPLING_EVENT_COLUMN_MAP,
+    SAMPLING_EVENT_COLUMNS,
+    BulkImporter,
+    blank_to_none,
+    split_preservatives,
+    split_ringers,
+)
+from utils.sheets import read_sheet
+
+# Natural key columns of the rows of each sheet
+SHEET_KEY_COLUMNS = {
+    "samples": ["name", "collection_date"],
+    "experiments": ["individual", "tissue_type"],
+    "files": ["checksum"],
+}
+
+# Model of the object imported from a row of each sheet
+SHEET_MODELS = {"samples": BioSample, "experiments": Experiment, "files": File}
+
+KEY_SEPARATOR = "|"
+
+SAMPLING_EVENT_FIELDS = (
+    ["sampling_country"]
+    + list(SAMPLING_EVENT_COLUMN_MAP.values())
+    + SAMPLING_EVENT_COLUMNS
+    + COLOR_COLUMNS
+)
+BIOSAMPLE_FIELDS = ["external_collection_name"] + BIOSAMPLE_COLUMNS
+EXPERIMENT_FIELDS = ["instrument_model", "exp_attributes"] + EXPERIMENT_COLUMNS
+FILE_FIELDS = ["filepath", "checksum_type", "host", "filetype", "experiment_id"]
+
+
+def row_keys(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """
+    Build the natural key of every row.
+
+    Args:
+        df: The sheet, read by `read_sheet`.
+        columns: The natural key columns.
+
+    Returns:
+        pd.Series: The key of every row. Repeated keys are numbered in sheet
+        order, e.g. "OE00001|12/05/2021#1" for the second row of a bird sampled
+        twice on the same day.
+    """
+    keys = df[columns[0]]
+    for column in columns[1:]:
+        keys = keys + KEY_SEPARATOR + df[column]
+    occurrence = keys.groupby(keys).cumcount()
+    return keys.where(occurrence == 0, keys + "#" + occurrence.astype(str))
+
+
+def row_digests(df: pd.DataFrame) -> pd.Series:
+    """Hash the cell text of every row, independent of the column order"""
+    hashes = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False)
+    return hashes.map("{:016x}".format)
+
+
+class IncrementalImporter:
+    """
+    Re-import the input sheets, touching only new and changed rows.
+
+    Removed rows are only reported, the objects imported from them are kept.
+    """
+
+    def __init__(self, importer=None, batch_size: int = BULK_CREATE_BATCH_SIZE):
+        self.importer = importer or BulkImporter()
+        self.metrics = self.importer.metrics
+        self.batch_size = batch_size
+        self.stats: Dict[str, Counter] = {}
+        self.removed: Dict[str, List[str]] = {}
+
+    def run(self, paths: Dict[str, str]):
+        """
+        Import all sheets in dependency order within one transaction.
+
+        Args:
+            paths: Mapping of INPUT_DATA_LABELS to CSV file paths.
+
+        Returns:
+            dict: Number of new, changed, unchanged and removed rows per sheet.
+        """
+        with transaction.atomic():
+            for label in INPUT_DATA_LABELS:
+                self.import_sheet(label, read_sheet(paths[label]))
+
+        for label, stats in self.stats.items():
+            print(f"{label}: {dict(stats)}")
+            for key in self.removed[label]:
+                print(f"REMOVED: {label} {key}")
+        print(
+            f"Created: {dict(self.importer.created)}, "
+            f"failed rows: {len(self.importer.errors)}"
+        )
+        return self.stats
+
+    def import_sheet(self, label: str, df: pd.DataFrame):
+        """Skip the unchanged rows of a sheet, update changed and import new ones"""
+        self.metrics.rows += len(df)
+        with self.metrics.stage(f"{label}.hashes", rows=len(df)):
+            keys = row_keys(df, SHEET_KEY_COLUMNS[label])
+            digests = row_digests(df)
+            stored = {
+                row_hash.key: row_hash
+                for row_hash in filter_in_chunks(
+                    ImportRowHash.objects.filter(sheet=label), "key", keys
+                )
+            }
+            object_ids = keys.map({key: h.object_id for key, h in stored.items()})
+            stored_digests = keys.map({key: h.digest for key, h in stored.items()})
+
+            # rows whose object was deleted since the last import are new again
+            existing = set(
+                filter_in_chunks(
+                    SHEET_MODELS[label].objects.values_list("pk", flat=True),
+                    "pk",
+                    object_ids.dropna(),
+                )
+            )
+            new = ~object_ids.isin(existing)
+            unchanged = ~new & (stored_digests == digests)
+            changed = ~new & ~unchanged
+
+        ids = pd.Series(None, index=df.index, dtype=object)
+        if new.any():
+            ids[new] = getattr(self, f"import_{label}")(df[new])
+        if changed.any():
+            ids[changed] = getattr(self, f"update_{label}")(
+                df[changed], object_ids[changed]
+            )
+        with self.metrics.stage(f"{label}.hashes"):
+            self.save_hashes(label, stored, keys[ids.notna()], digests, ids)
+            self.removed[label] = sorted(
+                set(
+                    ImportRowHash.objects.filter(sheet=label).values_list(
+                        "key", flat=True
+                    )
+                )
+                - set(keys)
+            )
+        self.stats[label] = Counter(
+            new=int(new.sum()),
+            changed=int(changed.sum()),
+            unchanged=int(unchanged.sum()),
+            removed=len(self.removed[label]),
+        )
+
+    def save_hashes(self, label, stored, keys, digests, ids):
+        """Store the hashes of the imported rows, failed rows are retried"""
+        new_hashes, changed_hashes = [], []
+        now = timezone.now()
+        for row, key in keys.items():
+            row_hash = stored.get(key)
+            if row_hash is None:
+                new_hashes.append(
+                    ImportRowHash(
+                        sheet=label, key=key, digest=digests[row], object_id=ids[row]
+                    )
+                )
+            else:
+                row_hash.digest, row_hash.object_id = digests[row], ids[row]
+                row_hash.updated = now
+                changed_hashes.append(row_hash)
+        ImportRowHash.objects.bulk_create(new_hashes, batch_size=self.batch_size)
+        ImportRowHash.objects.bulk_update(
+            changed_hashes,
+            ["digest", "object_id", "updated"],
+            batch_size=self.batch_size,
+        )
+
+    def import_samples(self, df: pd.DataFrame) -> pd.Series:
+        return self.importer.import_samples(df)
+
+    def import_experiments(self, df: pd.DataFrame) -> pd.Series:
+        return self.importer.import_experiments(df)
+
+    def import_files(self, df: pd.DataFrame) -> pd.Series:
+        experiment_ids = self.importer.experiment_ids_by_individual(df["sample_name"])
+        df = df.assign(experiment_id=df["sample_name"].map(experiment_ids))
+        return self.importer.import_files(df)
+
+    @measured("samples.update")
+    def update_samples(self, df: pd.DataFrame, biosample_ids: pd.Series) -> pd.Series:
+        """
+        Update the individuals, sampling events and biosamples of changed rows.
+
+        Args:
+            df: The changed rows of the sample sheet.
+            biosample_ids: The id of the BioSample imported from each row.
+
+        Returns:
+            pd.Series: BioSample ids aligned to the index of `df`, None for rows
+            that were not updated.
+        """
+        ids = pd.Series(None, index=df.index, dtype=object)
+        df = self.importer.prepare_samples(df)
+        if df.empty:
+            return ids
+
+        vocabularies = self.importer.resolve_sample_vocabularies(df)
+        ringers = split_ringers(df)
+        preservatives = split_preservatives(df)
+        biosamples = lookup_map(
+            BioSample,
+            "pk",
+            biosample_ids[df.index],
+            queryset=BioSample.objects.select_related("sampling_event__individual"),
+        )
+
+        individuals, events = {}, {}
+        ringer_links, preservative_links = [], []
+        for row, record in zip(df.index, df.to_dict("records")):
+            biosample = biosamples[biosample_ids[row]]
+            event = biosample.sampling_event
+            individual = event.individual
+            individual.organism = vocabularies["organism"][record["organism"]]
+            individual.sex = vocabularies["sex"][record["sex"]]
+            for field, value in self.importer.sampling_event_values(
+                record, vocabularies
+            ).items():
+                setattr(event, field, value)
+            for field, value in self.importer.biosample_values(
+                record, vocabularies
+            ).items():
+                setattr(biosample, field, value)
+            individuals[individual.pk] = individual
+            events[event.pk] = event
+
+            ringer_links += [
+                (event.pk, vocabularies["person"][initials].pk)
+                for initials in ringers[row]
+            ]
+            for label in preservatives[row]:
+                if label not in vocabularies["preservative"]:
+                    self.importer.error("samples", row, f"unknown preservative {label}")
+                    continue
+                preservative_links.append(
+                    (biosample.pk, vocabularies["preservative"][label].pk)
+                )
+            ids[row] = biosample.pk
+
+        Individual.objects.bulk_update(
+            individuals.values(), ["organism", "sex"], batch_size=self.batch_size
+        )
+        SamplingEvent.objects.bulk_update(
+            events.values(), SAMPLING_EVENT_FIELDS, batch_size=self.batch_size
+        )
+        updated = [biosamples[pk] for pk in ids.dropna().unique()]
+        BioSample.objects.bulk_update(
+            updated, BIOSAMPLE_FIELDS, batch_size=self.batch_size
+        )
+        bulk_link(
+            SamplingEvent.ringer_name, ringer_links, replace=True, sources=list(events)
+        )
+        bulk_link(
+            BioSample.preservative,
+            preservative_links,
+            replace=True,
+            sources=[biosample.pk for biosample in updated],
+        )
+        return ids
+
+    @measured("experiments.update")
+    def update_experiments(
+        self, df: pd.DataFrame, experiment_ids: pd.Series
+    ) -> pd.Series:
+        """
+        Update the experiments of changed rows of the experiment sheet.
+
+        Args:
+            df: The changed rows of the experiment sheet.
+            experiment_ids: The id of the Experiment imported from each row.
+
+        Returns:
+            pd.Series: Experiment ids aligned to the index of `df`, None for
+            rows that were not updated.
+        """
+        ids = pd.Series(None, index=df.index, dtype=object)
+        df = blank_to_none(df)
+        instruments = self.importer.instrument_map(df)
+        experiments = lookup_map(Experiment, "pk", experiment_ids)
+
+        for row, record in zip(df.index, df.to_dict("records")):
+            instrument = instruments.get(
+                (record["instrument_model"], record["platform"])
+            )
+            if instrument is None:
+                self.importer.error(
+                    "experiments",
+                    row,
+                    f"Instrument {record['platform']} {record['instrument_model']} "
+                    "not found",
+                )
+                continue
+            experiment = experiments[experiment_ids[row]]
+            for field, value in self.importer.experiment_values(
+                record, instrument
+            ).items():
+                setattr(experiment, field, value)
+            ids[row] = experiment.pk
+
+        Experiment.objects.bulk_update(
+            [experiments[pk] for pk in ids.dropna().unique()],
+            EXPERIMENT_FIELDS,
+            batch_size=self.batch_size,
+        )
+        return ids
+
+    @measured("files.update")
+    def update_files(self, df: pd.DataFrame, file_ids: pd.Series) -> pd.Series:
+        """
+        Update the files of changed rows of the file sheet.
+
+        Args:
+            df: The changed rows of the file sheet.
+            file_ids: The id of the File imported from each row.
+
+        Returns:
+            pd.Series: File ids aligned to the index of `df`, None for rows
+            that were not updated.
+        """
+        ids = pd.Series(None, index=df.index, dtype=object)
+        df = blank_to_none(df)
+        df["checksum_type"] = df["checksum_type"].map(
+            lambda value: value.lower() if value else value
+        )
+        experiment_ids = self.importer.experiment_ids_by_individual(df["sample_name"])
+        files = lookup_map(File, "pk", file_ids)
+        by_filepath = lookup_map(File, "filepath", df["filepath"])
+
+        for row, record in zip(df.index, df.to_dict("records")):
+            experiment_id = experiment_ids.get(record["sample_name"])
+            if experiment_id is None:
+                self.importer.error(
+                    "files", row, f"no experiment for {record['filepath']}"
+                )
+                continue
+            file = files[file_ids[row]]
+            other = by_filepath.get(record["filepath"])
+            if other is not None and other.pk != file.pk:
+                self.importer.error(
+                    "files",
+                    row,
+                    f"{record['filepath']} conflicts with existing file {other.pk}",
+                )
+                continue
+            file.filepath = record["filepath"]
+            file.checksum_type = record["checksum_type"]
+            file.host = record["host"]
+            file.filetype = record["filetype"]
+            file.experiment_id = experiment_id
+            by_filepath[file.filepath] = file
+            ids[row] = file.pk
+
+        File.objects.bulk_update(
+            [files[pk] for pk in ids.dropna().unique()],
+            FILE_FIELDS,
+            batch_size=self.batch_size,
+        )
+        return ids
@@ -9,20 +9,51 @@ Expect 3 CSV files with the following columns:
 2) Library data
 
 3) File data
+
+With `--mode bulk` the sheets are imported set-wise by `BulkImporter`
+(see `utils/bulk_importer.py`) instead of row by row. `--mode chunked` streams
+the sheets in chunks of `--chunk-size` rows with one transaction and
+checkpoint per chunk, a rerun resumes after the last committed chunk
+(see `utils/chunked_importer.py`). `--mode parallel` imports row partitions in
+`--workers` processes (see `utils/parallel_importer.py`). `--mode incremental`
+only imports new and changed rows since the last incremental import and
+reports removed ones (see `utils/incremental_importer.py`).
+
+With `--validate` all sheets are checked column-wise against the model field
+validators and choices first (see `utils/sheet_validator.py`). Nothing is
+imported if any row fails, the errors are printed and written to
+`--error-report` if given.
+
+Every mode collects per-stage throughput metrics (see
+`repository/import_metrics.py`), written as JSON to `--metrics` or stdout at
+the end of the run. `--profile` additionally dumps cProfile stats of the run.
+
+Example, importing the anonymized dummy sheets set-wise:
+
+    python -m utils.naive_sample_importer --mode bulk \
+        --samples resources/dummy-data/samples_anonymized.csv \
+        --experiments resources/dummy-data/experiments_anonymized.csv \
+        --files resources/dummy-data/files_anonymized.csv
 """
 
 import argparse
 import decimal
 import os
 from typing import Type
+import django
 import django.db.models
-import numpy as np
 import pandas as pd
 from django.db import transaction
 
 from decimal import InvalidOperation
 
+if __name__ == "__main__":
+    # run as script, set up Django before the models are imported
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sampledb.settings.development")
+    django.setup()
+
 # Import relevant models from Django application
+from repository.import_metrics import ImportMetrics
 from repository.models import (
     BioSample,
     SamplingEvent,
@@ -44,6 +75,17 @@ from datetime import datetime
 
 # Import settings and utilities from Django application
 from sampledb.settings.base import DATE_INPUT_FORMATS
+from utils.bulk_importer import (
+    BulkImporter,
+    INPUT_DATA_LABELS,
+    EXP_SPREADSHEET_ADDITIONAL_ATTRIBUTES,
+    blank_to_none,
+)
+from utils.chunked_importer import ChunkedImporter, DEFAULT_CHUNK_SIZE
+from utils.incremental_importer import IncrementalImporter
+from utils.parallel_importer import ParallelImporter
+from utils.sheet_validator import validate_files
+from utils.sheets import read_sheet
 
 from django.core.exceptions import ValidationError, MultipleObjectsReturned
 from django.db.utils import IntegrityError
@@ -114,34 +156,6 @@ def robust_round(number, ndigits=None):
         return number
 
 
-# Labels for input data
-INPUT_DATA_LABELS = ["samples", "experiments", "files"]
-
-# Additional attributes for experiment spreadsheet
-EXP_SPREADSHEET_ADDITIONAL_ATTRIBUTES = ["i7", "i5", "date_extraction", "dilution"]
-
-parser = argparse.ArgumentParser()
-
-# Add command-line arguments for input CSV files
-for data_label in INPUT_DATA_LABELS:
-    parser.add_argument(f"--{data_label}", required=True)
-
-# Example command-line arguments for testing
-cl_args = (
-    "--samples resources/dummy-data/samples_anonymized.csv"
-    " --experiments resources/dummy-data/experiments_anonymized.csv"
-    " --files resources/dummy-data/files_anonymized.csv"
-)
-
-# Parse command-line arguments
-args = parser.parse_args(cl_args.split())
-
-# Load data from CSV files into a dictionary
-data = {
-    label: pd.read_csv(fname).replace(np.nan, None)
-    for label, fname in vars(args).items()
-}
-
 # Function to create individual, sampling event, and biosample records
 @catch_validation_error
 def create_individual_sampling_sample(row: pd.Series):
@@ -326,24 +340,108 @@ def create_file(row_series: pd.Series):
     )
     return file
 
-# Create individual, sampling event, and biosample records from sample data
-samples = data["samples"].apply(create_individual_sampling_sample, axis=1)
 
-# Create experiment records from experiment data
-experiments = data["experiments"].apply(create_experiment, axis=1)
-data["experiments"].loc[:, "experiment_id"] = experiments.apply(
-    lambda elem: elem.id if elem else None
-)
+# Import modes: row-wise get_or_create, set-based bulk import, chunked and
+# resumable bulk import, bulk import in parallel worker processes or
+# incremental import of new and changed rows
+IMPORT_MODES = ["naive", "bulk", "chunked", "parallel", "incremental"]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """The command-line arguments of the importer"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+
+    # Add command-line arguments for input CSV files
+    for data_label in INPUT_DATA_LABELS:
+        parser.add_argument(f"--{data_label}", required=True)
+    parser.add_argument("--mode", choices=IMPORT_MODES, default="naive")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--error-report", default=None)
+    parser.add_argument("--metrics", default=None)
+    parser.add_argument("--profile", default=None)
+    return parser
 
-# Merge files data with experiments data and create file records
-data["files"] = data["files"].merge(
-    data["experiments"],
-    how="left",
-    left_on="sample_name",
-    right_on="individual",
-    validate="many_to_one",
-)
-files = data["files"].apply(create_file, axis=1)
 
-# Commit the transaction to save changes to the database
-transaction.commit()
+def import_naive(data, metrics):
+    """Import the sheets row by row with `get_or_create`"""
+    metrics.rows += sum(len(df) for df in data.values())
+
+    # Create individual, sampling event, and biosample records from sample data
+    with metrics.stage("samples", rows=len(data["samples"])):
+        data["samples"].apply(
+            metrics.timed(create_individual_sampling_sample, "samples"), axis=1
+        )
+
+    # Create experiment records from experiment data
+    with metrics.stage("experiments", rows=len(data["experiments"])):
+        experiments = data["experiments"].apply(
+            metrics.timed(create_experiment, "experiments"), axis=1
+        )
+    data["experiments"].loc[:, "experiment_id"] = experiments.apply(
+        lambda elem: elem.id if elem else None
+    )
+
+    # Merge files data with experiments data and create file records
+    data["files"] = data["files"].merge(
+        data["experiments"],
+        how="left",
+        left_on="sample_name",
+        right_on="individual",
+        validate="many_to_one",
+    )
+    with metrics.stage("files", rows=len(data["files"])):
+        data["files"].apply(metrics.timed(create_file, "files"), axis=1)
+
+    # Commit the transaction to save changes to the database
+    transaction.commit()
+
+
+def main(argv=None):
+    """
+    Run the importer.
+
+    Args:
+        argv: The command-line arguments, defaults to `sys.argv`.
+    """
+    args = build_parser().parse_args(argv)
+    paths = {label: getattr(args, label) for label in INPUT_DATA_LABELS}
+    metrics = ImportMetrics(
+        f"naive_sample_importer {args.mode}", profile_path=args.profile
+    )
+
+    # Validate all sheets before anything is written to the database
+    if args.validate:
+        errors = validate_files(paths)
+        if not errors.empty:
+            print(errors.to_string(index=False))
+            if args.error_report:
+                errors.to_csv(args.error_report, index=False)
+            raise SystemExit(f"{len(errors)} validation errors, nothing imported")
+
+    # The chunked and incremental modes read the files themselves
+    if args.mode == "chunked":
+        ChunkedImporter(
+            chunk_size=args.chunk_size, importer=BulkImporter(metrics=metrics)
+        ).run(paths)
+    elif args.mode == "incremental":
+        IncrementalImporter(importer=BulkImporter(metrics=metrics)).run(paths)
+    else:
+        # cells as text like the other modes, so stored values and the keys
+        # matched on a rerun agree, e.g. tube "1" instead of 1.0
+        data = {
+            label: blank_to_none(read_sheet(path)) for label, path in paths.items()
+        }
+        if args.mode == "bulk":
+            BulkImporter(metrics=metrics).run(data)
+        elif args.mode == "parallel":
+            ParallelImporter(workers=args.workers, metrics=metrics).run(data)
+        else:
+            import_naive(data, metrics)
+
+    metrics.report(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
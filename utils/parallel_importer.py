@@ -0,0 +1,195 @@
+"""
+Parallel import of the sample, experiment and file sheets.
+
+The shared vocabularies (Organism, SampleSex, Country, Color, Person,
+ExternalCollection, Tissue) are resolved once in the parent process. The rows
+of every stage are then partitioned and imported by `BulkImporter` in a pool
+of worker processes, each with its own database connection and transaction.
+Stages run one after another because experiments need the biosamples and
+files need the experiments of the previous stage.
+
+Rows are assigned to partitions by a stable hash of the individual name, so
+all rows of one individual end up in the same worker and workers never race
+for the same `Individual.name`. Duplicate `File.checksum`/`File.filepath`
+values within the file sheet are resolved in the parent before partitioning:
+the first row in sheet order wins, later ones are reported.
+
+SQLite does not support concurrent writers, on SQLite all partitions are
+imported in the parent process.
+"""
+
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import pandas as pd
+from django.db import connection, connections, transaction
+
+from repository.bulk import get_or_create_map
+from repository.import_metrics import ImportMetrics
+from repository.models import Tissue
+from utils.bulk_importer import BulkImporter, blank_to_none
+
+
+def partition_of(key, partitions: int) -> int:
+    """Stable (not per-process salted) partition number of a key"""
+    return zlib.crc32(str(key).encode()) % partitions
+
+
+def split_by_key(df: pd.DataFrame, column: str, partitions: int) -> List[pd.DataFrame]:
+    """Split `df` into at most `partitions` non-empty parts by `column`"""
+    part = df[column].map(lambda key: partition_of(key, partitions))
+    return [df[part == i] for i in range(partitions) if (part == i).any()]
+
+
+def import_partition(stage: str, df: pd.DataFrame):
+    """
+    Import one partition of a stage, executed in a worker process.
+
+    Args:
+        stage: One of "samples", "experiments" or "files".
+        df: The rows of the partition.
+
+    Returns:
+        tuple: The created ids aligned to `df`, the errors, the number of
+        created objects per model and the metrics of the partition.
+    """
+    importer = BulkImporter(metrics=ImportMetrics(stage))
+    with transaction.atomic():
+        ids = getattr(importer, f"import_{stage}")(df)
+    return ids, importer.errors, importer.created, importer.metrics
+
+
+class ParallelImporter:
+    """
+    Import the input sheets with a pool of worker processes per stage.
+
+    Args:
+        workers: Number of worker processes, defaults to the number of CPUs.
+        metrics: Metrics to merge the metrics of all partitions into.
+        partitions: Number of row partitions per stage, defaults to `workers`.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        metrics: Optional[ImportMetrics] = None,
+        partitions: Optional[int] = None,
+    ):
+        self.workers = workers or os.cpu_count()
+        if self.workers > 1 and connection.vendor == "sqlite":
+            print("SQLite does not support concurrent writers, using one process")
+            self.workers = 1
+        self.partitions = partitions or self.workers
+        self.errors: List[Dict] = []
+        self.created: Counter = Counter()
+        self.metrics = metrics or ImportMetrics("parallel")
+
+    def run(self, data: Dict[str, pd.DataFrame]):
+        """
+        Import all sheets in dependency order.
+
+        Args:
+            data: Mapping of INPUT_DATA_LABELS to the loaded DataFrames.
+
+        Returns:
+            Counter: Number of created objects per model.
+        """
+        self.metrics.rows += sum(len(df) for df in data.values())
+        with self.metrics.stage("vocabularies"):
+            self.resolve_vocabularies(data)
+
+        samples = data["samples"]
+        self.run_stage(
+            "samples",
+            split_by_key(samples[samples["name"].notna()], "name", self.partitions)
+            + [samples[samples["name"].isna()]],
+        )
+
+        experiments = data["experiments"].copy()
+        experiments.loc[:, "experiment_id"] = self.run_stage(
+            "experiments", split_by_key(experiments, "individual", self.partitions)
+        )
+
+        files = data["files"].merge(
+            experiments,
+            how="left",
+            left_on="sample_name",
+            right_on="individual",
+            validate="many_to_one",
+        )
+        files = self.drop_duplicate_files(files)
+        self.run_stage("files", split_by_key(files, "sample_name", self.partitions))
+
+        self.errors.sort(key=lambda error: (error["sheet"], error["row"]))
+        print(f"Created: {dict(self.created)}, failed rows: {len(self.errors)}")
+        return self.created
+
+    def resolve_vocabularies(self, data: Dict[str, pd.DataFrame]):
+        """Create the shared vocabularies once, before the workers start"""
+        importer = BulkImporter()
+        importer.resolve_sample_vocabularies(importer.prepare_samples(data["samples"]))
+        get_or_create_map(
+            Tissue, "name", blank_to_none(data["experiments"])["tissue_type"]
+        )
+
+    def drop_duplicate_files(self, files: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keep the first row per checksum and filepath, report the others.
+
+        Rows missing a checksum or filepath are kept, they fail on import with
+        the error of the missing value.
+        """
+        duplicated = pd.Series(False, index=files.index)
+        for column in ["checksum", "filepath"]:
+            duplicated |= files[column].duplicated() & files[column].notna()
+        for row in files.index[duplicated]:
+            self.errors.append(
+                {
+                    "sheet": "files",
+                    "row": row,
+                    "reason": f"duplicate checksum or filepath "
+                    f"{files.at[row, 'filepath']} in sheet",
+                }
+            )
+        return files[~duplicated]
+
+    def run_stage(self, stage: str, partitions: List[pd.DataFrame]) -> pd.Series:
+        """
+        Import the partitions of a stage and merge the worker results.
+
+        Args:
+            stage: One of "samples", "experiments" or "files".
+            partitions: The row partitions, one task per partition.
+
+        Returns:
+            pd.Series: The created ids of all partitions, in sheet order.
+        """
+        partitions = [partition for partition in partitions if not partition.empty]
+        if not partitions:
+            return pd.Series(dtype=object)
+
+        if self.workers > 1:
+            # forked workers must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=get_context("fork")
+            ) as executor:
+                results = list(
+                    executor.map(import_partition, repeat(stage), partitions)
+                )
+        else:
+            results = [import_partition(stage, partition) for partition in partitions]
+
+        for _, errors, created, metrics in results:
+            self.errors += errors
+            self.created.update(created)
+            self.metrics.merge(metrics)
+        print(
+            f"{stage}: {sum(len(p) for p in partitions)} rows in {len(results)} parts"
+        )
+        return pd.concat([ids for ids, _, _, _ in results]).sort_index()
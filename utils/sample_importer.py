@@ -1,50 +1,136 @@
 #!/usr/env python
+"""
+Import the curated sample sheet through the import-export resources.
 
+Rows failing for a resource are isolated by `bisect_import`, not passed on to
+the dependent resources and written with their reason to
+`resources/samples_curated.failed_import.csv`. Run as
+
+    python -m utils.sample_importer --metrics metrics.json
+"""
+
+import argparse
+import os
+
+import django
 import pandas as pd
 import tablib
 
-from repository.admin import (
+if __name__ == "__main__":
+    # run as script, set up Django before the models are imported
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sampledb.settings.development")
+    django.setup()
+
+from repository.import_metrics import ImportMetrics
+from repository.resources import (
     IndividualResource,
     SamplingEventResource,
     BioSampleResource,
 )
 
 
-df = pd.read_csv("resources/samples_curated.csv")
-df.fillna("", inplace=True)
-colnames = df.columns.to_list()
-
-dataset_failed = tablib.Dataset(headers=colnames)
-
-dataset = tablib.Dataset(headers=colnames)
-for i, row in df.iterrows():
-    dataset.append(row.to_list())
-
-biosample_resource = BioSampleResource()
-individual_resource = IndividualResource()
-samplingevent_resource = SamplingEventResource()
-
-results = individual_resource.import_data(dataset, dry_run=False)
-# results = samplingevent_resource.import_data(dataset, dry_run=True)
-# results = biosample_resource.import_data(dataset, dry_run=True)
-
-print(results.totals)
-
-if results.total_rows != len(results.valid_rows()):
-    for i, row in df.iterrows():
-        dataset = tablib.Dataset(row.to_list(), headers=colnames)
-        for resource in [
-            individual_resource,
-            samplingevent_resource,
-            biosample_resource,
-        ]:
-            results = resource.import_data(dataset, dry_run=True)
-            if len(results.valid_rows()) == 1:
-                results = resource.import_data(dataset, dry_run=False)
-                print(f"row {i} successful  for {resource.__class__()}")
-            else:
-                print(f"row {i} unsuccessful for {resource.__class__()}")
-                dataset_failed.append(row.to_list())
-    dataset_failed.get_df().to_csv(
-        "resources/samples_curated.failed_import.csv", index=False
+def failure_reasons(result):
+    """Collect the error and validation messages of an import result"""
+    reasons = [str(error.error) for error in result.base_errors]
+    reasons += [
+        str(error.error) for _, errors in result.row_errors() for error in errors
+    ]
+    reasons += [
+        f"{field}: {', '.join(str(message) for message in messages)}"
+        for invalid_row in result.invalid_rows
+        for field, messages in invalid_row.error_dict.items()
+    ]
+    return reasons
+
+
+def bisect_import(resource, dataset, rows):
+    """
+    Import a dataset, splitting failing blocks in halves to isolate bad rows.
+
+    Every block is imported once for real inside a transaction that is rolled
+    back on any error or validation error. Only failing blocks are split, so a
+    sheet with k bad rows costs O(k log n) imports instead of one dry run and
+    one import per row.
+
+    Args:
+        resource: The import-export resource used for the import.
+        dataset: The rows to import as ``tablib.Dataset``.
+        rows: The row numbers in the input sheet of the rows in `dataset`.
+
+    Returns:
+        dict: Row number to failure reason for the rows that were not imported.
+    """
+    result = resource.import_data(
+        dataset, dry_run=False, rollback_on_validation_errors=True
     )
+    if not (result.has_errors() or result.has_validation_errors()):
+        return {}
+    if len(rows) == 1:
+        return {rows[0]: "; ".join(failure_reasons(result))}
+
+    middle = len(rows) // 2
+    failed = {}
+    for half in (slice(None, middle), slice(middle, None)):
+        failed.update(
+            bisect_import(
+                resource,
+                tablib.Dataset(*dataset[half], headers=dataset.headers),
+                rows[half],
+            )
+        )
+    return failed
+
+
+def main(argv=None):
+    """
+    Run the import.
+
+    Args:
+        argv: The command-line arguments, defaults to `sys.argv`.
+    """
+    # Throughput metrics as JSON to --metrics (default stdout), cProfile stats
+    # of the whole run to --profile
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", default=None)
+    parser.add_argument("--profile", default=None)
+    args = parser.parse_args(argv)
+    metrics = ImportMetrics("sample_importer", profile_path=args.profile)
+
+    df = pd.read_csv("resources/samples_curated.csv")
+    df.fillna("", inplace=True)
+    colnames = df.columns.to_list()
+    # every resource imports the sheet, failing blocks are imported repeatedly
+    metrics.rows = len(df)
+
+    biosample_resource = BioSampleResource()
+    individual_resource = IndividualResource()
+    samplingevent_resource = SamplingEventResource()
+
+    # rows failing for a resource are not passed on to the dependent resources
+    failed_rows = {}
+    for resource in [individual_resource, samplingevent_resource, biosample_resource]:
+        resource.metrics = metrics
+        rows = [i for i in range(len(df)) if i not in failed_rows]
+        dataset = tablib.Dataset(
+            *df.iloc[rows].itertuples(index=False, name=None), headers=colnames
+        )
+        failed = bisect_import(resource, dataset, rows)
+        for i, reason in failed.items():
+            failed_rows[i] = f"{resource.__class__.__name__}: {reason}"
+        print(
+            f"{resource.__class__.__name__}: {len(rows) - len(failed)} rows successful, "
+            f"{len(failed)} unsuccessful"
+        )
+
+    if failed_rows:
+        dataset_failed = df.iloc[sorted(failed_rows)].copy()
+        dataset_failed["reason"] = [failed_rows[i] for i in sorted(failed_rows)]
+        dataset_failed.to_csv(
+            "resources/samples_curated.failed_import.csv", index=False
+        )
+
+    metrics.report(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
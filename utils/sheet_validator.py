@@ -0,0 +1,213 @@
+"""
+Set-based validation of the sample, experiment and file sheets.
+
+The rules are derived from the model fields the sheet columns are imported
+into: decimal precision and the Min/MaxValueValidator bounds of
+`DECIMAL_MEASUREMENT_ATTRIBUTE` and `DECIMAL_COORDINATE_ATTRIBUTE`, the
+`DATE_INPUT_FORMATS` of date fields, the choices of enum fields, maximum
+lengths and regex validators. Every rule is evaluated on a whole column at
+once, so a complete error report is available before anything is written to
+the database.
+"""
+
+from typing import Dict, List
+
+import pandas as pd
+from django.core.validators import (
+    BaseValidator,
+    MaxLengthValidator,
+    MinLengthValidator,
+    RegexValidator,
+)
+from django.db import models
+
+from repository.models import BioSample, Experiment, File, Individual, SamplingEvent
+from sampledb.settings.base import DATE_INPUT_FORMATS
+from utils.bulk_importer import (
+    BIOSAMPLE_COLUMNS,
+    EXPERIMENT_COLUMNS,
+    SAMPLING_EVENT_COLUMN_MAP,
+    SAMPLING_EVENT_COLUMNS,
+    parse_dates,
+)
+from utils.sheets import read_sheet
+
+FILE_COLUMNS = ["filepath", "checksum", "checksum_type", "host", "filetype"]
+
+# Model field each sheet column is imported into
+SHEET_FIELDS = {
+    "samples": {
+        "name": Individual._meta.get_field("name"),
+        **{
+            column: SamplingEvent._meta.get_field(
+                SAMPLING_EVENT_COLUMN_MAP.get(column, column)
+            )
+            for column in list(SAMPLING_EVENT_COLUMN_MAP) + SAMPLING_EVENT_COLUMNS
+        },
+        **{column: BioSample._meta.get_field(column) for column in BIOSAMPLE_COLUMNS},
+    },
+    "experiments": {
+        column: Experiment._meta.get_field(column) for column in EXPERIMENT_COLUMNS
+    },
+    "files": {column: File._meta.get_field(column) for column in FILE_COLUMNS},
+}
+
+# Normalisation the importers apply to a column before saving it
+COLUMN_NORMALIZERS = {"checksum_type": lambda values: values.str.lower()}
+
+ERROR_COLUMNS = ["sheet", "row", "column", "value", "reason"]
+
+
+def column_errors(values: pd.Series, field: models.Field) -> pd.DataFrame:
+    """
+    Check a sheet column against the rules of a model field.
+
+    Args:
+        values: The distinct non-empty values of the column.
+        field: The model field the column is imported into.
+
+    Returns:
+        pd.DataFrame: One row per failed check, with the index label of the
+        value in `row` and the `reason`.
+    """
+    checks = []
+    internal_type = field.get_internal_type()
+    if internal_type == "DecimalField":
+        numeric = pd.to_numeric(values, errors="coerce")
+        checks.append((numeric.isna(), "not a number"))
+        limit = 10 ** (field.max_digits - field.decimal_places)
+        checks.append(
+            (
+                numeric.abs() >= limit,
+                f"more than {field.max_digits - field.decimal_places} digits "
+                "before the decimal point",
+            )
+        )
+        values = numeric
+    elif internal_type == "DateField":
+        checks.append(
+            (
+                parse_dates(values).isna(),
+                f"date not in format {', '.join(DATE_INPUT_FORMATS)}",
+            )
+        )
+    else:
+        values = values.astype(str)
+
+    if field.choices:
+        allowed = [str(value) for value, _ in field.flatchoices]
+        checks.append((~values.isin(allowed), f"not one of {', '.join(allowed)}"))
+
+    for validator in field.validators:
+        if isinstance(validator, (MinLengthValidator, MaxLengthValidator)):
+            invalid = validator.compare(values.str.len(), validator.limit_value)
+        elif isinstance(validator, BaseValidator):
+            invalid = validator.compare(values, validator.limit_value)
+        elif isinstance(validator, RegexValidator):
+            # `validator.regex` is a lazy object, slow to call per value
+            matches = values.str.contains(
+                validator.regex.pattern, flags=validator.regex.flags
+            )
+            invalid = matches if validator.inverse_match else ~matches
+        else:
+            continue
+        message = validator.message
+        if isinstance(validator, BaseValidator):
+            message = message % {
+                "limit_value": validator.limit_value,
+                "show_value": "",
+            }
+        checks.append((invalid, str(message)))
+
+    errors = []
+    for invalid, reason in checks:
+        invalid = invalid.fillna(False).astype(bool)
+        if invalid.any():
+            errors.append(
+                pd.DataFrame(
+                    {"row": values.index[invalid], "reason": reason},
+                )
+            )
+    if not errors:
+        return pd.DataFrame(columns=["row", "reason"])
+    return pd.concat(errors)
+
+
+def validate_sheet(label: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validate all imported columns of a sheet.
+
+    Args:
+        label: One of INPUT_DATA_LABELS.
+        df: The sheet, as read from the CSV file.
+
+    Returns:
+        pd.DataFrame: The errors with ERROR_COLUMNS, sorted by row. Missing
+        columns are reported with an empty row.
+    """
+    errors: List[pd.DataFrame] = []
+    for column, field in SHEET_FIELDS[label].items():
+        if column not in df.columns:
+            errors.append(
+                pd.DataFrame(
+                    {
+                        "row": [None],
+                        "column": column,
+                        "value": None,
+                        "reason": "missing column",
+                    }
+                )
+            )
+            continue
+        values = df[column]
+        values = values[values.notna() & (values != "")]
+        # sheet columns repeat few distinct values, check each of them once
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype=object)
+        if column in COLUMN_NORMALIZERS:
+            uniques = COLUMN_NORMALIZERS[column](uniques.astype(str))
+        found = column_errors(uniques, field)
+        if not found.empty:
+            found = pd.DataFrame({"row": values.index, "code": codes}).merge(
+                found.rename(columns={"row": "code"}), on="code"
+            )
+            found["column"] = column
+            found["value"] = uniques[found["code"]].to_numpy()
+            errors.append(found.drop(columns="code"))
+
+    if not errors:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    report = pd.concat(errors, ignore_index=True)
+    report["sheet"] = label
+    return report.sort_values("row", kind="stable")[ERROR_COLUMNS]
+
+
+def validate_sheets(data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Validate the input sheets before importing them.
+
+    Args:
+        data: Mapping of INPUT_DATA_LABELS to the loaded DataFrames.
+
+    Returns:
+        pd.DataFrame: The errors of all sheets with ERROR_COLUMNS, empty if
+        the sheets are valid.
+    """
+    reports = [validate_sheet(label, df) for label, df in data.items()]
+    reports = [report for report in reports if not report.empty]
+    if not reports:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    return pd.concat(reports, ignore_index=True)
+
+
+def validate_files(paths: Dict[str, str]) -> pd.DataFrame:
+    """
+    Validate the input sheets read from CSV files.
+
+    Args:
+        paths: Mapping of INPUT_DATA_LABELS to CSV file paths.
+
+    Returns:
+        pd.DataFrame: The errors of all sheets, see `validate_sheets`.
+    """
+    return validate_sheets({label: read_sheet(path) for label, path in paths.items()})
@@ -0,0 +1,11 @@
+"""
+Reading of the sample, experiment and file sheets shared by the importers and
+the sheet validator.
+"""
+
+import pandas as pd
+
+
+def read_sheet(path: str) -> pd.DataFrame:
+    """Read a sheet with every cell as text and missing cells as "" """
+    return pd.read_csv(path, dtype=str, keep_default_na=False)